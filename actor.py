@@ -0,0 +1,96 @@
+import copy
+import time
+from typing import Dict, Any, Awaitable, Callable, Hashable, List, Optional, Sequence, Tuple
+from .locks import UserLockManager
+from .outbox import TokenBucket
+
+
+class UserCommandQueue:
+    """按用户划分的指令队列
+    
+    每名用户的指令在该用户的锁内依次执行（涉及目标用户的指令同时锁定目标），
+    刷屏时单个用户占用的资源通过两种方式限制：
+    每名用户各有一个令牌桶，会修改数据的指令超出频率限制时在用户锁内排队，等到令牌补充后依次执行，不会丢弃；
+    只读指令不修改数据，超出频率限制时直接拒绝，由调用方回复玩家操作过于频繁；
+    只读指令的回复按 (用户ID, 指令, 参数) 缓存 reply_ttl 秒，期间用户数据版本号未变化的重复查询
+    直接返回缓存的回复，不再重新生成。回复中的剩余时间等内容最多因此滞后 reply_ttl 秒。
+    
+    Args:
+        locks: 用户锁管理器
+        rate: 每名用户每秒补充的指令数
+        burst: 每名用户允许连续发送的指令数
+        reply_ttl: 只读指令回复的缓存时间（秒），0 表示不缓存
+    """
+    
+    def __init__(self, locks: UserLockManager, rate: float = 1.0, burst: float = 5, reply_ttl: float = 3.0):
+        self.locks = locks
+        self.rate = rate
+        self.burst = burst
+        self.reply_ttl = reply_ttl
+        self._buckets: Dict[str, TokenBucket] = {}
+        # 缓存键 -> (用户数据版本号, 过期时间, 回复列表)
+        self._replies: Dict[Hashable, Tuple[int, float, List[Any]]] = {}
+        # 令牌桶和回复缓存超过该数量时清理已经用不到的条目
+        self._prune_size = 1024
+    
+    def _bucket(self, user_id: str) -> TokenBucket:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            if len(self._buckets) >= self._prune_size:
+                self._prune()
+            bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst)
+        return bucket
+    
+    def allow(self, user_id: str) -> bool:
+        """用户的指令是否在频率限制以内，是则消耗一次额度"""
+        return self._bucket(user_id).try_acquire()
+    
+    def _prune(self) -> None:
+        """移除已经补满的令牌桶（与新建的令牌桶等价）和已过期的回复缓存"""
+        for user_id, bucket in list(self._buckets.items()):
+            if bucket.is_full():
+                del self._buckets[user_id]
+        now = time.monotonic()
+        for key, (_, expires, _) in list(self._replies.items()):
+            if expires <= now:
+                del self._replies[key]
+        self._prune_size = max(1024, 2 * max(len(self._buckets), len(self._replies)))
+    
+    def cached_reply(self, key: Hashable, version: int) -> Optional[List[Any]]:
+        """获取未过期且用户数据版本号一致的缓存回复，没有时返回None"""
+        entry = self._replies.get(key)
+        if entry is None or entry[0] != version or entry[1] <= time.monotonic():
+            return None
+        # 回复对象在发送过程中可能被修改，每次返回各自的副本
+        return copy.deepcopy(entry[2])
+    
+    def remember_reply(self, key: Hashable, version: int, results: List[Any]) -> None:
+        """缓存只读指令的回复"""
+        if self.reply_ttl <= 0:
+            return
+        if len(self._replies) >= self._prune_size:
+            self._prune()
+        self._replies[key] = (version, time.monotonic() + self.reply_ttl, copy.deepcopy(results))
+    
+    async def run(self, user_ids: Sequence[str], producer: Callable[[], Awaitable[List[Any]]],
+                  read_only: bool = False) -> Optional[List[Any]]:
+        """在用户锁内执行指令并返回其回复列表
+        
+        Args:
+            user_ids: 指令涉及的用户，第一个为发送者，频率限制按发送者计算
+            producer: 执行指令并返回回复列表的协程函数
+            read_only: 是否为只读指令，只有只读指令会因超出频率限制被拒绝
+        
+        Returns:
+            指令的回复列表，只读指令超出频率限制时返回None
+        """
+        if read_only:
+            if not self.allow(user_ids[0]):
+                return None
+            async with self.locks.hold(*user_ids):
+                return await producer()
+        
+        # 在锁内等待令牌，同一用户排队的指令按到达顺序执行
+        async with self.locks.hold(*user_ids):
+            await self._bucket(user_ids[0]).acquire()
+            return await producer()
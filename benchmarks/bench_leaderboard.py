@@ -0,0 +1,71 @@
+# 排行榜查询与更新耗时基准测试
+#
+# 对比旧版 /修仙排行 每次对全部用户按 (level, exp) 完整排序，
+# 与增量维护的 Leaderboard 索引在 10 万名用户时的查询耗时，以及索引的单次更新、
+# 查询个人名次和分页查询的耗时。
+#
+# 在 AstrBot 根目录下运行：
+#   python -m data.plugins.astrbot_plugin_xiuxian.benchmarks.bench_leaderboard
+import time
+import random
+from ..leaderboard import Leaderboard
+from ..user_record import UserRecord
+from .bench_save import make_user
+
+USER_COUNT = 100000
+QUERY_REPEAT = 20
+UPDATE_COUNT = 100000
+
+
+def main():
+    users = {str(10000000 + i): UserRecord.from_dict(make_user(i)) for i in range(USER_COUNT)}
+    user_ids = list(users)
+    
+    start = time.perf_counter()
+    for _ in range(QUERY_REPEAT):
+        sorted_users = sorted(users.items(), key=lambda x: (x[1].level, x[1].exp), reverse=True)[:10]
+    full_sort_ms = (time.perf_counter() - start) * 1000 / QUERY_REPEAT
+    
+    start = time.perf_counter()
+    leaderboard = Leaderboard(lambda user: (-user.level, -user.exp))
+    leaderboard.load(users)
+    build_ms = (time.perf_counter() - start) * 1000
+    
+    start = time.perf_counter()
+    for _ in range(QUERY_REPEAT):
+        top_ids = leaderboard.top(10)
+    top_us = (time.perf_counter() - start) * 1e6 / QUERY_REPEAT
+    assert [users[user_id].exp for user_id in top_ids] == [user.exp for _, user in sorted_users]
+    
+    # 模拟修为变化：随机用户增加修为后同步索引
+    start = time.perf_counter()
+    for _ in range(UPDATE_COUNT):
+        user_id = random.choice(user_ids)
+        users[user_id].exp += random.randint(1, 500)
+        leaderboard.update(user_id, users[user_id])
+    update_us = (time.perf_counter() - start) * 1e6 / UPDATE_COUNT
+    
+    # 查询个人名次与随机页
+    sample_ids = random.sample(user_ids, 10000)
+    start = time.perf_counter()
+    for user_id in sample_ids:
+        leaderboard.rank(user_id)
+    rank_us = (time.perf_counter() - start) * 1e6 / len(sample_ids)
+    
+    start = time.perf_counter()
+    for _ in range(10000):
+        page_start = random.randrange(USER_COUNT // 10) * 10
+        leaderboard.range(page_start, page_start + 10)
+    page_us = (time.perf_counter() - start) * 1e6 / 10000
+    
+    print(f"{USER_COUNT} 名用户")
+    print(f"{'完整排序取前10':>16} | {full_sort_ms:>10.1f} ms/次")
+    print(f"{'索引建立（一次性）':>16} | {build_ms:>10.1f} ms")
+    print(f"{'索引取前10':>16} | {top_us:>10.1f} µs/次")
+    print(f"{'索引单次更新':>16} | {update_us:>10.1f} µs/次")
+    print(f"{'查询个人名次':>16} | {rank_us:>10.1f} µs/次")
+    print(f"{'查询随机一页':>16} | {page_us:>10.1f} µs/次")
+
+
+if __name__ == "__main__":
+    main()
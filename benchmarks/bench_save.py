@@ -0,0 +1,106 @@
+# 用户数据保存耗时基准测试
+#
+# 对比旧版保存方式（直接以 "w" 模式打开 user_data.json 并带缩进写入）
+# 与当前 JsonFileStorage（紧凑格式 + 临时文件 fsync + os.replace）在不同用户规模下的保存耗时和文件大小，
+# 以及 10 万名用户中只有 200 名用户变更时各快照格式一次增量保存的耗时（只重新编码变更用户所在的块）。
+#
+# 在 AstrBot 根目录下运行：
+#   python -m data.plugins.astrbot_plugin_xiuxian.benchmarks.bench_save
+import os
+import json
+import time
+import random
+import tempfile
+from ..storage import JsonFileStorage, msgpack
+
+USER_COUNTS = [1000, 10000, 100000]
+REPEAT = 3
+INCREMENTAL_USERS = 100000
+INCREMENTAL_DIRTY = 200
+FORMATS = ["json", "marshal", "pickle"] + (["msgpack"] if msgpack is not None else [])
+
+
+def make_user(index: int) -> dict:
+    """生成一名典型的已开始修仙的用户数据"""
+    return {
+        "level": random.randint(1, 56),
+        "exp": random.randint(0, 100000),
+        "max_exp": 1000,
+        "realm": "江湖好手",
+        "last_practice_time": 0,
+        "spirit_stones": random.randint(0, 1000000),
+        "items": random.sample(["灵草", "灵芝", "仙参", "龙血草", "九转还魂草"], 2),
+        "techniques": ["吐纳术"],
+        "username": f"修士{index}",
+        "equipment": {"weapon": "w1", "armor": None, "accessory": None},
+        "stats": {"attack": 15, "defense": 10, "hp": 100, "max_hp": 100},
+        "last_adventure_time": 0,
+        "last_mine_time": 0,
+        "last_daily_time": int(time.time()),
+        "status": None,
+        "status_end_time": 0,
+        "status_start_time": 0,
+        "status_duration": 0,
+        "status_reward_multiplier": 0,
+        "last_steal_time": 0,
+        "last_duel_time": 0,
+        "last_breakthrough_time": 0,
+        "breakthrough_bonus": 0,
+        "inventory": {"pills": {"渡厄丹": 1}},
+        "has_started": True,
+        "daily_streak": random.randint(0, 30),
+        "group_id": "123456",
+        "unified_msg_origin": "aiocqhttp:GroupMessage:123456"
+    }
+
+
+def legacy_save(file_path: str, users: dict) -> None:
+    """旧版保存方式：直接覆盖写入并带缩进"""
+    with open(file_path, "w", encoding="utf-8") as f:
+        json.dump(users, f, ensure_ascii=False, indent=4)
+
+
+def measure(func) -> float:
+    """多次执行取最短耗时（毫秒）"""
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        legacy_file = os.path.join(tmp_dir, "legacy.json")
+        storage = JsonFileStorage(os.path.join(tmp_dir, "user_data.json"))
+        
+        print(f"{'用户数':>8} | {'旧版耗时(ms)':>12} | {'旧版大小(KB)':>12} | {'新版耗时(ms)':>12} | {'新版大小(KB)':>12}")
+        for count in USER_COUNTS:
+            users = {str(10000000 + i): make_user(i) for i in range(count)}
+            
+            legacy_ms = measure(lambda: legacy_save(legacy_file, users))
+            current_ms = measure(lambda: storage.save(users, users.keys()))
+            
+            legacy_kb = os.path.getsize(legacy_file) / 1024
+            current_kb = os.path.getsize(storage.file_path) / 1024
+            print(f"{count:>8} | {legacy_ms:>12.1f} | {legacy_kb:>12.0f} | {current_ms:>12.1f} | {current_kb:>12.0f}")
+        
+        print(f"\n{INCREMENTAL_USERS} 名用户中 {INCREMENTAL_DIRTY} 名变更时的增量保存")
+        print(f"{'格式':>8} | {'全量保存(ms)':>12} | {'增量保存(ms)':>12}")
+        users = {str(10000000 + i): make_user(i) for i in range(INCREMENTAL_USERS)}
+        for snapshot_format in FORMATS:
+            storage = JsonFileStorage(os.path.join(tmp_dir, f"user_data.{snapshot_format}"), snapshot_format)
+            full_ms = measure(lambda: storage.save(users, users.keys()))
+            dirty_ids = random.sample(list(users), INCREMENTAL_DIRTY)
+            
+            def incremental_save():
+                for user_id in dirty_ids:
+                    users[user_id]["exp"] += 1
+                storage.save(users, dirty_ids)
+            
+            print(f"{snapshot_format:>8} | {full_ms:>12.1f} | {measure(incremental_save):>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# 状态到期调度基准测试
+#
+# 对比两种方式在 5 万个待结算状态时的开销：
+#   - 每个状态一个 asyncio 任务（sleep 到到期时间）
+#   - StatusScheduler：单个后台任务 + 最小堆
+# 分别测量全部状态挂起时的常驻内存、创建耗时，
+# 以及状态在 1 秒内陆续到期时触发全部回调所消耗的 CPU 时间与最大延迟。
+#
+# 在 AstrBot 根目录下运行：
+#   python -m data.plugins.astrbot_plugin_xiuxian.benchmarks.bench_scheduler
+import asyncio
+import gc
+import time
+import tracemalloc
+from ..scheduler import StatusScheduler
+
+PENDING_COUNT = 50000
+# 唤醒测试中全部状态在该时间窗口内均匀到期（秒）
+WAKEUP_WINDOW = 1.0
+
+
+async def per_task_pending(handler, due_times):
+    """每个状态创建一个任务，返回任务字典"""
+    async def wait_and_fire(user_id, due_time):
+        await asyncio.sleep(max(0, due_time - time.time()))
+        await handler(user_id, due_time)
+    
+    return {
+        user_id: asyncio.create_task(wait_and_fire(user_id, due_time))
+        for user_id, due_time in due_times.items()
+    }
+
+
+async def scheduler_pending(handler, due_times):
+    """全部状态交给同一个调度器"""
+    scheduler = StatusScheduler(handler)
+    scheduler.start()
+    for user_id, due_time in due_times.items():
+        scheduler.schedule(user_id, due_time, due_time)
+    return scheduler
+
+
+async def cancel_all(pending):
+    if isinstance(pending, StatusScheduler):
+        await pending.close()
+        return
+    for task in pending.values():
+        task.cancel()
+    await asyncio.gather(*pending.values(), return_exceptions=True)
+
+
+async def measure_pending(build):
+    """全部状态挂起时的内存（MB）与创建耗时（ms）"""
+    async def noop(user_id, payload):
+        pass
+    
+    now = time.time()
+    due_times = {str(10000000 + i): now + 3600 + i for i in range(PENDING_COUNT)}
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    pending = await build(noop, due_times)
+    elapsed = time.perf_counter() - start
+    # 让任务运行到第一次 sleep，计入其协程帧与定时器句柄
+    await asyncio.sleep(0)
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    await cancel_all(pending)
+    return current / 1024 / 1024, elapsed * 1000
+
+
+async def measure_wakeup(build):
+    """状态陆续到期时触发全部回调的 CPU 时间（ms）与最大延迟（ms）"""
+    done = asyncio.Event()
+    lateness = []
+    
+    async def handler(user_id, due_time):
+        lateness.append(time.time() - due_time)
+        if len(lateness) == PENDING_COUNT:
+            done.set()
+    
+    now = time.time() + 0.5
+    due_times = {
+        str(10000000 + i): now + WAKEUP_WINDOW * i / PENDING_COUNT
+        for i in range(PENDING_COUNT)
+    }
+    pending = await build(handler, due_times)
+    cpu_start = time.process_time()
+    await done.wait()
+    cpu = time.process_time() - cpu_start
+    await cancel_all(pending)
+    return cpu * 1000, max(lateness) * 1000
+
+
+async def main():
+    print(f"{PENDING_COUNT} 个待结算状态")
+    print(f"{'方式':>10} | {'内存':>9} | {'创建':>9} | {'触发CPU':>9} | {'最大延迟':>9}")
+    for name, build in (("每状态任务", per_task_pending), ("堆调度器", scheduler_pending)):
+        memory_mb, create_ms = await measure_pending(build)
+        cpu_ms, late_ms = await measure_wakeup(build)
+        print(f"{name:>10} | {memory_mb:>6.1f} MB | {create_ms:>6.1f} ms | {cpu_ms:>6.1f} ms | {late_ms:>6.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,51 @@
+# 快照加载耗时基准测试
+#
+# 对比旧版带缩进的 user_data.json 与各快照格式（紧凑JSON、marshal、pickle、msgpack）
+# 在冷启动时的加载耗时和文件大小。
+#
+# 在 AstrBot 根目录下运行：
+#   python -m data.plugins.astrbot_plugin_xiuxian.benchmarks.bench_snapshot_load
+import os
+import json
+import time
+import tempfile
+from ..storage import JsonFileStorage, msgpack
+from .bench_save import make_user, legacy_save
+
+USER_COUNT = 100000
+FORMATS = ["json", "marshal", "pickle"] + (["msgpack"] if msgpack is not None else [])
+
+
+def measure_load(file_path: str, load) -> float:
+    """加载一次快照的耗时（毫秒）"""
+    start = time.perf_counter()
+    load(file_path)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    users = {str(10000000 + i): make_user(i) for i in range(USER_COUNT)}
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(f"{USER_COUNT} 名用户")
+        print(f"{'格式':>12} | {'加载耗时(ms)':>12} | {'文件大小(KB)':>12}")
+        
+        legacy_file = os.path.join(tmp_dir, "legacy.json")
+        legacy_save(legacy_file, users)
+        
+        def legacy_load(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        
+        legacy_ms = measure_load(legacy_file, legacy_load)
+        print(f"{'旧版json':>12} | {legacy_ms:>12.1f} | {os.path.getsize(legacy_file) / 1024:>12.0f}")
+        
+        for snapshot_format in FORMATS:
+            file_path = os.path.join(tmp_dir, f"user_data.{snapshot_format}")
+            JsonFileStorage(file_path, snapshot_format).save(users, users.keys())
+            load_ms = measure_load(file_path, lambda path: JsonFileStorage(path, snapshot_format).load_all())
+            print(f"{snapshot_format:>12} | {load_ms:>12.1f} | {os.path.getsize(file_path) / 1024:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
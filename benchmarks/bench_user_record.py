@@ -0,0 +1,86 @@
+# 用户记录内存占用与字段访问耗时基准测试
+#
+# 对比普通字典与 UserRecord（__slots__）在 10 万名用户时的常驻内存，
+# 从快照字典转换为记录的耗时，以及按下标（字典兼容接口）和按属性读写常用字段的耗时。
+#
+# 在 AstrBot 根目录下运行：
+#   python -m data.plugins.astrbot_plugin_xiuxian.benchmarks.bench_user_record
+import gc
+import json
+import time
+import tracemalloc
+from ..user_record import UserRecord
+from .bench_save import make_user
+
+USER_COUNT = 100000
+ACCESS_ROUNDS = 10
+
+
+def measure_memory(build) -> float:
+    """构建全部用户数据后的常驻内存（MB）"""
+    gc.collect()
+    tracemalloc.start()
+    data = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del data
+    return current / 1024 / 1024
+
+
+def measure_access(users, access) -> float:
+    """对全部用户执行多轮字段访问，返回每次访问的平均耗时（纳秒）"""
+    start = time.perf_counter()
+    for _ in range(ACCESS_ROUNDS):
+        for user in users:
+            access(user)
+    return (time.perf_counter() - start) / (ACCESS_ROUNDS * len(users)) * 1e9
+
+
+def main():
+    # 与实际加载路径一致：一次性解析整个快照
+    snapshot = json.dumps({str(10000000 + i): make_user(i) for i in range(USER_COUNT)}, ensure_ascii=False)
+    
+    dict_mb = measure_memory(lambda: json.loads(snapshot))
+    record_mb = measure_memory(
+        lambda: {user_id: UserRecord.from_dict(user) for user_id, user in json.loads(snapshot).items()}
+    )
+    print(f"{USER_COUNT} 名用户常驻内存")
+    print(f"{'dict':>12} | {dict_mb:>8.1f} MB | {dict_mb * 1024 * 1024 / USER_COUNT:>6.0f} B/用户")
+    print(f"{'UserRecord':>12} | {record_mb:>8.1f} MB | {record_mb * 1024 * 1024 / USER_COUNT:>6.0f} B/用户")
+    
+    dicts = list(json.loads(snapshot).values())
+    start = time.perf_counter()
+    records = [UserRecord.from_dict(user) for user in dicts]
+    convert_ms = (time.perf_counter() - start) * 1000
+    print(f"\n转换为 UserRecord: {convert_ms:.0f} ms")
+    
+    def read_dict(user):
+        return user["level"] + user["exp"] + user["stats"]["attack"]
+    
+    def read_record_item(user):
+        return user["level"] + user["exp"] + user["stats"]["attack"]
+    
+    def read_record_attr(user):
+        return user.level + user.exp + user.stats.attack
+    
+    def write_dict(user):
+        user["exp"] += 1
+    
+    def write_record_item(user):
+        user["exp"] += 1
+    
+    def write_record_attr(user):
+        user.exp += 1
+    
+    print("\n字段访问耗时（ns/次）")
+    print(f"{'dict 下标读取':>16} | {measure_access(dicts, read_dict):>8.1f}")
+    print(f"{'记录 下标读取':>16} | {measure_access(records, read_record_item):>8.1f}")
+    print(f"{'记录 属性读取':>16} | {measure_access(records, read_record_attr):>8.1f}")
+    print(f"{'dict 下标写入':>16} | {measure_access(dicts, write_dict):>8.1f}")
+    print(f"{'记录 下标写入':>16} | {measure_access(records, write_record_item):>8.1f}")
+    print(f"{'记录 属性写入':>16} | {measure_access(records, write_record_attr):>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
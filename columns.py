@@ -0,0 +1,132 @@
+from array import array
+from typing import Dict, Any, List, Optional, Iterable
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 最近活跃时间取以下时间戳字段中的最大值
+LAST_ACTIVE_FIELDS = (
+    "last_practice_time", "last_adventure_time", "last_mine_time", "last_daily_time",
+    "last_steal_time", "last_duel_time", "last_breakthrough_time", "status_start_time",
+)
+
+# 列式存储的数值字段：列名 -> 从用户记录中取值的方法
+COLUMNS = {
+    "level": lambda user, realm_index: user.level,
+    "exp": lambda user, realm_index: user.exp,
+    "spirit_stones": lambda user, realm_index: user.spirit_stones,
+    "attack": lambda user, realm_index: user.stats.attack,
+    "defense": lambda user, realm_index: user.stats.defense,
+    "daily_streak": lambda user, realm_index: user.daily_streak,
+    "last_active": lambda user, realm_index: max(getattr(user, field) or 0 for field in LAST_ACTIVE_FIELDS),
+    "realm_index": lambda user, realm_index: realm_index.get(user.realm, -1),
+}
+
+
+class UserColumns:
+    """热点数值字段的列式副本
+    
+    每名用户占用一个稠密槽位，各数值字段分别存放在连续的 array('q') 中，
+    世界统计等批量查询按列计算，无需逐个遍历用户字典。
+    安装了 NumPy 时查询直接在数组缓冲区上向量化执行，否则回退到纯 Python 实现。
+    只统计已开始修仙的用户；数据通过 XiuXianData 的变更接口保持同步。
+    """
+    
+    def __init__(self, realms_config: List[Dict[str, Any]]):
+        self.realm_index = {realm["name"]: i for i, realm in enumerate(realms_config)}
+        self.columns: Dict[str, array] = {name: array("q") for name in COLUMNS}
+        # started 为 1 表示槽位对应一名已开始修仙的用户，空闲槽位为 0
+        self.started = array("b")
+        self.slots: Dict[str, int] = {}
+        self.slot_users: List[Optional[str]] = []
+        self._free_slots: List[int] = []
+    
+    def __len__(self) -> int:
+        return len(self.slots)
+    
+    def update(self, user_id: str, user: Optional[Any]) -> None:
+        """同步单个用户的数值字段，用户不存在或尚未开始修仙时释放其槽位"""
+        if user is None or not user.has_started:
+            self.remove(user_id)
+            return
+        
+        slot = self.slots.get(user_id)
+        if slot is None:
+            slot = self._allocate(user_id)
+        for name, getter in COLUMNS.items():
+            self.columns[name][slot] = int(getter(user, self.realm_index))
+    
+    def remove(self, user_id: str) -> None:
+        """释放用户的槽位"""
+        slot = self.slots.pop(user_id, None)
+        if slot is None:
+            return
+        self.started[slot] = 0
+        self.slot_users[slot] = None
+        self._free_slots.append(slot)
+    
+    def _allocate(self, user_id: str) -> int:
+        """为用户分配槽位，优先复用空闲槽位"""
+        if self._free_slots:
+            slot = self._free_slots.pop()
+            self.started[slot] = 1
+            self.slot_users[slot] = user_id
+        else:
+            slot = len(self.slot_users)
+            for column in self.columns.values():
+                column.append(0)
+            self.started.append(1)
+            self.slot_users.append(user_id)
+        self.slots[user_id] = slot
+        return slot
+    
+    # ---- 批量查询 ----
+    
+    def _view(self, name: str):
+        """列的 NumPy 只读视图（零拷贝），未安装 NumPy 时返回 None"""
+        if np is None:
+            return None
+        return np.frombuffer(self.columns[name], dtype=np.int64)
+    
+    def _active_mask(self):
+        return np.frombuffer(self.started, dtype=np.int8).astype(bool)
+    
+    def _active_values(self, name: str) -> Iterable[int]:
+        started = self.started
+        return (value for slot, value in enumerate(self.columns[name]) if started[slot])
+    
+    def total(self, name: str) -> int:
+        """列的总和"""
+        if np is None:
+            return sum(self._active_values(name))
+        return int(self._view(name)[self._active_mask()].sum())
+    
+    def percentile(self, name: str, q: float) -> float:
+        """列的百分位数（线性插值，q 取 0~100）"""
+        if not self.slots:
+            return 0.0
+        if np is not None:
+            return float(np.percentile(self._view(name)[self._active_mask()], q))
+        
+        values = sorted(self._active_values(name))
+        position = (len(values) - 1) * q / 100
+        lower = int(position)
+        upper = min(lower + 1, len(values) - 1)
+        return values[lower] + (values[upper] - values[lower]) * (position - lower)
+    
+    def count_at_least_realm(self, realm_name: str) -> int:
+        """达到指定境界（含）以上的用户数"""
+        index = self.realm_index.get(realm_name)
+        if index is None:
+            return 0
+        if np is None:
+            return sum(1 for value in self._active_values("realm_index") if value >= index)
+        return int(np.count_nonzero(self._view("realm_index")[self._active_mask()] >= index))
+    
+    def count_active_since(self, timestamp: int) -> int:
+        """指定时间之后有过活动的用户数"""
+        if np is None:
+            return sum(1 for value in self._active_values("last_active") if value >= timestamp)
+        return int(np.count_nonzero(self._view("last_active")[self._active_mask()] >= timestamp))
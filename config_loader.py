@@ -24,6 +24,7 @@ class ConfigLoader:
         self.adventure_events_file = os.path.join(config_dir, "adventure_events.json")
         self.mining_events_file = os.path.join(config_dir, "mining_events.json")
         self.user_template_file = os.path.join(config_dir, "user_template.json")
+        self.system_config_file = os.path.join(config_dir, "system.json")
         
         # 加载所有配置
         self.realms = self._load_realms_config()
@@ -35,6 +36,7 @@ class ConfigLoader:
         self.adventure_events = self._load_adventure_events()
         self.mining_events = self._load_mining_events()
         self.user_template = self._load_user_template()
+        self.system = self._load_system_config()
     
     def _load_json_file(self, file_path: str, default_value: Any = None) -> Any:
         """通用JSON文件加载方法
@@ -274,6 +276,37 @@ class ConfigLoader:
         }
         return self._load_json_file(self.user_template_file, default_template)
     
+    def _load_system_config(self) -> Dict[str, Any]:
+        """加载系统运行配置（数据持久化等）"""
+        default_system = {
+            "persistence": {
+                "backend": "json",
+                "snapshot_format": "json",
+                "write_behind": True,
+                "flush_interval_seconds": 5,
+                "flush_dirty_threshold": 200,
+                "journal_compact_records": 10000,
+                "shard_hex_digits": 2
+            },
+            "status": {
+                "rehydrate_batch_size": 100,
+                "notify_window_seconds": 2,
+                "notify_rate_per_second": 0.5,
+                "notify_burst": 3,
+                "notify_max_batch": 20,
+                "notify_max_retries": 5,
+                "notify_retry_base_seconds": 2,
+                "lazy_settlement": False,
+                "lazy_sweep_interval_seconds": 600
+            },
+            "commands": {
+                "rate_per_second": 1,
+                "burst": 5,
+                "reply_cache_seconds": 3
+            }
+        }
+        return self._load_json_file(self.system_config_file, default_system)
+    
     def get_realm_by_level(self, level: int) -> str:
         """根据等级获取对应的境界
         
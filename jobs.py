@@ -0,0 +1,124 @@
+import json
+import os
+from typing import Dict, Callable, List, Optional, Set, Tuple
+from astrbot.api import logger
+from .storage import atomic_write
+
+
+class StatusJobQueue:
+    """状态结算任务的持久化队列
+    
+    探索、寻宝等定时状态开始时以状态的结算ID（status_id）为键入队一条任务，
+    记录用户ID与到期时间；状态结算或被替换后确认出队。队列单独保存为一个小文件，
+    启动时直接读取即可恢复所有待结算的状态，无需遍历全部用户。
+    
+    写入顺序保证崩溃后不丢任务：新入队的任务在用户数据之前写入磁盘，
+    确认出队则在用户数据之后写入，用户数据写入失败时推迟到重新写入成功之后，
+    磁盘上的队列总是包含磁盘数据中所有尚未结算的状态；
+    多出来的已结算任务在处理时按结算ID识别（与用户当前的 status_id 不一致）并直接确认，
+    因此同一个状态的奖励只会发放一次。
+    """
+    
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        # 结算ID -> (用户ID, 到期时间)
+        self.jobs: Dict[str, Tuple[str, int]] = {}
+        # 上次写入后确认出队的任务，对应的用户数据写入磁盘前仍需保留在队列文件中
+        self._acked: Dict[str, Tuple[str, int]] = {}
+        # 正在结算的任务
+        self._claimed: Set[str] = set()
+        # 用户数据写入失败时没能移出队列文件的已确认任务，只在写入线程中访问
+        self._unremoved: Dict[str, Tuple[str, int]] = {}
+        # 队列文件是否已存在，不存在时需要从用户数据中重建一次，并在下次写入时创建文件
+        self.exists = self._load()
+        self._added = not self.exists
+    
+    def __len__(self) -> int:
+        return len(self.jobs)
+    
+    def __contains__(self, status_id: str) -> bool:
+        return status_id in self.jobs
+    
+    def _load(self) -> bool:
+        if not os.path.exists(self.file_path):
+            return False
+        try:
+            with open(self.file_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.jobs = {status_id: (user_id, due_time) for status_id, (user_id, due_time) in data["jobs"].items()}
+            logger.info(f"已加载 {len(self.jobs)} 个待结算的状态任务")
+            return True
+        except Exception as e:
+            logger.error(f"加载状态结算队列 {self.file_path} 失败，将从用户数据重建: {e}")
+            self.jobs = {}
+            return False
+    
+    @property
+    def dirty(self) -> bool:
+        """是否有尚未写入磁盘的入队或出队"""
+        return self._added or bool(self._acked)
+    
+    def enqueue(self, status_id: str, user_id: str, due_time: int) -> None:
+        """加入一条结算任务"""
+        self.jobs[status_id] = (user_id, due_time)
+        self._acked.pop(status_id, None)
+        self._added = True
+    
+    def ack(self, status_id: str) -> None:
+        """确认任务已结算（或状态已被替换），任务不存在时忽略"""
+        job = self.jobs.pop(status_id, None)
+        self._claimed.discard(status_id)
+        if job is not None:
+            self._acked[status_id] = job
+    
+    def claim(self, status_id: str) -> Optional[Tuple[str, int]]:
+        """认领任务准备结算，任务不存在或已被认领时返回None"""
+        job = self.jobs.get(status_id)
+        if job is None or status_id in self._claimed:
+            return None
+        self._claimed.add(status_id)
+        return job
+    
+    def release(self, status_id: str) -> None:
+        """放弃认领（结算未完成时任务留在队列中）"""
+        self._claimed.discard(status_id)
+    
+    def due(self, now: float) -> List[str]:
+        """已到期的任务的结算ID，按到期时间排序"""
+        return sorted((status_id for status_id, job in self.jobs.items() if job[1] <= now),
+                      key=lambda status_id: self.jobs[status_id][1])
+    
+    def _write_queue(self, jobs: Dict[str, Tuple[str, int]]) -> None:
+        data = json.dumps({"jobs": {**self._unremoved, **jobs}}, ensure_ascii=False, separators=(",", ":"))
+        atomic_write(self.file_path, data.encode("utf-8"))
+    
+    def _write_job(self, jobs: Dict[str, Tuple[str, int]]) -> Callable[[], None]:
+        return lambda: self._write_queue(jobs)
+    
+    def prepare_before_data(self) -> Optional[Callable[[], None]]:
+        """在用户数据之前写入的队列快照：包含新入队的任务，也保留尚未随数据落盘的已确认任务"""
+        if not self._added:
+            return None
+        self._added = False
+        return self._write_job({**self._acked, **self.jobs})
+    
+    def prepare_after_data(self, data_saved: Optional[Callable[[], bool]] = None) -> Optional[Callable[[], None]]:
+        """在用户数据之后写入的队列快照：移除已确认的任务
+        
+        Args:
+            data_saved: 在写入线程中调用，返回之前提交的用户数据是否都已写入成功；
+                写入失败时已确认的任务继续保留在队列文件中，直到用户数据重新写入成功
+        """
+        if not self._acked:
+            return None
+        acked, self._acked = self._acked, {}
+        jobs = dict(self.jobs)
+        
+        def write():
+            if data_saved is not None and not data_saved():
+                # 磁盘上的用户仍处于这些状态，移除任务后重启时将不会再结算
+                self._unremoved.update(acked)
+                return
+            self._unremoved.clear()
+            self._write_queue(jobs)
+        return write
@@ -0,0 +1,276 @@
+from bisect import bisect_left, insort
+from itertools import chain, islice
+from typing import Dict, Any, Callable, Iterator, List, Optional, Tuple
+
+
+class SortedList:
+    """分桶有序列表
+    
+    元素按顺序分散在若干长度约为 load 的子列表中，并维护每个子列表的最大值，
+    定位子列表与子列表内定位都通过二分查找完成。插入和删除只移动单个子列表内的元素，
+    避免在一个长度为 n 的大列表上做整体搬移。
+    子列表长度另外记录在树状数组（Fenwick 树）中，按位置访问和求元素位置都是 O(log n)。
+    """
+    
+    # 子列表的目标长度，超过两倍时拆分
+    load = 1000
+    
+    def __init__(self, values: Optional[List[Any]] = None):
+        self._lists: List[List[Any]] = []
+        self._maxes: List[Any] = []
+        self._len = 0
+        # 子列表长度的树状数组（下标从1开始），子列表拆分或删除后置为 None 并在下次使用时重建
+        self._tree: Optional[List[int]] = None
+        if values:
+            values = sorted(values)
+            self._lists = [values[i:i + self.load] for i in range(0, len(values), self.load)]
+            self._maxes = [sub[-1] for sub in self._lists]
+            self._len = len(values)
+    
+    def __len__(self) -> int:
+        return self._len
+    
+    def __iter__(self) -> Iterator[Any]:
+        return chain.from_iterable(self._lists)
+    
+    def add(self, value: Any) -> None:
+        """插入元素"""
+        if not self._maxes:
+            self._lists.append([value])
+            self._maxes.append(value)
+        else:
+            pos = bisect_left(self._maxes, value)
+            if pos == len(self._maxes):
+                # 比所有元素都大，追加到最后一个子列表
+                pos -= 1
+                self._lists[pos].append(value)
+                self._maxes[pos] = value
+            else:
+                insort(self._lists[pos], value)
+            self._tree_add(pos, 1)
+            self._split(pos)
+        self._len += 1
+    
+    def remove(self, value: Any) -> None:
+        """删除元素，元素不存在时抛出 ValueError"""
+        pos = bisect_left(self._maxes, value)
+        if pos == len(self._maxes):
+            raise ValueError(f"{value!r} 不在列表中")
+        sub = self._lists[pos]
+        index = bisect_left(sub, value)
+        if index == len(sub) or sub[index] != value:
+            raise ValueError(f"{value!r} 不在列表中")
+        del sub[index]
+        self._len -= 1
+        if not sub:
+            del self._lists[pos]
+            del self._maxes[pos]
+            self._tree = None
+        else:
+            self._tree_add(pos, -1)
+        if sub and index == len(sub):
+            self._maxes[pos] = sub[-1]
+    
+    def _split(self, pos: int) -> None:
+        """子列表过长时一分为二"""
+        sub = self._lists[pos]
+        if len(sub) > self.load * 2:
+            half = sub[self.load:]
+            del sub[self.load:]
+            self._maxes[pos] = sub[-1]
+            self._lists.insert(pos + 1, half)
+            self._maxes.insert(pos + 1, half[-1])
+            self._tree = None
+    
+    def _build_tree(self) -> List[int]:
+        """根据子列表长度重建树状数组"""
+        tree = [0] + [len(sub) for sub in self._lists]
+        size = len(tree)
+        for i in range(1, size):
+            parent = i + (i & -i)
+            if parent < size:
+                tree[parent] += tree[i]
+        self._tree = tree
+        return tree
+    
+    def _tree_add(self, pos: int, delta: int) -> None:
+        """第 pos 个子列表的长度变化 delta"""
+        tree = self._tree
+        if tree is None:
+            return
+        i = pos + 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+    
+    def _prefix(self, pos: int) -> int:
+        """前 pos 个子列表的元素总数"""
+        tree = self._tree if self._tree is not None else self._build_tree()
+        total = 0
+        i = pos
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+    
+    def _locate(self, index: int) -> Tuple[int, int]:
+        """将全局位置转换为 (子列表序号, 子列表内位置)"""
+        tree = self._tree if self._tree is not None else self._build_tree()
+        pos = 0
+        step = 1 << (len(tree).bit_length() - 1)
+        while step:
+            nxt = pos + step
+            if nxt < len(tree) and tree[nxt] <= index:
+                pos = nxt
+                index -= tree[nxt]
+            step >>= 1
+        return pos, index
+    
+    def index(self, value: Any) -> int:
+        """元素的位置（从0开始），元素不存在时抛出 ValueError"""
+        pos = bisect_left(self._maxes, value)
+        if pos < len(self._maxes):
+            sub = self._lists[pos]
+            index = bisect_left(sub, value)
+            if index < len(sub) and sub[index] == value:
+                return self._prefix(pos) + index
+        raise ValueError(f"{value!r} 不在列表中")
+    
+    def __getitem__(self, index: int) -> Any:
+        """按位置访问元素（支持负数下标）"""
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("下标超出范围")
+        pos, offset = self._locate(index)
+        return self._lists[pos][offset]
+    
+    def islice(self, start: int, stop: int) -> List[Any]:
+        """按位置截取 [start, stop) 区间的元素"""
+        start = max(start, 0)
+        stop = min(stop, self._len)
+        if start >= stop:
+            return []
+        pos, offset = self._locate(start)
+        result = []
+        remaining = stop - start
+        while remaining > 0:
+            chunk = self._lists[pos][offset:offset + remaining]
+            result.extend(chunk)
+            remaining -= len(chunk)
+            pos += 1
+            offset = 0
+        return result
+
+
+class Leaderboard:
+    """增量维护的排行榜索引
+    
+    每名上榜用户对应一个排序键 key_fn(user) + (user_id,)，键越小排名越靠前，
+    降序指标在 key_fn 中取负值。用户数据变更时只需删除旧键、插入新键，
+    查询前 N 名只需读取有序列表的开头。只有已开始修仙的用户会被索引。
+    """
+    
+    def __init__(self, key_fn: Callable[[Any], Tuple]):
+        self.key_fn = key_fn
+        self._sorted = SortedList()
+        self._keys: Dict[str, Tuple] = {}
+    
+    def __len__(self) -> int:
+        return len(self._keys)
+    
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._keys
+    
+    def load(self, users: Dict[str, Any]) -> None:
+        """根据全部用户数据批量建立索引"""
+        self._keys = {
+            user_id: self.key_fn(user) + (user_id,)
+            for user_id, user in users.items()
+            if user.has_started
+        }
+        self._sorted = SortedList(list(self._keys.values()))
+    
+    def update(self, user_id: str, user: Optional[Any]) -> bool:
+        """同步单个用户的排名，用户不存在或尚未开始修仙时移出榜单
+        
+        Returns:
+            排序键是否发生变化
+        """
+        old_key = self._keys.get(user_id)
+        new_key = self.key_fn(user) + (user_id,) if user is not None and user.has_started else None
+        if old_key == new_key:
+            return False
+        if old_key is not None:
+            self._sorted.remove(old_key)
+            del self._keys[user_id]
+        if new_key is not None:
+            self._sorted.add(new_key)
+            self._keys[user_id] = new_key
+        return True
+    
+    def remove(self, user_id: str) -> None:
+        """将用户移出榜单"""
+        self.update(user_id, None)
+    
+    def top(self, n: int) -> List[str]:
+        """排名前 n 的用户ID"""
+        return [key[-1] for key in islice(self._sorted, n)]
+    
+    def rank(self, user_id: str) -> Optional[int]:
+        """用户的名次（从1开始），用户不在榜单中时返回None"""
+        key = self._keys.get(user_id)
+        if key is None:
+            return None
+        return self._sorted.index(key) + 1
+    
+    def range(self, start: int, stop: int) -> List[str]:
+        """名次在 [start, stop) 区间（从0开始）的用户ID"""
+        return [key[-1] for key in self._sorted.islice(start, stop)]
+
+
+class GroupedLeaderboard:
+    """按分组（如QQ群）划分的排行榜索引
+    
+    每个分组维护一个独立的 Leaderboard，分组查询只读取该分组自己的索引；
+    用户的分组发生变化时会从旧分组移到新分组。
+    """
+    
+    def __init__(self, key_fn: Callable[[Any], Tuple], group_fn: Callable[[Any], Optional[str]]):
+        self.key_fn = key_fn
+        self.group_fn = group_fn
+        self._boards: Dict[str, Leaderboard] = {}
+        self._user_groups: Dict[str, str] = {}
+    
+    def update(self, user_id: str, user: Optional[Any]) -> bool:
+        """同步单个用户在所属分组中的排名
+        
+        Returns:
+            用户所在分组的榜单是否发生变化
+        """
+        old_group = self._user_groups.get(user_id)
+        new_group = self.group_fn(user) if user is not None and user.has_started else None
+        changed = False
+        if old_group is not None and old_group != new_group:
+            board = self._boards[old_group]
+            board.remove(user_id)
+            if not len(board):
+                del self._boards[old_group]
+            del self._user_groups[user_id]
+            changed = True
+        if new_group:
+            board = self._boards.get(new_group)
+            if board is None:
+                board = self._boards[new_group] = Leaderboard(self.key_fn)
+            changed = board.update(user_id, user) or changed
+            self._user_groups[user_id] = new_group
+        return changed
+    
+    def board(self, group: str) -> Optional[Leaderboard]:
+        """获取分组的榜单，分组没有上榜用户时返回None"""
+        return self._boards.get(group)
+    
+    def top(self, group: str, n: int) -> List[str]:
+        """分组内排名前 n 的用户ID"""
+        board = self._boards.get(group)
+        return board.top(n) if board is not None else []
@@ -0,0 +1,59 @@
+import asyncio
+import weakref
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+
+class UserLockManager:
+    """按用户划分的异步锁
+    
+    每名用户对应一个 asyncio.Lock：同一用户的操作依次执行，不同用户的操作互不阻塞。
+    锁对象保存在弱引用字典中，正在被持有或等待的锁由使用者保持引用，不会被回收；
+    另外用一个有容量上限的 LRU 保留最近使用过的锁，避免活跃用户反复创建锁对象。
+    锁的数量因此不会随用户总数无限增长。
+    
+    涉及多名用户的操作通过 hold() 按用户ID排序后依次加锁，
+    两个操作同时锁定同一对用户时顺序一致，不会互相等待形成死锁。
+    
+    Args:
+        max_cached: LRU 中最多保留的空闲锁数量
+    """
+    
+    def __init__(self, max_cached: int = 1024):
+        self.max_cached = max_cached
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self._recent: "OrderedDict[str, asyncio.Lock]" = OrderedDict()
+    
+    def __len__(self) -> int:
+        return len(self._locks)
+    
+    def get(self, user_id: str) -> asyncio.Lock:
+        """获取用户的锁，不存在时创建"""
+        lock = self._locks.get(user_id)
+        if lock is None:
+            lock = self._locks[user_id] = asyncio.Lock()
+        self._recent[user_id] = lock
+        self._recent.move_to_end(user_id)
+        if len(self._recent) > self.max_cached:
+            self._recent.popitem(last=False)
+        return lock
+    
+    def locked(self, user_id: str) -> bool:
+        """用户的锁当前是否被持有"""
+        lock = self._locks.get(user_id)
+        return lock is not None and lock.locked()
+    
+    @asynccontextmanager
+    async def hold(self, *user_ids: str) -> AsyncIterator[None]:
+        """按用户ID顺序锁定一名或多名用户，退出时按相反顺序释放"""
+        locks = [self.get(user_id) for user_id in sorted(set(user_ids))]
+        acquired = []
+        try:
+            for lock in locks:
+                await lock.acquire()
+                acquired.append(lock)
+            yield
+        finally:
+            for lock in reversed(acquired):
+                lock.release()
@@ -1,13 +1,66 @@
 from astrbot.api.event import filter, AstrMessageEvent, MessageEventResult
 from astrbot.api.star import Context, Star, register
 from astrbot.api import logger
-from astrbot.api.all import MessageChain, At, Plain
+from astrbot.api.all import At
 import os
 import time
 import asyncio
+import functools
 from .xiuxian_data import XiuXianData
 from .markdown_formatter import MarkdownFormatter
 from .utils import XiuXianUtils
+from .scheduler import StatusScheduler
+from .outbox import NotificationOutbox
+from .actor import UserCommandQueue
+
+def user_command(handler=None, *, with_target=False, read_only=False):
+    '''玩家指令装饰器
+    
+    指令经发送者的指令队列执行：锁定发送者（with_target 为 True 时同时锁定被@的目标）后执行，
+    同一用户的指令依次执行，不同用户的指令互不阻塞，每名用户的指令频率有上限：
+    超出频率的指令排队等待，只读指令则直接拒绝并回复玩家操作过于频繁。
+    执行前先结算发送者已到期但尚未结算的状态，结算结果在指令回复之前发送。
+    read_only 为 True 的指令在结算之后按用户数据版本号查找缓存的回复，数据未变化时直接复用。
+    指令的回复在锁内生成，释放锁之后再逐条发出，发送消息期间不占用锁。
+    '''
+    def decorate(handler):
+        @functools.wraps(handler)
+        async def wrapper(self, event: AstrMessageEvent, *args, **kwargs):
+            user_ids = [str(event.get_sender_id())]
+            if with_target:
+                target_id = self.parse_at_target(event)
+                if target_id:
+                    user_ids.append(target_id)
+            
+            async def produce():
+                results = []
+                # 结算会修改用户数据，不属于只读部分，每次都先执行，再按结算后的版本号查找缓存
+                notice = self._settle_due_status(user_ids[0])
+                if notice:
+                    results.append(event.plain_result(notice))
+                
+                key = version = None
+                if read_only:
+                    key = (user_ids[0], handler.__name__, args, tuple(sorted(kwargs.items())))
+                    version = self.data_manager.user_version(user_ids[0])
+                    cached = self.command_queue.cached_reply(key, version)
+                    if cached is not None:
+                        return results + cached
+                
+                replies = [result async for result in handler(self, event, *args, **kwargs)]
+                if key is not None and self.data_manager.user_version(user_ids[0]) == version:
+                    self.command_queue.remember_reply(key, version, replies)
+                return results + replies
+            
+            results = await self.command_queue.run(user_ids, produce, read_only=read_only)
+            if results is None:
+                logger.debug(f"用户 {user_ids[0]} 的指令过于频繁，已拒绝指令 {handler.__name__}")
+                yield event.plain_result("操作过于频繁，请稍后再试")
+                return
+            for result in results:
+                yield result
+        return wrapper
+    return decorate(handler) if handler is not None else decorate
 
 @register("xiuxian", "修仙游戏", "一个简单的修仙游戏插件", "1.0.0")
 class XiuXianPlugin(Star):
@@ -19,41 +72,164 @@ class XiuXianPlugin(Star):
         os.makedirs(data_dir, exist_ok=True)
         self.data_manager = XiuXianData(data_dir)
         
-        # 存储用户状态任务的字典
-        self.user_status_tasks = {}
+        # 所有用户的状态到期由同一个调度器统一触发
+        self.status_scheduler = StatusScheduler(self._on_status_due)
+        self.status_scheduler.start()
+        status_config = self.data_manager.config.system.get("status", {})
+        self.rehydrate_batch_size = status_config.get("rehydrate_batch_size", 100)
+        # 玩家指令按用户依次执行并限制频率，重复的只读查询复用缓存的回复
+        command_config = self.data_manager.config.system.get("commands", {})
+        self.command_queue = UserCommandQueue(
+            self.data_manager.locks,
+            rate=command_config.get("rate_per_second", 1),
+            burst=command_config.get("burst", 5),
+            reply_ttl=command_config.get("reply_cache_seconds", 3),
+        )
+        
+        # 状态完成通知按消息来源合并、限流并在失败时重试
+        self.outbox = NotificationOutbox(
+            self.context.send_message,
+            window=status_config.get("notify_window_seconds", 2),
+            rate=status_config.get("notify_rate_per_second", 0.5),
+            burst=status_config.get("notify_burst", 3),
+            max_batch=status_config.get("notify_max_batch", 20),
+            max_retries=status_config.get("notify_max_retries", 5),
+            retry_base=status_config.get("notify_retry_base_seconds", 2),
+        )
+        # 惰性结算模式：只有开启了提醒的玩家占用调度器，其余玩家的状态在下次指令或定期巡检时结算
+        self.lazy_settlement = status_config.get("lazy_settlement", False)
+        self.lazy_sweep_interval = status_config.get("lazy_sweep_interval_seconds", 600)
+        
+        # 启动后台定时落盘任务
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        if self.lazy_settlement:
+            self._sweep_task = asyncio.create_task(self._lazy_sweep_loop())
+        
+        # 在后台分批恢复重启前未结束的状态（除了修炼中状态），不阻塞插件初始化
+        self._rehydrate_task = asyncio.create_task(self._init_user_status_tasks())
+        # 排行与统计索引同样在后台分批建立，建立完成前的查询会先同步补齐
+        self._index_task = asyncio.create_task(self.data_manager.build_indexes())
         logger.info("修仙插件已启动")
     
-        # 遍历所有玩家，如果有状态未结束（除了修炼中状态），则创建任务
-        self._init_user_status_tasks()
+    async def _init_user_status_tasks(self):
+        '''后台任务：根据持久化的结算队列恢复未结束的状态
         
-    def _init_user_status_tasks(self):
-        '''初始化所有用户的状态任务'''
+        只遍历结算队列中的任务，无需扫描全部用户。未到期的状态交给调度器；
+        重启期间已经到期的状态按批次结算，每批只写入一次磁盘，
+        结算通知交给发件箱合并限流，避免启动时集中结算和刷屏。
+        '''
         try:
-            # 获取所有用户数据
-            all_users = self.data_manager.get_all_users()
+            batch_size = self.rehydrate_batch_size
             current_time = int(time.time())
-            task_count = 0
+            status_jobs = self.data_manager.status_jobs
+            scheduled_count = 0
+            overdue = []
             
-            for user_id, user_data in all_users.items():
-                # 检查用户是否有状态且状态未结束
-                if user_data.get("status") is not None and user_data.get("status") != "修炼中":
-                    # 获取用户名，如果没有则使用用户ID
-                    user_name = user_data.get("username", f"用户{user_id}")
-                    end_time = user_data.get("status_end_time", 0)
-                    group_id = user_data.get("group_id")
-                    unified_msg = user_data.get("unified_msg_origin")
-                    # 创建状态任务
-                    self.create_user_status_task(user_id, user_name, end_time, unified_msg)
-                    task_count += 1
+            # 遍历时每批让出一次事件循环，避免待结算状态较多时阻塞其他指令
+            for index, (status_id, (user_id, due_time)) in enumerate(list(status_jobs.jobs.items()), 1):
+                user_data = self.data_manager.find_user(user_id)
+                if user_data is None or user_data.status_id != status_id:
+                    # 已经结算或被替换的状态，队列中残留的任务直接确认
+                    status_jobs.ack(status_id)
+                elif not self._wants_status_notice(user_data):
+                    # 惰性结算模式下未开启提醒的玩家留给指令或定期巡检结算
+                    pass
+                elif due_time <= current_time:
+                    overdue.append(status_id)
+                else:
+                    self.create_user_status_task(user_id, user_data.username, due_time, user_data.unified_msg_origin)
+                    scheduled_count += 1
+                if index % batch_size == 0:
+                    await asyncio.sleep(0)
+            logger.info(f"已恢复 {scheduled_count} 个未到期的状态任务，{len(overdue)} 个状态已到期待结算")
             
-            if task_count > 0:
-                logger.info(f"初始化完成，已为 {task_count} 个用户创建状态任务")
-            else:
-                logger.info("初始化完成，没有需要创建的状态任务")
+            settled_count = 0
+            for start in range(0, len(overdue), batch_size):
+                results = self.data_manager.settle_status_jobs(overdue[start:start + batch_size])
+                for user_id, result in results:
+                    if not result["success"]:
+                        continue
+                    settled_count += 1
+                    user_data = self.data_manager.find_user(user_id)
+                    self._send_status_notice(user_id, user_data.username, user_data.unified_msg_origin, result)
+                await asyncio.sleep(0)
+            
+            if overdue:
+                logger.info(f"初始化完成，已结算 {settled_count} 个重启期间到期的状态")
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             logger.error(f"初始化用户状态任务时出错: {e}")
+    
+    def _wants_status_notice(self, user_data) -> bool:
+        '''用户的状态到期时是否需要主动推送通知（占用调度器）'''
+        return not self.lazy_settlement or user_data.status_notify
+    
+    @staticmethod
+    def _is_status_due(user_data, current_time: int) -> bool:
+        '''用户是否有已经到期但尚未结算的定时状态（修炼状态由玩家自行结束）'''
+        return (user_data.status is not None and user_data.status != "修炼中"
+                and (user_data.status_end_time or 0) <= current_time)
+    
+    def _settle_due_status(self, user_id: str):
+        '''结算用户已到期的状态，返回需要告知用户的结算消息，没有可结算的状态时返回None'''
+        user_data = self.data_manager.find_user(user_id)
+        if user_data is None or not self._is_status_due(user_data, int(time.time())):
+            return None
         
+        self.status_scheduler.cancel(user_id)
+        result = self.data_manager.complete_status(user_id)
+        if not result["success"]:
+            return None
+        logger.info(f"用户 {user_data.username}({user_id}) 的状态已在指令前结算")
+        return f"道友 {user_data.username}，{result['message']}"
+    
+    async def _lazy_sweep_loop(self):
+        '''后台任务：定期巡检并静默结算惰性结算模式下已到期的状态'''
+        while True:
+            await asyncio.sleep(self.lazy_sweep_interval)
+            try:
+                await self._sweep_due_statuses()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"巡检到期状态时出错: {e}")
+    
+    async def _sweep_due_statuses(self) -> int:
+        '''分批结算结算队列中所有已到期且不在调度器中的状态，返回结算数量'''
+        batch_size = self.rehydrate_batch_size
+        status_jobs = self.data_manager.status_jobs
+        due = [
+            status_id for status_id in status_jobs.due(time.time())
+            if status_jobs.jobs[status_id][0] not in self.status_scheduler
+        ]
+        
+        settled_count = 0
+        for start in range(0, len(due), batch_size):
+            results = self.data_manager.settle_status_jobs(due[start:start + batch_size])
+            settled_count += sum(1 for _, result in results if result["success"])
+            await asyncio.sleep(0)
+        
+        if settled_count:
+            logger.info(f"定期巡检已结算 {settled_count} 个到期的状态")
+        return settled_count
+    
+    async def _settle_before_rank(self) -> None:
+        '''惰性结算模式下查看排行前先结算所有已到期的状态，榜单不包含尚未发放的奖励'''
+        if self.lazy_settlement:
+            await self._sweep_due_statuses()
+    
+    async def _flush_loop(self):
+        '''后台任务：按配置的间隔将内存中的变更批量写入磁盘'''
+        while True:
+            await asyncio.sleep(self.data_manager.flush_interval)
+            try:
+                self.data_manager.flush()
+            except Exception as e:
+                logger.error(f"定时保存修仙数据时出错: {e}")
+    
     @filter.command("修仙帮助")
+    @user_command
     async def xiuxian_help(self, event: AstrMessageEvent):
         '''修仙游戏帮助指令'''
         help_text = """【修仙游戏指令】
@@ -63,9 +239,14 @@ class XiuXianPlugin(Star):
                     /结束修炼 - 结束闭关修炼并获取修为奖励
                     /修仙信息 - 查看修仙信息
                     /修仙排行 - 查看排行榜
+                    /修仙排行 本群 - 查看本群排行榜
+                    /修仙排行 我 - 查看自己的名次
+                    /修仙排行 [页码] - 分页查看排行榜
+                    /灵石排行 /战力排行 /签到排行 /突破排行 - 查看各项排行榜
                     /秘境探索 [时间] - 探索秘境获奖励，可指定时间（如：3小时45分钟，最长6小时）
                     /灵脉寻宝 [时间] - 获取灵石，可指定时间（最短1小时，最长6小时）
                     /修仙状态 - 查看当前状态
+                    /修仙提醒 [开/关] - 开关探索、寻宝结束时的@提醒
                     /修仙签到 - 每日签到
                     /突破 - 尝试突破到更高境界
                     /突破信息 - 查看突破相关信息
@@ -81,6 +262,7 @@ class XiuXianPlugin(Star):
         yield event.plain_result(formatted_help)
     
     @filter.command("我要修仙")
+    @user_command
     async def xiuxian_start(self, event: AstrMessageEvent):
         '''开始修仙之旅'''
         user_id = str(event.get_sender_id())
@@ -88,7 +270,7 @@ class XiuXianPlugin(Star):
         user_data = self.data_manager.get_user(user_id)
         
         # 检查用户是否已经开始修仙
-        if user_data.get("has_started", False):
+        if user_data.has_started:
             yield event.plain_result(f"道友 {user_name}，你已经踏上修仙之路，不必重新开始。")
             return
         
@@ -96,27 +278,28 @@ class XiuXianPlugin(Star):
         group_id = str(event.message_obj.group_id)
         
         # 标记用户已开始修仙并保存用户名称和群ID和唯一会话ID
-        user_data["has_started"] = True
-        user_data["username"] = user_name
-        user_data["group_id"] = str(group_id) if group_id else None
-        user_data["unified_msg_origin"] = event.unified_msg_origin
+        user_data.has_started = True
+        user_data.username = user_name
+        user_data.group_id = str(group_id) if group_id else None
+        user_data.unified_msg_origin = event.unified_msg_origin
         self.data_manager.update_user(user_id, user_data)
         
         # 使用Markdown格式化欢迎信息
-        welcome_text = MarkdownFormatter.format_welcome(user_name, user_data['spirit_stones'])
+        welcome_text = MarkdownFormatter.format_welcome(user_name, user_data.spirit_stones)
         
         yield event.plain_result(welcome_text)
     
     @filter.command("修仙信息")
+    @user_command(read_only=True)
     async def xiuxian_info(self, event: AstrMessageEvent):
         '''查看修仙信息'''
         user_id = str(event.get_sender_id())
         user_name = event.get_sender_name()
         
-        user_data = self.data_manager.get_user(user_id)
+        user_data = self.data_manager.find_user(user_id)
         
         # 检查用户是否已经开始修仙
-        if not user_data.get("has_started", False):
+        if user_data is None or not user_data.has_started:
             yield event.plain_result(f"道友 {user_name}，你尚未踏上修仙之路，请先输入 /我要修仙 开始你的修仙之旅。")
             return
         
@@ -127,19 +310,21 @@ class XiuXianPlugin(Star):
         all_equipment = self.data_manager.get_equipment_list()
         
         # 使用Markdown格式化用户信息
-        info_text = MarkdownFormatter.format_user_info(user_name, user_data, all_equipment, status_info)
+        battle_power = self.data_manager.calculate_battle_power(user_data)
+        info_text = MarkdownFormatter.format_user_info(user_name, user_data, all_equipment, status_info, battle_power)
         
         yield event.plain_result(info_text)
         
     @filter.command("突破信息")
+    @user_command(read_only=True)
     async def xiuxian_breakthrough_info(self, event: AstrMessageEvent):
         '''查看突破信息'''
         user_id = str(event.get_sender_id())
         user_name = event.get_sender_name()
-        user_data = self.data_manager.get_user(user_id)
+        user_data = self.data_manager.find_user(user_id)
         
         # 检查用户是否已经开始修仙
-        if not user_data.get("has_started", False):
+        if user_data is None or not user_data.has_started:
             yield event.plain_result(f"道友 {user_name}，你尚未踏上修仙之路，请先输入 /我要修仙 开始你的修仙之旅。")
             return
         
@@ -151,7 +336,7 @@ class XiuXianPlugin(Star):
         
         # 获取下一境界信息
         next_realm_info = self.data_manager.get_next_realm(user_id)
-        next_realm_info["current_realm"] = user_data["realm"]
+        next_realm_info["current_realm"] = user_data.realm
         
         # 格式化突破信息
         formatted_info = MarkdownFormatter.format_breakthrough_info(user_name, next_realm_info)
@@ -159,14 +344,15 @@ class XiuXianPlugin(Star):
         yield event.plain_result(formatted_info)
     
     @filter.command("开始修炼")
+    @user_command
     async def xiuxian_start_practice(self, event: AstrMessageEvent):
         '''开始修炼，无需指定时间，由用户自行决定结束时间'''
         user_id = str(event.get_sender_id())
         user_name = event.get_sender_name()
-        user_data = self.data_manager.get_user(user_id)
+        user_data = self.data_manager.find_user(user_id)
         
         # 检查用户是否已经开始修仙
-        if not user_data.get("has_started", False):
+        if user_data is None or not user_data.has_started:
             yield event.plain_result(f"道友 {user_name}，你尚未踏上修仙之路，请先输入 /我要修仙 开始你的修仙之旅。")
             return
         
@@ -189,14 +375,15 @@ class XiuXianPlugin(Star):
         yield event.plain_result(result)
     
     @filter.command("结束修炼")
+    @user_command
     async def xiuxian_end_practice(self, event: AstrMessageEvent):
         '''结束修炼并获取修为奖励'''
         user_id = str(event.get_sender_id())
         user_name = event.get_sender_name()
-        user_data = self.data_manager.get_user(user_id)
+        user_data = self.data_manager.find_user(user_id)
         
         # 检查用户是否已经开始修仙
-        if not user_data.get("has_started", False):
+        if user_data is None or not user_data.has_started:
             yield event.plain_result(f"道友 {user_name}，你尚未踏上修仙之路，请先输入 /我要修仙 开始你的修仙之旅。")
             return
         
@@ -224,30 +411,91 @@ class XiuXianPlugin(Star):
         yield event.plain_result(formatted_result)
     
     @filter.command("修仙排行")
-    async def xiuxian_rank(self, event: AstrMessageEvent):
-        '''查看修仙排行榜'''
+    @user_command
+    async def xiuxian_rank(self, event: AstrMessageEvent, scope: str = ""):
+        '''查看修仙排行榜，/修仙排行 本群 查看本群排行，/修仙排行 我 查看自己的名次，/修仙排行 3 查看第3页'''
+        await self._settle_before_rank()
         user_id = str(event.get_sender_id())
         user_name = event.get_sender_name()
         
-        all_users = self.data_manager.get_all_users()
-        
-        # 按等级和修为排序
-        sorted_users = sorted(all_users.items(), key=lambda x: (x[1]['level'], x[1]['exp']), reverse=True)
-        
-        # 使用Markdown格式化排行榜
-        rank_text = MarkdownFormatter.format_rank(sorted_users)
+        if scope == "我":
+            rank_info = self.data_manager.get_user_rank(user_id)
+            if rank_info is None:
+                yield event.plain_result(f"道友 {user_name}，你尚未踏上修仙之路，暂无排名。")
+                return
+            rank_text = MarkdownFormatter.format_rank(
+                rank_info["rows"],
+                title=f"{user_name} 的排名",
+                start_rank=rank_info["start_rank"],
+                footer=f"你当前位列第 {rank_info['rank']} 名，共 {rank_info['total']} 名修士上榜",
+            )
+        elif scope.isdigit():
+            page_info = self.data_manager.get_rank_page(int(scope))
+            rank_text = MarkdownFormatter.format_rank(
+                page_info["rows"],
+                start_rank=page_info["start_rank"],
+                footer=f"第 {page_info['page']}/{page_info['total_pages']} 页，输入 /修仙排行 页码 翻页",
+            )
+        elif scope == "本群":
+            group_id = event.message_obj.group_id
+            if not group_id:
+                yield event.plain_result(f"道友 {user_name}，本群排行仅在群聊中可用。")
+                return
+            # 只读取本群的排行榜索引
+            rank_text = self.data_manager.get_rank_text(
+                "realm",
+                lambda rank_data: MarkdownFormatter.format_rank(
+                    [(uid, user) for uid, user, _ in rank_data["rows"]], title="本群修仙排行榜"
+                ),
+                group_id=str(group_id),
+            )
+        else:
+            # 从排行榜索引读取按等级和修为排序的前10名，使用Markdown格式化（未变化时复用缓存）
+            rank_text = self.data_manager.get_rank_text(
+                "realm",
+                lambda rank_data: MarkdownFormatter.format_rank([(uid, user) for uid, user, _ in rank_data["rows"]]),
+            )
         
         yield event.plain_result(rank_text)
-
+    
+    @filter.command("灵石排行")
+    @user_command
+    async def xiuxian_rank_spirit_stones(self, event: AstrMessageEvent):
+        '''查看灵石排行榜'''
+        await self._settle_before_rank()
+        yield event.plain_result(self.data_manager.get_rank_text("spirit_stones", MarkdownFormatter.format_metric_rank))
+    
+    @filter.command("战力排行")
+    @user_command
+    async def xiuxian_rank_battle_power(self, event: AstrMessageEvent):
+        '''查看战力排行榜'''
+        await self._settle_before_rank()
+        yield event.plain_result(self.data_manager.get_rank_text("battle_power", MarkdownFormatter.format_metric_rank))
+    
+    @filter.command("签到排行")
+    @user_command
+    async def xiuxian_rank_daily_streak(self, event: AstrMessageEvent):
+        '''查看连续签到排行榜'''
+        await self._settle_before_rank()
+        yield event.plain_result(self.data_manager.get_rank_text("daily_streak", MarkdownFormatter.format_metric_rank))
+    
+    @filter.command("突破排行")
+    @user_command
+    async def xiuxian_rank_breakthrough(self, event: AstrMessageEvent):
+        '''查看突破次数排行榜'''
+        await self._settle_before_rank()
+        yield event.plain_result(self.data_manager.get_rank_text("breakthrough_count", MarkdownFormatter.format_metric_rank))
+    
     @filter.command("秘境探索")
+    @user_command
     async def xiuxian_adventure(self, event: AstrMessageEvent, duration: str = "1"):
         '''秘境探索，获取奖励'''
         user_id = str(event.get_sender_id())
         user_name = event.get_sender_name()
-        user_data = self.data_manager.get_user(user_id)
+        user_data = self.data_manager.find_user(user_id)
         
         # 检查用户是否已经开始修仙
-        if not user_data.get("has_started", False):
+        if user_data is None or not user_data.has_started:
             yield event.plain_result(f"道友 {user_name}，你尚未踏上修仙之路，请先输入 /我要修仙 开始你的修仙之旅。")
             return
         
@@ -283,14 +531,15 @@ class XiuXianPlugin(Star):
         yield event.plain_result(result)
     
     @filter.command("灵脉寻宝")
+    @user_command
     async def xiuxian_mine(self, event: AstrMessageEvent, duration: str = "1"):
         '''挖矿获取灵石'''
         user_id = str(event.get_sender_id())
         user_name = event.get_sender_name()
-        user_data = self.data_manager.get_user(user_id)
+        user_data = self.data_manager.find_user(user_id)
         
         # 检查用户是否已经开始修仙
-        if not user_data.get("has_started", False):
+        if user_data is None or not user_data.has_started:
             yield event.plain_result(f"道友 {user_name}，你尚未踏上修仙之路，请先输入 /我要修仙 开始你的修仙之旅。")
             return
         
@@ -326,14 +575,15 @@ class XiuXianPlugin(Star):
         yield event.plain_result(result)
     
     @filter.command("修仙签到")
+    @user_command
     async def xiuxian_daily(self, event: AstrMessageEvent):
         '''每日签到'''
         user_id = str(event.get_sender_id())
         user_name = event.get_sender_name()
-        user_data = self.data_manager.get_user(user_id)
+        user_data = self.data_manager.find_user(user_id)
         
         # 检查用户是否已经开始修仙
-        if not user_data.get("has_started", False):
+        if user_data is None or not user_data.has_started:
             yield event.plain_result(f"道友 {user_name}，你尚未踏上修仙之路，请先输入 /我要修仙 开始你的修仙之旅。")
             return
             
@@ -355,14 +605,15 @@ class XiuXianPlugin(Star):
         yield event.plain_result(formatted_message)
     
     @filter.command("修仙商店")
+    @user_command(read_only=True)
     async def xiuxian_shop(self, event: AstrMessageEvent):
         '''查看统一商店'''
         user_id = str(event.get_sender_id())
         user_name = event.get_sender_name()
-        user_data = self.data_manager.get_user(user_id)
+        user_data = self.data_manager.find_user(user_id)
         
         # 检查用户是否已经开始修仙
-        if not user_data.get("has_started", False):
+        if user_data is None or not user_data.has_started:
             yield event.plain_result(f"道友 {user_name}，你尚未踏上修仙之路，请先输入 /我要修仙 开始你的修仙之旅。")
             return
             
@@ -385,14 +636,15 @@ class XiuXianPlugin(Star):
         yield event.plain_result(message)
     
     @filter.command("学习功法")
+    @user_command
     async def xiuxian_learn(self, event: AstrMessageEvent, technique_name: str = ""):
         '''学习功法'''
         user_id = str(event.get_sender_id())
         user_name = event.get_sender_name()
-        user_data = self.data_manager.get_user(user_id)
+        user_data = self.data_manager.find_user(user_id)
         
         # 检查用户是否已经开始修仙
-        if not user_data.get("has_started", False):
+        if user_data is None or not user_data.has_started:
             yield event.plain_result(f"道友 {user_name}，你尚未踏上修仙之路，请先输入 /我要修仙 开始你的修仙之旅。")
             return
             
@@ -414,14 +666,15 @@ class XiuXianPlugin(Star):
         yield event.plain_result(f"道友 {user_name}，{result['message']}")
     
     @filter.command("购买装备")
+    @user_command
     async def xiuxian_buy_equipment(self, event: AstrMessageEvent, equipment_id: str = ""):
         '''购买装备'''
         user_id = str(event.get_sender_id())
         user_name = event.get_sender_name()
-        user_data = self.data_manager.get_user(user_id)
+        user_data = self.data_manager.find_user(user_id)
         
         # 检查用户是否已经开始修仙
-        if not user_data.get("has_started", False):
+        if user_data is None or not user_data.has_started:
             yield event.plain_result(f"道友 {user_name}，你尚未踏上修仙之路，请先输入 /我要修仙 开始你的修仙之旅。")
             return
             
@@ -455,14 +708,15 @@ class XiuXianPlugin(Star):
         yield event.plain_result(f"道友 {user_name}，{result['message']}")
     
     @filter.command("购买丹药")
+    @user_command
     async def xiuxian_buy_pill(self, event: AstrMessageEvent, pill_name: str = ""):
         '''购买丹药'''
         user_id = str(event.get_sender_id())
         user_name = event.get_sender_name()
-        user_data = self.data_manager.get_user(user_id)
+        user_data = self.data_manager.find_user(user_id)
         
         # 检查用户是否已经开始修仙
-        if not user_data.get("has_started", False):
+        if user_data is None or not user_data.has_started:
             yield event.plain_result(f"道友 {user_name}，你尚未踏上修仙之路，请先输入 /我要修仙 开始你的修仙之旅。")
             return
             
@@ -484,14 +738,15 @@ class XiuXianPlugin(Star):
         yield event.plain_result(f"道友 {user_name}，{result['message']}")
     
     @filter.command("使用丹药")
+    @user_command
     async def xiuxian_use_pill(self, event: AstrMessageEvent, pill_name: str = ""):
         '''使用丹药'''
         user_id = str(event.get_sender_id())
         user_name = event.get_sender_name()
-        user_data = self.data_manager.get_user(user_id)
+        user_data = self.data_manager.find_user(user_id)
         
         # 检查用户是否已经开始修仙
-        if not user_data.get("has_started", False):
+        if user_data is None or not user_data.has_started:
             yield event.plain_result(f"道友 {user_name}，你尚未踏上修仙之路，请先输入 /我要修仙 开始你的修仙之旅。")
             return
             
@@ -515,14 +770,15 @@ class XiuXianPlugin(Star):
         # 显示
     
     @filter.command("修仙状态")
+    @user_command(read_only=True)
     async def xiuxian_status(self, event: AstrMessageEvent):
         '''查看当前状态'''
         user_id = str(event.get_sender_id())
         user_name = event.get_sender_name()
-        user_data = self.data_manager.get_user(user_id)
+        user_data = self.data_manager.find_user(user_id)
         
         # 检查用户是否已经开始修仙
-        if not user_data.get("has_started", False):
+        if user_data is None or not user_data.has_started:
             yield event.plain_result(f"道友 {user_name}，你尚未踏上修仙之路，请先输入 /我要修仙 开始你的修仙之旅。")
             return
         
@@ -534,15 +790,52 @@ class XiuXianPlugin(Star):
         else:
             yield event.plain_result(f"道友 {user_name}，你当前处于空闲状态，可以进行修炼、探索或收集灵石等活动。")
     
+    @filter.command("修仙提醒")
+    @user_command
+    async def xiuxian_notify(self, event: AstrMessageEvent, switch: str = ""):
+        '''开关状态完成提醒'''
+        user_id = str(event.get_sender_id())
+        user_name = event.get_sender_name()
+        user_data = self.data_manager.find_user(user_id)
+        
+        # 检查用户是否已经开始修仙
+        if user_data is None or not user_data.has_started:
+            yield event.plain_result(f"道友 {user_name}，你尚未踏上修仙之路，请先输入 /我要修仙 开始你的修仙之旅。")
+            return
+        
+        if switch in ("开", "开启"):
+            enabled = True
+        elif switch in ("关", "关闭"):
+            enabled = False
+        elif not switch:
+            enabled = not user_data.status_notify
+        else:
+            yield event.plain_result(f"道友 {user_name}，请使用 /修仙提醒 开 或 /修仙提醒 关")
+            return
+        
+        self.data_manager.update_user(user_id, {"status_notify": enabled})
+        
+        # 已有进行中的定时状态时按新的设置调整调度
+        if user_data.status is not None and user_data.status != "修炼中":
+            self.create_user_status_task(user_id, user_name, user_data.status_end_time, user_data.unified_msg_origin)
+        
+        if enabled:
+            yield event.plain_result(f"道友 {user_name}，已开启状态提醒，探索、寻宝结束时将@你通知结果。")
+        elif self.lazy_settlement:
+            yield event.plain_result(f"道友 {user_name}，已关闭状态提醒，探索、寻宝的结果将在你下次发送指令时告知。")
+        else:
+            yield event.plain_result(f"道友 {user_name}，已关闭状态提醒。")
+    
     @filter.command("突破")
+    @user_command
     async def xiuxian_breakthrough(self, event: AstrMessageEvent, use_pill: str = ""):
         '''尝试突破到更高境界'''
         user_id = str(event.get_sender_id())
         user_name = event.get_sender_name()
-        user_data = self.data_manager.get_user(user_id)
+        user_data = self.data_manager.find_user(user_id)
         
         # 检查用户是否已经开始修仙
-        if not user_data.get("has_started", False):
+        if user_data is None or not user_data.has_started:
             yield event.plain_result(f"道友 {user_name}，你尚未踏上修仙之路，请先输入 /我要修仙 开始你的修仙之旅。")
             return
         
@@ -576,16 +869,20 @@ class XiuXianPlugin(Star):
         use_pill_bool = False
         if use_pill and "渡厄丹" in use_pill:
             # 检查用户是否有渡厄丹
-            if "渡厄丹" not in user_data.get("inventory", {}).get("pills", {}) or user_data["inventory"]["pills"]["渡厄丹"] <= 0:
+            if "渡厄丹" not in user_data.inventory["pills"] or user_data.inventory["pills"]["渡厄丹"] <= 0:
                 yield event.plain_result(f"道友 {user_name}，你没有渡厄丹，无法使用。")
                 return
-            # 减少一个渡厄丹
-            user_data["inventory"]["pills"]["渡厄丹"] -= 1
-            self.data_manager.update_user(user_id, user_data)
             use_pill_bool = True
         
-        # 尝试突破
-        result = self.data_manager.breakthrough(user_id, use_pill_bool)
+        # 消耗渡厄丹与突破在同一事务中提交，突破异常时丹药一并回滚
+        with self.data_manager.transaction(user_id):
+            if use_pill_bool:
+                # 减少一个渡厄丹
+                user_data.inventory["pills"]["渡厄丹"] -= 1
+                self.data_manager.update_user(user_id, user_data)
+            
+            # 尝试突破
+            result = self.data_manager.breakthrough(user_id, use_pill_bool)
         
         # 格式化突破结果
         formatted_result = MarkdownFormatter.format_breakthrough_result(user_name, result)
@@ -593,14 +890,15 @@ class XiuXianPlugin(Star):
         yield event.plain_result(formatted_result)
     
     @filter.command("切磋")
+    @user_command(with_target=True)
     async def xiuxian_duel(self, event: AstrMessageEvent):
         '''与其他修仙者切磋'''
         user_id = str(event.get_sender_id())
         user_name = event.get_sender_name()
-        user_data = self.data_manager.get_user(user_id)
+        user_data = self.data_manager.find_user(user_id)
         
         # 检查用户是否已经开始修仙
-        if not user_data.get("has_started", False):
+        if user_data is None or not user_data.has_started:
             yield event.plain_result(f"道友 {user_name}，你尚未踏上修仙之路，请先输入 /我要修仙 开始你的修仙之旅。")
             return
         
@@ -628,7 +926,7 @@ class XiuXianPlugin(Star):
             yield event.plain_result(f"道友 {user_name}，你不能与自己切磋。")
             return
         
-        target_name = all_users[target_id]["username"]
+        target_name = all_users[target_id].username
         
         # 调用数据管理器的切磋方法
         result = self.data_manager.duel(user_id, target_id)
@@ -646,14 +944,15 @@ class XiuXianPlugin(Star):
         yield event.plain_result(message)
     
     @filter.command("偷灵石")
+    @user_command(with_target=True)
     async def xiuxian_steal(self, event: AstrMessageEvent):
         '''偷取其他修仙者的灵石'''
         user_id = str(event.get_sender_id())
         user_name = event.get_sender_name()
-        user_data = self.data_manager.get_user(user_id)
+        user_data = self.data_manager.find_user(user_id)
         
         # 检查用户是否已经开始修仙
-        if not user_data.get("has_started", False):
+        if user_data is None or not user_data.has_started:
             yield event.plain_result(f"道友 {user_name}，你尚未踏上修仙之路，请先输入 /我要修仙 开始你的修仙之旅。")
             return
         
@@ -681,7 +980,7 @@ class XiuXianPlugin(Star):
             yield event.plain_result(f"道友 {user_name}，你不能偷取自己的灵石。")
             return
 
-        target_name = all_users[target_id]["username"]
+        target_name = all_users[target_id].username
         
         # 调用数据管理器的偷灵石方法
         result = self.data_manager.steal_spirit_stones(user_id, target_id)
@@ -692,6 +991,31 @@ class XiuXianPlugin(Star):
         
         yield event.plain_result(message)
     
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("修仙存档")
+    async def xiuxian_flush(self, event: AstrMessageEvent):
+        '''管理员指令：立即保存修仙数据'''
+        dirty_count = self.data_manager.flush()
+        # 在线程中等待写入线程完成，不阻塞事件循环
+        await asyncio.to_thread(self.data_manager.writer.wait_idle)
+        yield event.plain_result(f"修仙数据已保存，本次写入 {dirty_count} 名修士的变更。")
+    
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("修仙导出")
+    async def xiuxian_export(self, event: AstrMessageEvent):
+        '''管理员指令：将修仙数据导出为便于阅读的JSON文件'''
+        self.data_manager.flush()
+        file_path = await self.data_manager.export_data()
+        yield event.plain_result(f"修仙数据已导出到 {file_path}")
+    
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("修仙统计")
+    async def xiuxian_stats(self, event: AstrMessageEvent):
+        '''查看修仙世界整体统计（管理员）'''
+        stats = self.data_manager.get_world_stats()
+        stats["pending_statuses"] = self.status_scheduler.counts()
+        yield event.plain_result(MarkdownFormatter.format_world_stats(stats))
+    
     def parse_at_target(self, event):
         """解析@目标"""
         for comp in event.message_obj.message:
@@ -700,100 +1024,77 @@ class XiuXianPlugin(Star):
         return None
     
     def create_user_status_task(self, user_id: str, user_name: str, end_time: int, unified_msg_origin=None):
-        '''为用户创建状态检查任务'''
-        # 使用工具类生成唯一的任务ID
-        status_type = self.data_manager.get_user(user_id).get("status", "未知")
-        task_id = XiuXianUtils.generate_task_id(user_id, status_type)
-        
-        # 如果用户已有任务，先取消
-        for existing_id, task_info in list(self.user_status_tasks.items()):
-            if task_info["user_id"] == user_id and not task_info["task"].done():
-                task_info["task"].cancel()
-                del self.user_status_tasks[existing_id]
-                logger.info(f"已取消用户 {user_name}({user_id}) 的旧状态任务 {existing_id}")
-        
-        # 计算等待时间（秒）
+        '''为用户安排状态到期检查，用户已有的待检查条目会被替换'''
+        user_data = self.data_manager.find_user(user_id)
+        if user_data is None or user_data.status_id is None or not self._wants_status_notice(user_data):
+            # 没有待结算的定时状态，或惰性结算模式下未开启提醒的玩家不占用调度器
+            self.status_scheduler.cancel(user_id)
+            return
+        # 到期时按结算ID结算，状态已被指令提前结算时不会重复发放奖励
+        payload = (user_name, unified_msg_origin, user_data.status_id)
+        self.status_scheduler.schedule(user_id, end_time, payload, user_data.status)
         wait_time = max(0, end_time - int(time.time()))
-        
-        # 创建新任务
-        task = asyncio.create_task(
-            self.check_user_status_task(user_id, user_name, wait_time, unified_msg_origin)
-        )
-        
-        # 设置任务完成回调，确保任务完成后从字典中移除
-        task.add_done_callback(lambda t: self._cleanup_task(task_id, user_id, user_name))
-        
-        # 存储任务信息
-        self.user_status_tasks[task_id] = {
-            "user_id": user_id,
-            "task": task,
-            "end_time": end_time,
-            "status_type": status_type
-        }
-        
-        logger.info(f"已为用户 {user_name}({user_id}) 创建状态任务 {task_id}，将在 {wait_time} 秒后完成")
+        logger.info(f"已为用户 {user_name}({user_id}) 安排状态检查，将在 {wait_time} 秒后完成")
     
-    def _cleanup_task(self, task_id: str, user_id: str, user_name: str):
-        '''清理已完成的任务'''
-        if task_id in self.user_status_tasks:
-            del self.user_status_tasks[task_id]
-            logger.info(f"用户 {user_name}({user_id}) 的状态任务 {task_id} 已从任务字典中移除")
-    
-    async def check_user_status_task(self, user_id: str, user_name: str, wait_time: int, unified_msg_origin):
-        '''异步任务：等待指定时间后检查用户状态并发放奖励'''
+    async def _on_status_due(self, user_id: str, payload):
+        '''调度器回调：状态到期后检查用户状态并发放奖励'''
+        user_name, unified_msg_origin, status_id = payload
         try:
-            # 等待到状态结束时间
-            await asyncio.sleep(wait_time + 5)
-            
-            # 获取用户数据
-            user_data = self.data_manager.get_user(user_id)
             logger.info(f"开始检查用户 {user_name}({user_id}) 的状态")
             
-            # 检查用户是否仍有状态
-            if user_data.get("status") is not None:
-                # 完成状态并获取奖励
-                result = self.data_manager.complete_status(user_id)
+            # 按结算ID完成状态并获取奖励，任务已确认出队时返回None
+            async with self.data_manager.locks.hold(user_id):
+                settled = self.data_manager.settle_status_job(status_id)
+            if settled is not None:
+                result = settled[1]
                 logger.info(f"用户 {user_name}({user_id}) 的状态已完成")
                 logger.info(f"用户 {user_name}({user_id}) 的状态奖励：{result}")
                 
                 # 如果状态完成成功
                 if result["success"]:
-                    # 构建消息链，@用户并发送奖励消息
-                    message_chain = MessageChain([
-                        At(qq=user_id),
-                        Plain(f" 道友 {user_name}，{result['message']}")
-                    ])
-                    
-                    logger.info(f"开始向用户 {user_name}({user_id}) 发送状态完成通知")
-                    try:
-                        # 尝试发送消息
-                        await self.context.send_message(unified_msg_origin, message_chain)
-                        logger.info(f"已向用户 {user_name}({user_id}) 发送状态完成通知")
-                    except Exception as e:
-                        logger.error(f"向用户 {user_name}({user_id}) 发送状态完成通知失败: {e}")
+                    self._send_status_notice(user_id, user_name, unified_msg_origin, result)
         
         except asyncio.CancelledError:
-            # 任务被取消
-            logger.info(f"用户 {user_name}({user_id}) 的状态任务被取消")
+            # 插件卸载时回调被取消
+            logger.info(f"用户 {user_name}({user_id}) 的状态检查被取消")
+            raise
         except Exception as e:
-            logger.error(f"用户 {user_name}({user_id}) 的状态任务出错: {e}")
-        # 注意：不需要在finally中清理任务，因为已经通过done_callback处理
+            logger.error(f"用户 {user_name}({user_id}) 的状态检查出错: {e}")
+    
+    def _send_status_notice(self, user_id: str, user_name: str, unified_msg_origin, result):
+        '''将状态完成的奖励消息加入发件箱，同一会话的通知合并为一条@多人的消息发送'''
+        if not unified_msg_origin:
+            logger.info(f"用户 {user_name}({user_id}) 没有可用的消息来源，跳过状态完成通知")
+            return
+        self.outbox.enqueue(unified_msg_origin, user_id, f"道友 {user_name}，{result['message']}")
     
     async def terminate(self):
         '''可选择实现 terminate 函数，当插件被卸载/停用时会调用。'''
-        # 取消所有用户状态任务
-        if hasattr(self, 'user_status_tasks'):
-            for task_id, task_info in list(self.user_status_tasks.items()):
-                task = task_info["task"]
-                if not task.done():
-                    task.cancel()
-                    try:
-                        await task
-                    except asyncio.CancelledError:
-                        pass
-                    except Exception as e:
-                        logger.error(f"取消任务 {task_id} 时出错: {e}")
-            self.user_status_tasks.clear()
+        # 停止尚未完成的状态恢复任务、索引建立任务与到期状态巡检任务
+        for task_name in ('_rehydrate_task', '_index_task', '_sweep_task'):
+            task = getattr(self, task_name, None)
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        
+        # 停止状态调度器，未到期的状态会在下次启动时重新安排
+        if hasattr(self, 'status_scheduler'):
+            await self.status_scheduler.close()
             logger.info("所有修仙状态任务已清理完毕")
+        if hasattr(self, 'outbox'):
+            await self.outbox.close()
+        
+        # 停止定时落盘任务，并将尚未写入的变更保存到磁盘
+        if hasattr(self, '_flush_task'):
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+        await self.data_manager.aclose()
+        logger.info("修仙数据已保存")
         
         logger.info("修仙游戏插件已卸载")
@@ -40,40 +40,34 @@ class MarkdownFormatter:
         return f"## 🎉 欢迎踏上修仙之路！\n\n**{user_name}** 道友，你已成功踏入修仙世界！\n\n💎 初始灵石: **{spirit_stones}** 枚\n\n可使用 `/修仙帮助` 查看所有可用指令。\n\n> *祝你修仙之路一帆风顺，早日飞升成仙！*"
     
     @staticmethod
-    def format_user_info(user_name, user_data, all_equipment, status_info=None):
+    def format_user_info(user_name, user_data, all_equipment, status_info=None, battle_power=0):
         """
-        格式化用户信息
+        格式化用户信息，战力由 XiuXianData.calculate_battle_power 统一计算后传入
         """
         info = f"## 🧙 {user_name} 的修仙信息\n\n"
         
-        # 计算战力
-        battle_power = user_data["level"] * 10
-        if "stats" in user_data:
-            battle_power += user_data["stats"].get("attack", 0) + user_data["stats"].get("defense", 0)
-        
         # 基本信息表格
         info += "| 属性 | 数值 |\n| --- | --- |\n"
-        info += f"| 境界 | **{user_data['realm']}** |\n"
-        info += f"| 修为等级 | {user_data['level']} |\n"
-        info += f"| 详细修为 | {user_data['exp']}/{user_data['max_exp']} |\n"
-        info += f"| 灵石 | 💎 {user_data['spirit_stones']} |\n"
-        info += f"| 战力 | ⚔️ {battle_power} |\n"
+        info += f"| 境界 | **{user_data.realm}** |\n"
+        info += f"| 修为等级 | {user_data.level} |\n"
+        info += f"| 详细修为 | {user_data.exp}/{user_data.max_exp} |\n"
+        info += f"| 灵石 | 💎 {user_data.spirit_stones} |\n"
+        info += f"| 战力 | ⚔️ {battle_power:g} |\n"
         
         # 属性详情
-        if "stats" in user_data:
-            info += "\n### 🔥 属性详情\n"
-            info += "| 属性 | 数值 |\n| --- | --- |\n"
-            info += f"| 攻击力 | {user_data['stats'].get('attack', 0)} |\n"
-            info += f"| 防御力 | {user_data['stats'].get('defense', 0)} |\n"
-            info += f"| 生命值 | {user_data['stats'].get('hp', 0)}/{user_data['stats'].get('max_hp', 100)} |\n"
-        
-        if "equipment" in user_data and any(user_data["equipment"].values()):
+        info += "\n### 🔥 属性详情\n"
+        info += "| 属性 | 数值 |\n| --- | --- |\n"
+        info += f"| 攻击力 | {user_data.stats.attack} |\n"
+        info += f"| 防御力 | {user_data.stats.defense} |\n"
+        info += f"| 生命值 | {user_data.stats.hp}/{user_data.stats.max_hp} |\n"
+        
+        if any(user_data.equipment.values()):
             info += "\n### 🔮 装备信息\n"
             info += "| 装备槽 | 已装备 |\n| --- | --- |\n"
             
-            weapon = user_data["equipment"].get("weapon")
-            armor = user_data["equipment"].get("armor")
-            accessory = user_data["equipment"].get("accessory")
+            weapon = user_data.equipment.weapon
+            armor = user_data.equipment.armor
+            accessory = user_data.equipment.accessory
             
             # 查询装备详细名称
             if weapon:
@@ -97,17 +91,17 @@ class MarkdownFormatter:
             info += f"| 饰品 | {accessory_name if accessory else '无'} |\n"
         
         # 丹药库存
-        if "inventory" in user_data and "pills" in user_data["inventory"] and user_data["inventory"]["pills"]:
+        if user_data.inventory["pills"]:
             info += "\n### 💊 丹药库存\n"
             info += "| 丹药 | 数量 |\n| --- | --- |\n"
-            for pill_name, count in user_data["inventory"]["pills"].items():
+            for pill_name, count in user_data.inventory["pills"].items():
                 if count > 0:
                     info += f"| {pill_name} | {count} |\n"
         
         # 已学功法
-        if user_data['techniques']:
+        if user_data.techniques:
             info += "\n### 📜 已学功法\n"
-            for technique in user_data['techniques']:
+            for technique in user_data.techniques:
                 info += f"- *{technique}*\n"
         
         # 冷却时间信息
@@ -115,27 +109,26 @@ class MarkdownFormatter:
         cooldown_info = []
         
         # 切磋冷却
-        if "last_duel_time" in user_data and current_time - user_data.get("last_duel_time", 0) < 600:
-            remaining = 600 - (current_time - user_data.get("last_duel_time", 0))
+        if current_time - user_data.last_duel_time < 600:
+            remaining = 600 - (current_time - user_data.last_duel_time)
             minutes = remaining // 60
             seconds = remaining % 60
             cooldown_info.append(f"⚔️ 切磋冷却: {minutes}分{seconds}秒")
         
         # 偷窃冷却
-        if "last_steal_time" in user_data and current_time - user_data.get("last_steal_time", 0) < 600:
-            remaining = 600 - (current_time - user_data.get("last_steal_time", 0))
+        if current_time - user_data.last_steal_time < 600:
+            remaining = 600 - (current_time - user_data.last_steal_time)
             minutes = remaining // 60
             seconds = remaining % 60
             cooldown_info.append(f"🕵️ 偷窃冷却: {minutes}分{seconds}秒")
         
         # 探险冷却
-        if "last_adventure_time" in user_data:
-            cooldown = 60 * 60 * 2  # 假设最大冷却时间为2小时
-            if current_time - user_data.get("last_adventure_time", 0) < cooldown:
-                remaining = cooldown - (current_time - user_data.get("last_adventure_time", 0))
-                hours = remaining // 3600
-                minutes = (remaining % 3600) // 60
-                cooldown_info.append(f"🔍 探险冷却: {hours}小时{minutes}分钟")
+        cooldown = 60 * 60 * 2  # 假设最大冷却时间为2小时
+        if current_time - user_data.last_adventure_time < cooldown:
+            remaining = cooldown - (current_time - user_data.last_adventure_time)
+            hours = remaining // 3600
+            minutes = (remaining % 3600) // 60
+            cooldown_info.append(f"🔍 探险冷却: {hours}小时{minutes}分钟")
         
         if cooldown_info:
             info += "\n### ⏱️ 冷却时间\n"
@@ -149,18 +142,62 @@ class MarkdownFormatter:
         return info
     
     @staticmethod
-    def format_rank(sorted_users):
+    def format_rank(sorted_users, title="修仙世界排行榜", start_rank=1, footer=""):
         """
-        格式化排行榜
+        格式化排行榜，start_rank 为第一行的名次
         """
-        rank_text = "## 🏆 修仙世界排行榜\n\n"
+        rank_text = f"## 🏆 {title}\n\n"
         rank_text += "| 排名 | 修士 | 境界 | 等级 |\n| --- | --- | --- | --- |\n"
         
-        for i, (user_id, user_data) in enumerate(sorted_users[:10], 1):
-            rank_text += f"| {i} | {user_data['username']} | {user_data['realm']} | {user_data['level']} |\n"
+        for i, (user_id, user_data) in enumerate(sorted_users[:10], start_rank):
+            rank_text += f"| {i} | {user_data.username} | {user_data.realm} | {user_data.level} |\n"
+        
+        if footer:
+            rank_text += f"\n> *{footer}*\n"
         
         return rank_text
     
+    @staticmethod
+    def format_metric_rank(rank_data):
+        """
+        格式化指标排行榜（灵石、战力、签到、突破等）
+        """
+        rank_text = f"## 🏆 {rank_data['title']}\n\n"
+        rank_text += f"| 排名 | 修士 | 境界 | {rank_data['value_label']} |\n| --- | --- | --- | --- |\n"
+        
+        for i, (user_id, user_data, value) in enumerate(rank_data["rows"], 1):
+            if isinstance(value, float):
+                value = f"{value:g}"
+            rank_text += f"| {i} | {user_data.username} | {user_data.realm} | {value} |\n"
+        
+        return rank_text
+    
+    @staticmethod
+    def format_world_stats(stats):
+        """
+        格式化修仙世界统计
+        """
+        stats_text = "## 📊 修仙世界统计\n\n"
+        stats_text += "| 项目 | 数值 |\n| --- | --- |\n"
+        stats_text += f"| 修士总数 | {stats['total_users']} |\n"
+        stats_text += f"| 24小时活跃 | {stats['active_users']} |\n"
+        stats_text += f"| 灵石总量 | 💎 {stats['total_spirit_stones']} |\n"
+        stats_text += f"| 灵石中位数 | {stats['median_spirit_stones']:.0f} |\n"
+        stats_text += f"| 灵石前10%门槛 | {stats['p90_spirit_stones']:.0f} |\n"
+        stats_text += f"| 修为中位数 | {stats['median_exp']:.0f} |\n"
+        
+        if stats["realm_counts"]:
+            stats_text += "\n### 🏔️ 境界分布（达到该境界及以上）\n"
+            for realm_name, count in stats["realm_counts"]:
+                stats_text += f"- {realm_name}: {count} 人\n"
+        
+        if stats.get("pending_statuses"):
+            stats_text += "\n### ⏳ 等待结算的状态\n"
+            for status_type, count in stats["pending_statuses"].items():
+                stats_text += f"- {status_type}: {count} 人\n"
+        
+        return stats_text
+    
     @staticmethod
     def format_practice_start(user_name, duration_hours, end_time):
         """
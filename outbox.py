@@ -0,0 +1,167 @@
+import asyncio
+import time
+from typing import Dict, Any, Awaitable, Callable, List, Tuple
+from astrbot.api import logger
+from astrbot.api.all import MessageChain, At, Plain
+
+
+class TokenBucket:
+    """令牌桶限流器
+    
+    令牌以 rate 个/秒的速度补充，最多累积 capacity 个；每次发送消耗一个令牌，
+    令牌不足时等待到补足为止。
+    """
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+    
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def is_full(self) -> bool:
+        """令牌是否已经补满（与新建的令牌桶等价）"""
+        self._refill()
+        return self.tokens >= self.capacity
+    
+    def try_acquire(self) -> bool:
+        """令牌充足时取得一个令牌并返回True，不足时不等待，直接返回False"""
+        self._refill()
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+    
+    async def acquire(self) -> None:
+        """取得一个令牌，令牌不足时等待"""
+        self._refill()
+        while self.tokens < 1:
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+            self._refill()
+        self.tokens -= 1
+
+
+class NotificationOutbox:
+    """状态完成通知的发件箱
+    
+    通知按消息来源（unified_msg_origin，即群聊或私聊会话）分别排队，
+    同一来源在 window 秒内到达的通知合并为一条消息，每位用户一个 At 段；
+    每个来源各有一个令牌桶限制发送频率，发送失败时按指数退避重试，
+    超过重试次数才放弃。每个来源同一时间只有一个发送任务，消息按到达顺序发出。
+    
+    Args:
+        send: 发送消息的协程函数，参数为 (消息来源, 消息链)
+        window: 合并通知的时间窗口（秒）
+        rate: 每个来源每秒允许发送的消息数
+        burst: 每个来源允许连续发送的消息数
+        max_batch: 单条消息最多合并的通知数
+        max_retries: 发送失败后的最大重试次数
+        retry_base: 第一次重试前的等待时间（秒），之后每次翻倍
+    """
+    
+    def __init__(self, send: Callable[[str, MessageChain], Awaitable[Any]], window: float = 2.0,
+                 rate: float = 0.5, burst: float = 3, max_batch: int = 20,
+                 max_retries: int = 5, retry_base: float = 2.0):
+        self.send = send
+        self.window = window
+        self.rate = rate
+        self.burst = burst
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        # 消息来源 -> 待发送的 (用户ID, 通知文本)
+        self._pending: Dict[str, List[Tuple[str, str]]] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # 令牌桶超过该数量时清理已经补满的令牌桶
+        self._prune_size = 1024
+        self._closing = False
+    
+    def __len__(self) -> int:
+        return sum(len(items) for items in self._pending.values())
+    
+    def enqueue(self, origin: str, user_id: str, text: str) -> None:
+        """加入一条发给 user_id 的通知，通知会在合并窗口结束后发出"""
+        self._pending.setdefault(origin, []).append((user_id, text))
+        if origin not in self._tasks and not self._closing:
+            self._tasks[origin] = asyncio.create_task(self._drain(origin))
+    
+    def _bucket(self, origin: str) -> TokenBucket:
+        bucket = self._buckets.get(origin)
+        if bucket is None:
+            if len(self._buckets) >= self._prune_size:
+                self._prune()
+            bucket = self._buckets[origin] = TokenBucket(self.rate, self.burst)
+        return bucket
+    
+    def _prune(self) -> None:
+        """移除已经补满的令牌桶（与新建的令牌桶等价）"""
+        for origin, bucket in list(self._buckets.items()):
+            if bucket.is_full():
+                del self._buckets[origin]
+        self._prune_size = max(1024, 2 * len(self._buckets))
+    
+    @staticmethod
+    def build_message(items: List[Tuple[str, str]]) -> MessageChain:
+        """将多条通知合并为一条消息链"""
+        chain = []
+        for index, (user_id, text) in enumerate(items):
+            chain.append(At(qq=user_id))
+            chain.append(Plain(f" {text}" if index == len(items) - 1 else f" {text}\n"))
+        return MessageChain(chain)
+    
+    async def _drain(self, origin: str) -> None:
+        """后台任务：按窗口合并并发送一个来源的全部待发通知，发送完毕后退出"""
+        try:
+            while self._pending.get(origin):
+                await asyncio.sleep(self.window)
+                pending = self._pending[origin]
+                batch = pending[:self.max_batch]
+                del pending[:self.max_batch]
+                await self._bucket(origin).acquire()
+                await self._send_with_retry(origin, batch)
+        finally:
+            # 异常退出时未发送的通知保留，下次有新通知时随之发送
+            if not self._pending.get(origin):
+                self._pending.pop(origin, None)
+            del self._tasks[origin]
+    
+    async def _send_with_retry(self, origin: str, batch: List[Tuple[str, str]]) -> bool:
+        """发送一批通知，失败时按指数退避重试"""
+        message = self.build_message(batch)
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.send(origin, message)
+                logger.info(f"已向 {origin} 发送 {len(batch)} 条状态完成通知")
+                return True
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logger.error(f"向 {origin} 发送 {len(batch)} 条状态完成通知失败，已放弃: {e}")
+                    return False
+                delay = self.retry_base * (2 ** attempt)
+                logger.warning(f"向 {origin} 发送状态完成通知失败，{delay:g} 秒后第 {attempt + 1} 次重试: {e}")
+                await asyncio.sleep(delay)
+        return False
+    
+    async def close(self) -> None:
+        """停止所有发送任务，尚未发出的通知会被丢弃"""
+        self._closing = True
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        dropped = len(self)
+        if dropped:
+            logger.warning(f"插件停止时仍有 {dropped} 条状态完成通知未发送")
+        self._pending.clear()
+        self._buckets.clear()
@@ -0,0 +1,161 @@
+from typing import Dict, Any, Callable, Iterable, List, Optional, Set, Tuple
+from .leaderboard import Leaderboard, GroupedLeaderboard
+
+# 所有榜单都依赖的字段：只有已开始修仙的用户会上榜
+BASE_FIELDS = frozenset({"has_started"})
+
+
+class RankingMetric:
+    """排行指标定义
+    
+    Args:
+        name: 指标名称
+        title: 榜单标题
+        value_label: 榜单中数值列的列名
+        value_fn: 计算用户在该指标上的数值（越大排名越靠前）
+        fields: 指标依赖的顶层用户字段，只有这些字段变化时才需要更新榜单
+        key_fn: 自定义排序键（越小越靠前），默认为 (-value_fn(user),)
+        grouped: 是否同时维护按群划分的榜单
+    """
+    
+    def __init__(self, name: str, title: str, value_label: str, value_fn: Callable[[Any], Any],
+                 fields: Iterable[str], key_fn: Optional[Callable[[Any], Tuple]] = None, grouped: bool = False):
+        self.name = name
+        self.title = title
+        self.value_label = value_label
+        self.value_fn = value_fn
+        self.key_fn = key_fn or (lambda user: (-value_fn(user),))
+        self.grouped = grouped
+        self.fields = frozenset(fields) | BASE_FIELDS
+        if grouped:
+            self.fields |= {"group_id"}
+
+
+class RankingEngine:
+    """多指标排行引擎
+    
+    每个注册的指标各自维护一个增量更新的排行榜索引（可选按群划分），
+    用户数据变更时只更新依赖字段发生了变化的指标。
+    """
+    
+    def __init__(self, group_fn: Callable[[Any], Optional[str]]):
+        self.group_fn = group_fn
+        self.metrics: Dict[str, RankingMetric] = {}
+        self._boards: Dict[str, Leaderboard] = {}
+        self._group_boards: Dict[str, GroupedLeaderboard] = {}
+    
+    def register(self, metric: RankingMetric) -> None:
+        """注册排行指标"""
+        self.metrics[metric.name] = metric
+        self._boards[metric.name] = Leaderboard(metric.key_fn)
+        if metric.grouped:
+            self._group_boards[metric.name] = GroupedLeaderboard(metric.key_fn, self.group_fn)
+    
+    def update(self, user_id: str, user: Optional[Any], changed_fields: Optional[Set[str]] = None) -> List[str]:
+        """同步单个用户在各榜单中的排名
+        
+        Args:
+            user_id: 用户ID
+            user: 用户最新数据，None 表示用户已删除
+            changed_fields: 发生变化的顶层字段，None 表示全部字段都可能变化
+        
+        Returns:
+            排序键发生变化的指标名称列表
+        """
+        updated = []
+        for name, metric in self.metrics.items():
+            if changed_fields is not None and metric.fields.isdisjoint(changed_fields):
+                continue
+            changed = self._boards[name].update(user_id, user)
+            if metric.grouped:
+                changed = self._group_boards[name].update(user_id, user) or changed
+            if changed:
+                updated.append(name)
+        return updated
+    
+    def board(self, name: str, group_id: Optional[str] = None) -> Optional[Leaderboard]:
+        """获取指标的榜单索引，指定 group_id 时返回该群的榜单（没有上榜用户时为None）"""
+        if group_id is not None:
+            return self._group_boards[name].board(group_id)
+        return self._boards[name]
+    
+    def top(self, name: str, n: int, group_id: Optional[str] = None) -> List[str]:
+        """指标排名前 n 的用户ID，指定 group_id 时只读取该群的榜单"""
+        if group_id is not None:
+            return self._group_boards[name].top(group_id, n)
+        return self._boards[name].top(n)
+
+
+# 榜单中展示的用户字段，这些字段变化时需要重新渲染包含该用户的榜单
+DISPLAY_FIELDS = frozenset({"username", "realm", "level"})
+
+
+class RankCache:
+    """渲染后的榜单文本缓存
+
+    按榜单范围（指标, 群ID）缓存前 N 名的渲染结果，并记录每个缓存包含的用户。
+    只有当变更改变了榜单成员、顺序，或改动了榜上用户的展示字段时才失效，
+    其余变更（如榜外用户的数值变化）不会影响缓存。
+    """
+
+    def __init__(self, ranking: RankingEngine, top_n: int = 10):
+        self.ranking = ranking
+        self.top_n = top_n
+        self._entries: Dict[Tuple[str, Optional[str]], Tuple[str, frozenset]] = {}
+        self._member_scopes: Dict[str, Set[Tuple[str, Optional[str]]]] = {}
+
+    def get(self, scope: Tuple[str, Optional[str]]) -> Optional[str]:
+        """获取缓存的榜单文本，未缓存或已失效时返回None"""
+        entry = self._entries.get(scope)
+        return entry[0] if entry is not None else None
+
+    def put(self, scope: Tuple[str, Optional[str]], text: str, user_ids: Iterable[str]) -> None:
+        """缓存榜单文本及其包含的用户"""
+        self.invalidate(scope)
+        members = frozenset(user_ids)
+        self._entries[scope] = (text, members)
+        for user_id in members:
+            self._member_scopes.setdefault(user_id, set()).add(scope)
+
+    def invalidate(self, scope: Tuple[str, Optional[str]]) -> None:
+        """使指定范围的缓存失效"""
+        entry = self._entries.pop(scope, None)
+        if entry is None:
+            return
+        for user_id in entry[1]:
+            scopes = self._member_scopes.get(user_id)
+            if scopes is not None:
+                scopes.discard(scope)
+                if not scopes:
+                    del self._member_scopes[user_id]
+
+    def on_user_changed(self, user_id: str, user: Optional[Any], changed_fields: Optional[Set[str]],
+                        updated_metrics: Iterable[str]) -> None:
+        """根据用户变更使受影响的榜单缓存失效
+
+        Args:
+            user_id: 用户ID
+            user: 用户最新数据
+            changed_fields: 发生变化的顶层字段，None 表示全部字段
+            updated_metrics: 排序键发生变化的指标
+        """
+        updated_metrics = set(updated_metrics)
+        display_changed = changed_fields is None or not DISPLAY_FIELDS.isdisjoint(changed_fields)
+
+        # 用户已在缓存的榜单中：排名变化或展示字段变化都需要重新渲染
+        for scope in list(self._member_scopes.get(user_id, ())):
+            if display_changed or scope[0] in updated_metrics:
+                self.invalidate(scope)
+
+        # 用户不在缓存的榜单中：排名变化后进入前 N 名才需要重新渲染
+        if not self._entries or user is None:
+            return
+        for metric in updated_metrics:
+            for group_id in (None, self.ranking.group_fn(user)):
+                scope = (metric, group_id)
+                if scope not in self._entries:
+                    continue
+                board = self.ranking.board(metric, group_id)
+                rank = board.rank(user_id) if board is not None else None
+                if rank is not None and rank <= self.top_n:
+                    self.invalidate(scope)
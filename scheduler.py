@@ -0,0 +1,174 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Dict, Any, Awaitable, Callable, List, Optional, Tuple
+from astrbot.api import logger
+
+
+class StatusScheduler:
+    """用户状态到期调度器
+    
+    所有待结算的状态以 (到期时间, 序号, 用户ID, 附加数据) 的形式存放在一个最小堆中，
+    由单个后台任务睡眠到最早的到期时间再依次触发，代替为每名用户各创建一个 asyncio 任务。
+    每名用户同一时间只有一个有效条目：取消时只删除用户ID到序号的映射（O(1)），
+    重新调度时压入新条目（O(log n)），堆中残留的旧条目在弹出时按序号识别并跳过；
+    失效条目超过堆大小的一半时整体重建堆，避免频繁改期的用户占用过多内存。
+    待触发条目与正在执行的回调都以用户ID为键登记，并按状态类型计数供监控使用。
+    
+    Args:
+        handler: 状态到期时调用的协程函数，参数为 (用户ID, 附加数据)
+    """
+    
+    def __init__(self, handler: Callable[[str, Any], Awaitable[None]]):
+        self.handler = handler
+        self._heap: List[Tuple[float, int, str, Any]] = []
+        # 用户ID -> (当前有效条目的序号, 状态类型)
+        self._live: Dict[str, Tuple[int, Optional[str]]] = {}
+        # 状态类型 -> 待触发条目数
+        self._kind_counts: Dict[Optional[str], int] = {}
+        self._counter = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        # 用户ID -> 正在执行到期回调的任务
+        self._running: Dict[str, asyncio.Task] = {}
+    
+    def __len__(self) -> int:
+        return len(self._live)
+    
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._live
+    
+    def start(self) -> None:
+        """启动调度任务，需要在事件循环中调用"""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+    
+    def schedule(self, user_id: str, due_time: float, payload: Any = None, kind: Optional[str] = None) -> None:
+        """安排用户的状态在 due_time 到期，用户已有的待触发条目会被替换
+        
+        Args:
+            user_id: 用户ID
+            due_time: 到期时间戳
+            payload: 到期时原样传给回调的附加数据
+            kind: 状态类型，仅用于计数
+        """
+        self._release(user_id)
+        seq = next(self._counter)
+        entry = (due_time, seq, user_id, payload)
+        heapq.heappush(self._heap, entry)
+        self._live[user_id] = (seq, kind)
+        self._kind_counts[kind] = self._kind_counts.get(kind, 0) + 1
+        # 新条目成为最早到期的条目时唤醒调度任务重新计算睡眠时间
+        if self._heap[0] is entry and self._wakeup is not None:
+            self._wakeup.set()
+        self._maybe_compact()
+    
+    def cancel(self, user_id: str) -> bool:
+        """取消用户待触发的条目，返回是否存在该条目"""
+        if not self._release(user_id):
+            return False
+        self._maybe_compact()
+        return True
+    
+    def counts(self) -> Dict[str, int]:
+        """按状态类型统计待触发的条目数，未指定类型的条目计入“未知”"""
+        return {kind or "未知": count for kind, count in self._kind_counts.items()}
+    
+    @property
+    def running(self) -> int:
+        """正在执行到期回调的数量"""
+        return len(self._running)
+    
+    def _release(self, user_id: str) -> bool:
+        """移除用户的有效条目登记并更新计数，堆中的条目随之失效"""
+        live = self._live.pop(user_id, None)
+        if live is None:
+            return False
+        kind = live[1]
+        count = self._kind_counts[kind] - 1
+        if count:
+            self._kind_counts[kind] = count
+        else:
+            del self._kind_counts[kind]
+        return True
+    
+    def _is_live(self, entry: Tuple[float, int, str, Any]) -> bool:
+        live = self._live.get(entry[2])
+        return live is not None and live[0] == entry[1]
+    
+    def _maybe_compact(self) -> None:
+        """失效条目过多时重建堆"""
+        if len(self._heap) > 64 and len(self._heap) > 2 * len(self._live):
+            self._heap = [entry for entry in self._heap if self._is_live(entry)]
+            heapq.heapify(self._heap)
+    
+    def _pop_due(self, now: float) -> List[Tuple[str, Any]]:
+        """弹出所有已到期的有效条目"""
+        heap = self._heap
+        due = []
+        while heap and heap[0][0] <= now:
+            entry = heapq.heappop(heap)
+            if self._is_live(entry):
+                self._release(entry[2])
+                due.append((entry[2], entry[3]))
+        return due
+    
+    async def _run(self) -> None:
+        """后台任务：睡眠到最早的到期时间并触发到期条目"""
+        while True:
+            # 先丢弃堆顶已失效的条目，避免为它们唤醒
+            while self._heap and not self._is_live(self._heap[0]):
+                heapq.heappop(self._heap)
+            
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            
+            for user_id, payload in self._pop_due(time.time()):
+                task = asyncio.create_task(self._fire(user_id, payload))
+                self._running[user_id] = task
+                task.add_done_callback(lambda t, user_id=user_id: self._on_fire_done(user_id, t))
+    
+    def _on_fire_done(self, user_id: str, task: asyncio.Task) -> None:
+        """回调结束后注销登记（同一用户的新回调已登记时保留新回调）"""
+        if self._running.get(user_id) is task:
+            del self._running[user_id]
+    
+    async def _fire(self, user_id: str, payload: Any) -> None:
+        try:
+            await self.handler(user_id, payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"用户 {user_id} 的状态到期处理出错: {e}")
+    
+    async def close(self) -> None:
+        """停止调度任务并取消正在执行的到期回调，未到期的条目会被丢弃"""
+        tasks = list(self._running.values())
+        if self._task is not None:
+            tasks.append(self._task)
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                logger.error(f"停止状态调度任务时出错: {e}")
+        self._task = None
+        self._running.clear()
+        self._heap.clear()
+        self._live.clear()
+        self._kind_counts.clear()
@@ -0,0 +1,139 @@
+import copy
+import time
+from typing import Dict, Any, List, Callable, Optional
+from astrbot.api import logger
+
+# 当前用户数据结构版本，新增或调整字段时递增并在 MIGRATIONS 中注册对应的迁移函数
+CURRENT_SCHEMA_VERSION = 4
+
+# 用户数据的完整默认结构，用户模板中未配置的字段从这里补齐
+DEFAULT_USER_FIELDS = {
+    "level": 1,
+    "exp": 0,
+    "max_exp": 1000,
+    "realm": "江湖好手",
+    "spirit_stones": 100,
+    "items": [],
+    "techniques": [],
+    "username": "",
+    "equipment": {"weapon": None, "armor": None, "accessory": None},
+    "stats": {"attack": 10, "defense": 10, "hp": 100, "max_hp": 100},
+    "inventory": {"pills": {}},
+    "last_practice_time": 0,
+    "last_adventure_time": 0,
+    "last_mine_time": 0,
+    "last_daily_time": 0,
+    "status": None,
+    "status_end_time": 0,
+    "status_start_time": 0,
+    "status_duration": 0,
+    "status_reward_multiplier": 0,
+    "last_steal_time": 0,
+    "last_duel_time": 0,
+    "last_breakthrough_time": 0,
+    "breakthrough_bonus": 0,
+    "has_started": False,
+    "daily_streak": 0,
+    "breakthrough_count": 0,
+    "group_id": None,
+    "unified_msg_origin": None,
+    "status_notify": False,
+    "status_id": None,
+}
+
+
+def _fill_defaults(user: Dict[str, Any], defaults: Dict[str, Any]) -> None:
+    """递归补齐缺失的字段，已有字段保持不变"""
+    for key, value in defaults.items():
+        if key not in user:
+            user[key] = copy.deepcopy(value)
+        elif isinstance(value, dict) and isinstance(user[key], dict):
+            _fill_defaults(user[key], value)
+
+
+def _migrate_v0_to_v1(user: Dict[str, Any], schema: "UserSchema") -> None:
+    """v0（无版本号的旧数据）→ v1：补齐完整的字段结构"""
+    _fill_defaults(user, schema.defaults)
+
+
+def _migrate_v1_to_v2(user: Dict[str, Any], schema: "UserSchema") -> None:
+    """v1 → v2：新增突破成功次数，旧数据按当前境界的序号估算（每次突破提升一个小境界）"""
+    user["breakthrough_count"] = max(schema.realm_index.get(user.get("realm"), 0), 0)
+
+
+def _migrate_v2_to_v3(user: Dict[str, Any], schema: "UserSchema") -> None:
+    """v2 → v3：新增状态完成提醒开关，旧数据默认关闭"""
+    user["status_notify"] = schema.defaults["status_notify"]
+
+
+def _migrate_v3_to_v4(user: Dict[str, Any], schema: "UserSchema") -> None:
+    """v3 → v4：新增状态结算ID，进行中的状态在首次建立结算队列时分配"""
+    user["status_id"] = None
+
+
+# 迁移函数注册表：键为迁移前的版本号，函数将用户数据原地升级到下一个版本
+MIGRATIONS: Dict[int, Callable[[Dict[str, Any], "UserSchema"], None]] = {
+    0: _migrate_v0_to_v1,
+    1: _migrate_v1_to_v2,
+    2: _migrate_v2_to_v3,
+    3: _migrate_v3_to_v4,
+}
+
+
+class UserSchema:
+    """用户数据结构管理
+    
+    负责根据用户模板创建新用户，并在加载时将旧版本的用户数据逐级迁移到当前版本，
+    迁移完成后所有用户数据都具有固定的字段结构，业务代码无需再逐次补齐默认值。
+    """
+    
+    def __init__(self, user_template: Dict[str, Any], realms_config: Optional[List[Dict[str, Any]]] = None):
+        # 用户模板优先，模板中缺失的字段使用内置默认值
+        self.defaults = copy.deepcopy(user_template)
+        _fill_defaults(self.defaults, DEFAULT_USER_FIELDS)
+        self.defaults["schema_version"] = CURRENT_SCHEMA_VERSION
+        # 境界名称到序号的映射，供需要根据境界推算数据的迁移使用
+        self.realm_index = {realm["name"]: i for i, realm in enumerate(realms_config or [])}
+    
+    def new_user(self) -> Dict[str, Any]:
+        """创建一份当前版本的新用户数据（深拷贝，不与模板共享嵌套对象）"""
+        return copy.deepcopy(self.defaults)
+    
+    def migrate(self, user: Dict[str, Any]) -> bool:
+        """将单个用户数据原地升级到当前版本
+        
+        Returns:
+            是否发生了迁移
+        """
+        version = user.get("schema_version", 0)
+        if version >= CURRENT_SCHEMA_VERSION:
+            return False
+        while version < CURRENT_SCHEMA_VERSION:
+            MIGRATIONS[version](user, self)
+            version += 1
+        user["schema_version"] = version
+        return True
+    
+    def migrate_all(self, users: Dict[str, Dict[str, Any]]) -> List[str]:
+        """升级所有用户数据，记录迁移数量与耗时
+        
+        Returns:
+            发生迁移的用户ID列表
+        """
+        start_time = time.perf_counter()
+        version_counts: Dict[int, int] = {}
+        migrated = []
+        for user_id, user in users.items():
+            version = user.get("schema_version", 0)
+            if self.migrate(user):
+                version_counts[version] = version_counts.get(version, 0) + 1
+                migrated.append(user_id)
+        
+        if migrated:
+            elapsed_ms = (time.perf_counter() - start_time) * 1000
+            detail = "，".join(f"v{version}: {count} 名" for version, count in sorted(version_counts.items()))
+            logger.info(
+                f"用户数据迁移完成，{len(migrated)}/{len(users)} 名用户升级至 v{CURRENT_SCHEMA_VERSION}"
+                f"（{detail}），耗时 {elapsed_ms:.1f} ms"
+            )
+        return migrated
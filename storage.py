@@ -0,0 +1,891 @@
+# 修仙游戏用户数据存储后端模块
+import os
+import gc
+import json
+import hashlib
+import sqlite3
+import marshal
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from itertools import count
+from typing import Dict, Any, Iterable, Iterator, Callable, List, Optional, Set, Tuple
+from astrbot.api import logger
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# 二进制快照文件头，后面紧跟格式名和换行符，JSON快照没有文件头
+SNAPSHOT_MAGIC = b"XIUXIAN-SNAPSHOT:"
+
+# 快照按块保存，每块包含的用户数；保存时只重新编码包含变更用户的块
+SNAPSHOT_CHUNK_SIZE = 100
+
+
+def atomic_write(file_path: str, data: bytes) -> None:
+    """原子地写入文件
+    
+    先写入同目录下的临时文件并fsync，再用 os.replace 替换目标文件，
+    写入过程中崩溃时目标文件要么是旧内容，要么是完整的新内容
+    
+    Args:
+        file_path: 目标文件路径
+        data: 要写入的内容
+    """
+    dir_path = os.path.dirname(file_path)
+    os.makedirs(dir_path, exist_ok=True)
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+    
+    # 同步目录项，确保重命名本身也已落盘（Windows不支持对目录fsync）
+    if os.name == "posix":
+        dir_fd = os.open(dir_path, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def plain_user(user: Any) -> Dict[str, Any]:
+    """将用户记录（UserRecord）转换为可直接序列化的字典，普通字典原样返回"""
+    to_dict = getattr(user, "to_dict", None)
+    return to_dict() if to_dict is not None else user
+
+
+def encode_user(user: Dict[str, Any]) -> str:
+    """将单个用户数据编码为紧凑JSON"""
+    return json.dumps(plain_user(user), ensure_ascii=False, separators=(",", ":"))
+
+
+def join_fragments(fragments: Dict[str, str]) -> bytes:
+    """将按用户编码好的JSON片段拼接成完整的快照内容"""
+    return b"{" + encode_json_chunk(fragments) + b"}"
+
+
+def encode_json_chunk(fragments: Dict[str, str]) -> bytes:
+    """将一块用户的JSON片段拼接为 "用户ID":{...},... 形式的对象成员"""
+    return ",".join(
+        f"{json.dumps(user_id, ensure_ascii=False)}:{fragment}"
+        for user_id, fragment in fragments.items()
+    ).encode("utf-8")
+
+
+class SnapshotCodec:
+    """
+    快照编解码器基类
+    快照由若干块组成，每块包含一批用户；单个用户先编码为片段（encode_user），
+    同一块的片段再编码为块（encode_chunk），最后把所有块拼接成快照文件（join_chunks）。
+    块的编码结果可以缓存，保存时只需重新编码包含变更用户的块
+    """
+    
+    name = ""
+    
+    def encode_user(self, user: Dict[str, Any]) -> Any:
+        raise NotImplementedError
+    
+    def encode_chunk(self, fragments: Dict[str, Any]) -> bytes:
+        raise NotImplementedError
+    
+    def join_chunks(self, chunks: List[bytes]) -> bytes:
+        raise NotImplementedError
+    
+    def load_chunks(self, data: bytes) -> List[Tuple[Optional[bytes], Dict[str, Any]]]:
+        """解析快照
+        
+        Returns:
+            (块的编码, 块中的用户数据) 列表，快照不是按块写入的（旧格式）时块的编码为None
+        """
+        raise NotImplementedError
+    
+    def join(self, fragments: Dict[str, Any]) -> bytes:
+        """将全部用户的片段按块编码并拼接成完整的快照内容"""
+        user_ids = list(fragments)
+        return self.join_chunks([
+            self.encode_chunk({user_id: fragments[user_id] for user_id in user_ids[i:i + SNAPSHOT_CHUNK_SIZE]})
+            for i in range(0, len(user_ids), SNAPSHOT_CHUNK_SIZE)
+        ])
+    
+    def load(self, data: bytes) -> Dict[str, Any]:
+        users = {}
+        for _, chunk_users in self.load_chunks(data):
+            users.update(chunk_users)
+        return users
+
+
+class JsonSnapshotCodec(SnapshotCodec):
+    """
+    JSON快照编解码器，每个用户编码为一段紧凑JSON
+    每块用户单独占一行，整个文件仍是一个合法的JSON对象，加载时可以逐行还原出各块的编码
+    """
+    
+    name = "json"
+    
+    def encode_user(self, user: Dict[str, Any]) -> str:
+        return encode_user(user)
+    
+    def encode_chunk(self, fragments: Dict[str, str]) -> bytes:
+        return encode_json_chunk(fragments)
+    
+    def join_chunks(self, chunks: List[bytes]) -> bytes:
+        return b"{" + b",\n".join(chunk for chunk in chunks if chunk) + b"}"
+    
+    def load_chunks(self, data: bytes) -> List[Tuple[Optional[bytes], Dict[str, Any]]]:
+        # 紧凑JSON中不会出现换行符，按行拆分即可得到各块；带缩进的旧格式拆分后无法解析，整体加载
+        body = data.strip()[1:-1]
+        try:
+            return [(chunk, json.loads(b"{" + chunk + b"}")) for chunk in body.split(b",\n") if chunk]
+        except ValueError:
+            return [(None, json.loads(data.decode("utf-8")))]
+
+
+class BinarySnapshotCodec(SnapshotCodec):
+    """
+    二进制快照编解码器
+    每块用户序列化为一个 {用户ID: 用户数据}，快照是这些块的列表；
+    加载时每块只需一次反序列化，比逐个用户解析快得多
+    """
+    
+    def __init__(self, name: str, dumps: Callable[[Any], bytes], loads: Callable[[bytes], Any]):
+        self.name = name
+        self._dumps = dumps
+        self._loads = loads
+        self._header = SNAPSHOT_MAGIC + name.encode("ascii") + b"\n"
+    
+    def encode_user(self, user: Dict[str, Any]) -> bytes:
+        return self._dumps(plain_user(user))
+    
+    def encode_chunk(self, fragments: Dict[str, bytes]) -> bytes:
+        return self._dumps({user_id: self._loads(fragment) for user_id, fragment in fragments.items()})
+    
+    def join_chunks(self, chunks: List[bytes]) -> bytes:
+        return self._header + self._dumps([chunk for chunk in chunks if chunk])
+    
+    def load_chunks(self, data: bytes) -> List[Tuple[Optional[bytes], Dict[str, Any]]]:
+        return [(chunk, self._loads(chunk)) for chunk in self._loads(data[len(self._header):])]
+
+
+def get_snapshot_codec(name: str):
+    """根据格式名获取快照编解码器
+    
+    Args:
+        name: json、marshal、pickle 或 msgpack
+    
+    Returns:
+        对应的编解码器，未知格式或缺少 msgpack 时回退为可用的格式
+    """
+    if name == "marshal":
+        return BinarySnapshotCodec("marshal", marshal.dumps, marshal.loads)
+    if name == "pickle":
+        return BinarySnapshotCodec("pickle", lambda obj: pickle.dumps(obj, protocol=5), pickle.loads)
+    if name == "msgpack":
+        if msgpack is not None:
+            return BinarySnapshotCodec(
+                "msgpack",
+                lambda obj: msgpack.packb(obj, use_bin_type=True),
+                lambda data: msgpack.unpackb(data, raw=False, strict_map_key=False)
+            )
+        logger.warning("未安装 msgpack，快照将使用 pickle 格式")
+        return get_snapshot_codec("pickle")
+    if name != "json":
+        logger.error(f"未知的快照格式 {name}，将使用JSON格式")
+    return JsonSnapshotCodec()
+
+
+def detect_snapshot_codec(data: bytes):
+    """根据文件头识别快照的格式"""
+    if data.startswith(SNAPSHOT_MAGIC):
+        header_end = data.index(b"\n")
+        return get_snapshot_codec(data[len(SNAPSHOT_MAGIC):header_end].decode("ascii"))
+    return JsonSnapshotCodec()
+
+
+class BaseStorage:
+    """
+    用户数据存储后端接口
+    XiuXianData 只通过此接口加载和保存用户数据，具体的存储格式由子类决定
+    
+    保存分为两步：prepare_save 在调用方线程（事件循环）中只编码变更的用户，
+    返回的写入任务再交给 StorageWriter 的后台线程执行磁盘I/O
+    """
+    
+    # 同一存储的多个待执行写入任务可以只保留最新一个时，返回合并键
+    coalesce_key: Optional[str] = None
+    
+    def load_all(self) -> Dict[str, Any]:
+        """加载全部用户数据
+        
+        Returns:
+            以用户ID为键的用户数据字典
+        """
+        raise NotImplementedError
+    
+    def prepare_save(self, users: Dict[str, Any], dirty_ids: Iterable[str]) -> Callable[[], None]:
+        """编码需要保存的用户数据
+        
+        Args:
+            users: 内存中的全部用户数据
+            dirty_ids: 自上次保存以来发生变更的用户ID
+        
+        Returns:
+            执行实际磁盘写入的任务，可以在其他线程中调用
+        """
+        raise NotImplementedError
+    
+    def save(self, users: Dict[str, Any], dirty_ids: Iterable[str]) -> None:
+        """同步保存用户数据"""
+        self.prepare_save(users, dirty_ids)()
+    
+    def is_empty(self) -> bool:
+        """存储中是否还没有任何用户数据"""
+        raise NotImplementedError
+    
+    def close(self) -> None:
+        """释放存储后端持有的资源"""
+        pass
+
+
+class SnapshotChunk:
+    """
+    快照中的一块用户
+    创建后不再修改（encoded 除外），用户变更时整块替换为新对象，
+    因此写入线程可以安全地持有旧块；块的编码在首次写入时由写入线程生成并缓存
+    """
+    
+    __slots__ = ("user_ids", "fragments", "encoded")
+    
+    def __init__(self, user_ids: Tuple[str, ...], fragments: Optional[Dict[str, Any]] = None,
+                 encoded: Optional[bytes] = None):
+        self.user_ids = user_ids
+        # 各用户的编码片段，从快照加载的块在其中有用户变更前为None
+        self.fragments = fragments
+        self.encoded = encoded
+
+
+class JsonFileStorage(BaseStorage):
+    """
+    单文件快照存储，每次保存都会原子地重写 user_data.json
+    默认使用紧凑JSON，也可以配置为二进制格式；加载时根据文件头自动识别格式，
+    因此切换格式后旧快照仍能读取，并在下一次保存时转换为新格式。
+    用户按加入顺序分成固定大小的块，每块的编码会被缓存：加载时直接沿用快照中各块的编码，
+    保存时只重新编码包含变更用户的块，其余块原样拼接，编码与写入都在后台线程完成
+    """
+    
+    coalesce_key = "snapshot"
+    
+    def __init__(self, file_path: str, snapshot_format: str = "json"):
+        self.file_path = file_path
+        self.codec = get_snapshot_codec(snapshot_format)
+        self._chunks: List[SnapshotChunk] = []
+        self._chunk_of: Dict[str, int] = {}
+        # 加载的快照无法沿用块编码（旧格式或格式已切换）时，需要在下次保存时重新编码的块
+        self._stale_chunks: Set[int] = set()
+    
+    def _read_snapshot(self) -> List[Tuple[Optional[bytes], Dict[str, Any]]]:
+        """读取快照文件的各块，并在日志中报告格式、大小和耗时"""
+        if not os.path.exists(self.file_path):
+            return []
+        try:
+            start_time = time.perf_counter()
+            with open(self.file_path, "rb") as f:
+                data = f.read()
+            codec = detect_snapshot_codec(data)
+            # 解析期间会创建大量容器对象，暂停垃圾回收可以避免反复的全量扫描
+            gc.disable()
+            try:
+                chunks = codec.load_chunks(data)
+            finally:
+                gc.enable()
+            elapsed_ms = (time.perf_counter() - start_time) * 1000
+            user_count = sum(len(chunk_users) for _, chunk_users in chunks)
+            logger.info(
+                f"已加载用户数据快照：格式 {codec.name}，大小 {len(data) / 1024:.1f} KB，"
+                f"{user_count} 名用户，耗时 {elapsed_ms:.1f} ms"
+            )
+            if codec.name != self.codec.name:
+                logger.info(f"快照将在下次保存时由 {codec.name} 格式转换为 {self.codec.name} 格式")
+                chunks = [(None, chunk_users) for _, chunk_users in chunks]
+            return chunks
+        except Exception as e:
+            logger.error(f"加载用户数据失败: {e}")
+            return []
+    
+    def load_all(self) -> Dict[str, Any]:
+        users = {}
+        self._chunks = []
+        self._chunk_of = {}
+        self._stale_chunks = set()
+        for encoded, chunk_users in self._read_snapshot():
+            users.update(chunk_users)
+            user_ids = tuple(chunk_users)
+            if encoded is not None and len(user_ids) <= SNAPSHOT_CHUNK_SIZE:
+                self._add_chunk(user_ids, encoded=encoded)
+                continue
+            for i in range(0, len(user_ids), SNAPSHOT_CHUNK_SIZE):
+                self._stale_chunks.add(self._add_chunk(user_ids[i:i + SNAPSHOT_CHUNK_SIZE]))
+        return users
+    
+    def _add_chunk(self, user_ids: Tuple[str, ...], **kwargs: Any) -> int:
+        index = len(self._chunks)
+        self._chunks.append(SnapshotChunk(user_ids, **kwargs))
+        for user_id in user_ids:
+            self._chunk_of[user_id] = index
+        return index
+    
+    def _assign_chunk(self, user_id: str, sizes: Dict[int, int]) -> int:
+        """为新用户分配所在的块：最后一块未满时加入，否则新建一块"""
+        index = len(self._chunks) - 1
+        if index < 0 or sizes.get(index, len(self._chunks[index].user_ids)) >= SNAPSHOT_CHUNK_SIZE:
+            index = self._add_chunk(())
+        sizes[index] = sizes.get(index, len(self._chunks[index].user_ids)) + 1
+        self._chunk_of[user_id] = index
+        return index
+    
+    def prepare_save(self, users: Dict[str, Any], dirty_ids: Iterable[str]) -> Callable[[], None]:
+        # 块序号 -> {用户ID: 新的编码片段，None 表示用户已删除}
+        changes: Dict[int, Dict[str, Any]] = {index: {} for index in self._stale_chunks}
+        self._stale_chunks = set()
+        sizes: Dict[int, int] = {}
+        for user_id in dirty_ids:
+            index = self._chunk_of.get(user_id)
+            if user_id in users:
+                if index is None:
+                    index = self._assign_chunk(user_id, sizes)
+                changes.setdefault(index, {})[user_id] = self.codec.encode_user(users[user_id])
+            elif index is not None:
+                del self._chunk_of[user_id]
+                changes.setdefault(index, {})[user_id] = None
+        
+        for index, chunk_changes in changes.items():
+            chunk = self._chunks[index]
+            if chunk.fragments is not None:
+                fragments = dict(chunk.fragments)
+            else:
+                # 块中其他用户的片段在首次有变更时才编码
+                fragments = {
+                    user_id: self.codec.encode_user(users[user_id])
+                    for user_id in chunk.user_ids
+                    if user_id in users and user_id not in chunk_changes
+                }
+            for user_id, fragment in chunk_changes.items():
+                if fragment is None:
+                    fragments.pop(user_id, None)
+                else:
+                    fragments[user_id] = fragment
+            self._chunks[index] = SnapshotChunk(tuple(fragments), fragments)
+        
+        # 块对象创建后不再修改，复制块列表即可在后台线程中安全地编码和拼接
+        chunks = list(self._chunks)
+        
+        def write():
+            for chunk in chunks:
+                if chunk.encoded is None:
+                    chunk.encoded = self.codec.encode_chunk(chunk.fragments)
+            atomic_write(self.file_path, self.codec.join_chunks([chunk.encoded for chunk in chunks]))
+        
+        return write
+    
+    def is_empty(self) -> bool:
+        return not os.path.exists(self.file_path)
+
+
+class SQLiteStorage(BaseStorage):
+    """SQLite存储，每个用户一行，保存时只在事务中写入发生变更的行"""
+    
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        # 连接在加载时由主线程使用，之后只由写入线程使用，不会并发访问
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        # WAL模式下写入不阻塞读取，崩溃后也能从日志中恢复
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS users (user_id TEXT PRIMARY KEY, data TEXT NOT NULL)"
+        )
+        self.conn.commit()
+    
+    def load_all(self) -> Dict[str, Any]:
+        users = {}
+        for user_id, data in self.conn.execute("SELECT user_id, data FROM users"):
+            try:
+                users[user_id] = json.loads(data)
+            except ValueError as e:
+                logger.error(f"解析用户 {user_id} 的数据失败: {e}")
+        return users
+    
+    def prepare_save(self, users: Dict[str, Any], dirty_ids: Iterable[str]) -> Callable[[], None]:
+        upserts = []
+        deletes = []
+        for user_id in dirty_ids:
+            if user_id in users:
+                upserts.append((user_id, encode_user(users[user_id])))
+            else:
+                deletes.append((user_id,))
+        
+        def write():
+            # 同一批变更在一个事务中提交，要么全部写入，要么全部回滚
+            with self.conn:
+                if upserts:
+                    self.conn.executemany(
+                        "INSERT INTO users (user_id, data) VALUES (?, ?) "
+                        "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data",
+                        upserts
+                    )
+                if deletes:
+                    self.conn.executemany("DELETE FROM users WHERE user_id = ?", deletes)
+        
+        return write
+    
+    def is_empty(self) -> bool:
+        return self.conn.execute("SELECT 1 FROM users LIMIT 1").fetchone() is None
+    
+    def close(self) -> None:
+        self.conn.close()
+
+
+class JournalStorage(JsonFileStorage):
+    """
+    快照+追加日志存储
+    每次保存只把变更用户中发生变化的字段以一行紧凑的JSON追加到日志文件，
+    日志记录数达到阈值时把内存数据折叠成新的快照并清空日志。
+    启动时先加载最近的快照，再按顺序重放日志。
+    """
+    
+    # 日志追加必须逐条执行，不能合并
+    coalesce_key = None
+    
+    def __init__(self, file_path: str, journal_path: str, compact_threshold: int = 10000,
+                 snapshot_format: str = "json"):
+        super().__init__(file_path, snapshot_format)
+        self.journal_path = journal_path
+        self.compact_threshold = compact_threshold
+        # 每个用户最近一次落盘时各字段的JSON编码，用于计算字段级增量
+        self._persisted: Dict[str, Dict[str, str]] = {}
+        # 日志追加失败的用户，下次保存时不再计算增量，写入完整字段（已删除的用户重新写入删除记录）
+        self._resync: Set[str] = set()
+        self._journal_records = 0
+        self._journal_file = None
+    
+    def _encode_fields(self, user: Dict[str, Any]) -> Dict[str, str]:
+        """将用户数据的每个顶层字段编码为紧凑JSON"""
+        return {
+            key: json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+            for key, value in plain_user(user).items()
+        }
+    
+    def _replay_journal(self, users: Dict[str, Any]) -> int:
+        """按顺序把日志中的增量记录应用到快照数据上
+        
+        Returns:
+            成功重放的记录数
+        """
+        if not os.path.exists(self.journal_path):
+            return 0
+        
+        replayed = 0
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 只可能是崩溃时写了一半的最后一条记录，丢弃它及之后的内容
+                    logger.warning(f"用户数据日志第 {line_no} 行不完整，已忽略之后的记录")
+                    break
+                
+                user_id = record["u"]
+                if record.get("d"):
+                    users.pop(user_id, None)
+                    continue
+                user = users.setdefault(user_id, {})
+                user.update(record.get("f", {}))
+                for key in record.get("r", []):
+                    user.pop(key, None)
+                replayed += 1
+        return replayed
+    
+    def load_all(self) -> Dict[str, Any]:
+        users = {}
+        for _, chunk_users in self._read_snapshot():
+            users.update(chunk_users)
+        replayed = self._replay_journal(users)
+        self._persisted = {user_id: self._encode_fields(user) for user_id, user in users.items()}
+        if replayed:
+            logger.info(f"已从用户数据日志重放 {replayed} 条记录")
+        if os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) > 0:
+            # 重放完成后立即折叠成新快照，保证之后的追加不会接在残缺的记录后面
+            self._prepare_compact()()
+        return users
+    
+    def prepare_save(self, users: Dict[str, Any], dirty_ids: Iterable[str]) -> Callable[[], None]:
+        lines = []
+        line_ids = []
+        for user_id in dirty_ids:
+            key = json.dumps(user_id, ensure_ascii=False)
+            resync = user_id in self._resync
+            self._resync.discard(user_id)
+            persisted = self._persisted.get(user_id, {})
+            
+            if user_id not in users:
+                if user_id in self._persisted or resync:
+                    lines.append(f'{{"u":{key},"d":1}}\n')
+                    line_ids.append(user_id)
+                    self._persisted.pop(user_id, None)
+                continue
+            
+            encoded = self._encode_fields(users[user_id])
+            changed = [
+                f"{json.dumps(field, ensure_ascii=False)}:{value}"
+                for field, value in encoded.items()
+                if resync or persisted.get(field) != value
+            ]
+            removed = [field for field in persisted if field not in encoded]
+            if not changed and not removed:
+                continue
+            
+            line = f'{{"u":{key},"f":{{{",".join(changed)}}}'
+            if removed:
+                line += f',"r":{json.dumps(removed, ensure_ascii=False)}'
+            lines.append(line + "}\n")
+            line_ids.append(user_id)
+            # 整体替换而不是原地修改，后台线程持有的旧引用不受影响
+            self._persisted[user_id] = encoded
+        
+        self._journal_records += len(lines)
+        compact = None
+        if self._journal_records >= self.compact_threshold:
+            compact = self._prepare_compact()
+        
+        def write():
+            if lines:
+                try:
+                    self._append_journal("".join(lines))
+                except Exception:
+                    # _persisted 已经记为这批数据，但日志没有写入，重试时必须写入完整字段，否则增量为空、变更丢失
+                    self._resync.update(line_ids)
+                    raise
+            if compact:
+                compact()
+        
+        return write
+    
+    def _append_journal(self, data: str) -> None:
+        """追加日志记录并落盘"""
+        if self._journal_file is None:
+            os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+            self._journal_file = open(self.journal_path, "a", encoding="utf-8")
+        self._journal_file.write(data)
+        self._journal_file.flush()
+        os.fsync(self._journal_file.fileno())
+    
+    def _prepare_compact(self) -> Callable[[], None]:
+        """准备折叠任务：把当前数据写成新快照并清空日志
+        
+        快照写入成功后才截断日志；若在两步之间崩溃，重放日志到新快照上结果不变
+        """
+        persisted = dict(self._persisted)
+        self._journal_records = 0
+        
+        def compact():
+            fragments = {
+                user_id: "{" + ",".join(
+                    f"{json.dumps(field, ensure_ascii=False)}:{value}" for field, value in fields.items()
+                ) + "}"
+                for user_id, fields in persisted.items()
+            }
+            if self.codec.name != "json":
+                fragments = {
+                    user_id: self.codec.encode_user(json.loads(fragment))
+                    for user_id, fragment in fragments.items()
+                }
+            atomic_write(self.file_path, self.codec.join(fragments))
+            if self._journal_file is not None:
+                self._journal_file.close()
+                self._journal_file = None
+            with open(self.journal_path, "w", encoding="utf-8"):
+                pass
+            logger.info(f"用户数据日志已折叠为快照，共 {len(persisted)} 名用户")
+        
+        return compact
+    
+    def is_empty(self) -> bool:
+        return super().is_empty() and (
+            not os.path.exists(self.journal_path) or os.path.getsize(self.journal_path) == 0
+        )
+    
+    def close(self) -> None:
+        if self._journal_file is not None:
+            self._journal_file.close()
+            self._journal_file = None
+
+
+class ShardedJsonStorage(BaseStorage):
+    """
+    按哈希分片的JSON存储
+    用户按ID的哈希值分布到 users/<哈希前缀>/<分片>.json 中，每个分片只包含少量用户，
+    保存时只重写包含变更用户的分片，各目录也可以单独备份和恢复
+    """
+    
+    def __init__(self, root_dir: str, shard_hex_digits: int = 2):
+        self.root_dir = root_dir
+        self.shard_hex_digits = shard_hex_digits
+        self._fragments: Dict[str, str] = {}
+        self._shard_members: Dict[str, Set[str]] = {}
+    
+    def shard_path(self, user_id: str) -> str:
+        """计算用户所在分片文件的路径"""
+        digest = hashlib.md5(user_id.encode("utf-8")).hexdigest()
+        shard_name = digest[2:2 + self.shard_hex_digits]
+        return os.path.join(self.root_dir, digest[:2], f"{shard_name}.json")
+    
+    def iter_shards(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """逐个读取分片文件
+        
+        Yields:
+            (分片文件路径, 该分片中的用户数据)
+        """
+        if not os.path.isdir(self.root_dir):
+            return
+        for prefix in sorted(os.listdir(self.root_dir)):
+            prefix_dir = os.path.join(self.root_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for file_name in sorted(os.listdir(prefix_dir)):
+                if not file_name.endswith(".json"):
+                    continue
+                path = os.path.join(prefix_dir, file_name)
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        yield path, json.load(f)
+                except Exception as e:
+                    logger.error(f"加载用户数据分片 {path} 失败: {e}")
+    
+    def iter_users(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """逐个分片遍历全部用户，不需要一次性读入所有分片"""
+        for _, shard in self.iter_shards():
+            yield from shard.items()
+    
+    def load_all(self) -> Dict[str, Any]:
+        users = {}
+        for path, shard in self.iter_shards():
+            for user_id, user in shard.items():
+                users[user_id] = user
+                # 以计算出的分片为准，手动恢复到错误位置的数据会在下次保存时归位
+                self._shard_members.setdefault(self.shard_path(user_id), set()).add(user_id)
+        return users
+    
+    def prepare_save(self, users: Dict[str, Any], dirty_ids: Iterable[str]) -> Callable[[], None]:
+        dirty_shards = set()
+        for user_id in dirty_ids:
+            path = self.shard_path(user_id)
+            dirty_shards.add(path)
+            if user_id in users:
+                self._fragments[user_id] = encode_user(users[user_id])
+                self._shard_members.setdefault(path, set()).add(user_id)
+            else:
+                self._fragments.pop(user_id, None)
+                self._shard_members.get(path, set()).discard(user_id)
+        
+        shards = {}
+        for path in dirty_shards:
+            members = self._shard_members.get(path, set())
+            for user_id in list(members):
+                if user_id not in users:
+                    # 已被删除但尚未标记为待写入的用户，与上面删除的用户一样移出分片
+                    self._fragments.pop(user_id, None)
+                    members.discard(user_id)
+                elif user_id not in self._fragments:
+                    # 加载后未变更过的用户在所在分片首次重写时才编码
+                    self._fragments[user_id] = encode_user(users[user_id])
+            shards[path] = {user_id: self._fragments[user_id] for user_id in members}
+        
+        def write():
+            for path, fragments in shards.items():
+                if fragments:
+                    atomic_write(path, join_fragments(fragments))
+                elif os.path.exists(path):
+                    os.remove(path)
+        
+        return write
+    
+    def is_empty(self) -> bool:
+        return not self._shard_members and next(self.iter_shards(), None) is None
+
+
+class StorageWriter:
+    """
+    存储写入线程
+    所有磁盘写入都按提交顺序在同一个后台线程中执行，事件循环只负责提交任务；
+    可合并的任务（如整份快照）提交时，如果队尾是尚未开始执行的同类任务，则用新任务替换它，避免重复写入。
+    只合并队尾的任务：替换更早的任务会让新任务越过在它之后提交的写入（如结算队列的写入），破坏写入顺序
+    """
+    
+    def __init__(self):
+        self._pending: "OrderedDict[Any, Any]" = OrderedDict()
+        self._condition = threading.Condition()
+        self._sequence = count()
+        self._busy = False
+        self._closed = False
+        self._failed_ids: Set[str] = set()
+        # 写入失败后尚未重新写入成功的用户，与 _failed_ids 不同，取出重试时不会清空
+        self._unsaved_ids: Set[str] = set()
+        self._thread = threading.Thread(target=self._run, name="xiuxian-storage-writer", daemon=True)
+        self._thread.start()
+    
+    def submit(self, job: Callable[[], None], user_ids: Iterable[str], coalesce_key: Optional[str] = None) -> None:
+        """提交写入任务
+        
+        Args:
+            job: 执行磁盘写入的任务
+            user_ids: 该任务包含的用户ID，写入失败时会被重新标记为待写入
+            coalesce_key: 合并键，队尾的待执行任务合并键相同时被新任务替换
+        """
+        user_ids = set(user_ids)
+        with self._condition:
+            last_key = next(reversed(self._pending), None)
+            if coalesce_key is not None and last_key is not None and self._pending[last_key][0] == coalesce_key:
+                # 被替换的任务中的用户也由新任务负责
+                user_ids |= self._pending[last_key][2]
+                self._pending[last_key] = (coalesce_key, job, user_ids)
+            else:
+                self._pending[next(self._sequence)] = (coalesce_key, job, user_ids)
+            self._condition.notify_all()
+    
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                _, (_, job, user_ids) = self._pending.popitem(last=False)
+                self._busy = True
+            
+            try:
+                job()
+            except Exception as e:
+                logger.error(f"写入用户数据失败: {e}")
+                with self._condition:
+                    self._failed_ids |= user_ids
+                    self._unsaved_ids |= user_ids
+            else:
+                if user_ids:
+                    with self._condition:
+                        self._unsaved_ids -= user_ids
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
+    
+    def pop_failed(self) -> Set[str]:
+        """取出写入失败、需要重新保存的用户ID"""
+        with self._condition:
+            failed, self._failed_ids = self._failed_ids, set()
+        return failed
+    
+    def all_saved(self) -> bool:
+        """写入失败的用户是否都已重新写入成功"""
+        with self._condition:
+            return not self._unsaved_ids
+    
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """阻塞等待所有已提交的任务执行完毕
+        
+        Returns:
+            是否在超时前全部完成
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending and not self._busy, timeout)
+    
+    def close(self) -> None:
+        """执行完剩余任务后停止写入线程"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+
+def export_users(fragments: Dict[str, str], file_path: str) -> None:
+    """将按用户编码好的紧凑JSON片段导出为带缩进的JSON文件，便于人工查看和编辑
+    
+    片段都是不可变的字符串，格式化与写入可以在后台线程中进行
+    
+    Args:
+        fragments: 用户ID -> encode_user 编码的用户数据
+        file_path: 导出文件路径
+    """
+    data = json.dumps(json.loads(join_fragments(fragments)), ensure_ascii=False, indent=4)
+    atomic_write(file_path, data.encode("utf-8"))
+
+
+def migrate_legacy_json(storage: BaseStorage, legacy_file: str) -> int:
+    """将旧版 user_data.json 一次性导入新的存储后端
+    
+    仅当目标存储为空且旧文件存在时执行，导入成功后旧文件会被重命名为 .migrated，避免重复导入
+    
+    Args:
+        storage: 目标存储后端
+        legacy_file: 旧版 user_data.json 路径
+    
+    Returns:
+        导入的用户数量
+    """
+    if not os.path.exists(legacy_file) or not storage.is_empty():
+        return 0
+    
+    users = JsonFileStorage(legacy_file).load_all()
+    if not users:
+        return 0
+    
+    storage.save(users, users.keys())
+    os.replace(legacy_file, legacy_file + ".migrated")
+    logger.info(f"已将 {len(users)} 名用户的数据从 {legacy_file} 迁移到新的存储后端")
+    return len(users)
+
+
+def create_storage(data_dir: str, persistence_config: Dict[str, Any]) -> BaseStorage:
+    """根据持久化配置创建存储后端
+    
+    Args:
+        data_dir: 数据目录
+        persistence_config: system.json 中的 persistence 配置
+    
+    Returns:
+        存储后端实例
+    """
+    legacy_file = os.path.join(data_dir, "user_data.json")
+    backend = persistence_config.get("backend", "json")
+    
+    if backend == "sqlite":
+        storage = SQLiteStorage(os.path.join(data_dir, "user_data.db"))
+        migrate_legacy_json(storage, legacy_file)
+        return storage
+    
+    snapshot_format = persistence_config.get("snapshot_format", "json")
+    if backend == "journal":
+        return JournalStorage(
+            legacy_file,
+            os.path.join(data_dir, "user_data.journal"),
+            persistence_config.get("journal_compact_records", 10000),
+            snapshot_format
+        )
+    
+    if backend == "sharded":
+        storage = ShardedJsonStorage(
+            os.path.join(data_dir, "users"),
+            persistence_config.get("shard_hex_digits", 2)
+        )
+        migrate_legacy_json(storage, legacy_file)
+        return storage
+    
+    if backend != "json":
+        logger.error(f"未知的存储后端 {backend}，将使用JSON文件存储")
+    return JsonFileStorage(legacy_file, snapshot_format)
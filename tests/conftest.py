@@ -0,0 +1,52 @@
+import importlib.machinery
+import importlib.util
+import os
+import shutil
+import sys
+
+import pytest
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = "astrbot_plugin_xiuxian"
+
+try:
+    import astrbot.api  # noqa: F401
+except ImportError:
+    # 插件依赖 AstrBot 提供的 logger 等接口，未安装 AstrBot 时跳过全部测试
+    collect_ignore_glob = ["test_*.py"]
+else:
+    # AstrBot 以包的形式加载插件（模块之间使用相对导入），测试中同样把仓库根目录注册为一个包
+    if PACKAGE not in sys.modules:
+        spec = importlib.machinery.ModuleSpec(PACKAGE, None, is_package=True)
+        spec.submodule_search_locations = [PLUGIN_DIR]
+        sys.modules[PACKAGE] = importlib.util.module_from_spec(spec)
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """带有插件默认配置的临时数据目录"""
+    shutil.copytree(os.path.join(PLUGIN_DIR, "data", "configs"), tmp_path / "configs")
+    return str(tmp_path)
+
+
+@pytest.fixture
+def open_data(data_dir):
+    """打开临时数据目录中的 XiuXianData，测试结束时关闭仍未关闭的实例
+    
+    返回的函数可以传入 close=旧实例，先关闭旧实例再重新打开，模拟插件重启
+    """
+    from astrbot_plugin_xiuxian.xiuxian_data import XiuXianData
+    
+    opened = []
+    
+    def open_data(close=None):
+        if close is not None:
+            close.close()
+            opened.remove(close)
+        data = XiuXianData(data_dir)
+        opened.append(data)
+        return data
+    
+    yield open_data
+    for data in opened:
+        data.close()
@@ -0,0 +1,55 @@
+import asyncio
+
+from astrbot_plugin_xiuxian.actor import UserCommandQueue
+from astrbot_plugin_xiuxian.locks import UserLockManager
+
+
+def test_read_only_commands_beyond_the_rate_limit_are_dropped():
+    queue = UserCommandQueue(UserLockManager(), rate=0.001, burst=3)
+    
+    async def produce():
+        return ["ok"]
+    
+    async def main():
+        spam = await asyncio.gather(*[queue.run(["1001"], produce, read_only=True) for _ in range(10)])
+        other = await queue.run(["1002"], produce, read_only=True)
+        return spam, other
+    
+    spam, other = asyncio.run(main())
+    assert spam.count(["ok"]) == 3
+    assert spam.count(None) == 7
+    # 频率限制按发送者分别计算
+    assert other == ["ok"]
+
+
+def test_rate_limited_mutating_commands_are_queued_in_order():
+    queue = UserCommandQueue(UserLockManager(), rate=50, burst=2)
+    executed = []
+    
+    def producer(index):
+        async def produce():
+            executed.append(index)
+            return [index]
+        return produce
+    
+    async def main():
+        return await asyncio.gather(*[queue.run(["1001"], producer(index)) for index in range(6)])
+    
+    # 超出频率限制的指令等待令牌后执行，不会被丢弃
+    assert asyncio.run(main()) == [[index] for index in range(6)]
+    assert executed == list(range(6))
+
+
+def test_cached_reply_requires_same_version_and_expires():
+    queue = UserCommandQueue(UserLockManager(), reply_ttl=60)
+    key = ("1001", "xiuxian_info", (), ())
+    replies = [{"text": "info"}]
+    queue.remember_reply(key, 3, replies)
+    
+    cached = queue.cached_reply(key, 3)
+    assert cached == replies and cached is not replies
+    assert queue.cached_reply(key, 4) is None
+    
+    queue.reply_ttl = 0
+    queue.remember_reply(("1002", "xiuxian_info", (), ()), 1, replies)
+    assert queue.cached_reply(("1002", "xiuxian_info", (), ()), 1) is None
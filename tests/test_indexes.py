@@ -0,0 +1,42 @@
+import asyncio
+
+
+def start_user(data, user_id, **fields):
+    """注册一名已开始修仙的用户"""
+    user = data.get_user(user_id)
+    user.update(has_started=True, username=user_id, **fields)
+    data._mark_dirty(user_id)
+
+
+def reopen_with_users(open_data, count):
+    """写入 count 名用户后重新打开，得到索引尚未建立的实例"""
+    data = open_data()
+    for index in range(count):
+        start_user(data, str(1000 + index), level=index + 1, spirit_stones=index * 10)
+    return open_data(close=data)
+
+
+def test_indexes_are_not_built_at_startup(open_data):
+    data = reopen_with_users(open_data, 5)
+    
+    assert len(data.columns) == 0
+    # 首次查询时同步补齐索引
+    assert data.get_world_stats()["total_users"] == 5
+    assert [user_id for user_id, _ in data.get_top_users(3)] == ["1004", "1003", "1002"]
+
+
+def test_changes_during_background_build_are_indexed(open_data):
+    data = reopen_with_users(open_data, 5)
+    
+    # 先建立一部分索引，随后修改已索引与未索引的用户并新建用户
+    assert not data._index_users(2)
+    data.add_spirit_stones("1000", 1000)
+    data.add_spirit_stones("1004", 1000)
+    start_user(data, "2000", level=99, spirit_stones=0)
+    asyncio.run(data.build_indexes(batch_size=2))
+    
+    assert data._unindexed is None
+    assert len(data.columns) == 6
+    assert data.columns.total("spirit_stones") == 100 + 2000
+    assert data.get_top_users(1)[0][0] == "2000"
+    assert [row[0] for row in data.get_metric_rank("spirit_stones", 2)["rows"]] == ["1004", "1000"]
@@ -0,0 +1,176 @@
+import json
+import os
+import threading
+import time
+
+from astrbot_plugin_xiuxian import storage
+from astrbot_plugin_xiuxian.jobs import StatusJobQueue
+
+
+def test_claim_is_exclusive_until_released(tmp_path):
+    queue = StatusJobQueue(str(tmp_path / "status_jobs.json"))
+    queue.enqueue("s1", "1001", 100)
+    
+    assert queue.claim("s1") == ("1001", 100)
+    assert queue.claim("s1") is None
+    queue.release("s1")
+    assert queue.claim("s1") == ("1001", 100)
+    assert queue.claim("missing") is None
+
+
+def test_ack_is_idempotent(tmp_path):
+    queue = StatusJobQueue(str(tmp_path / "status_jobs.json"))
+    queue.enqueue("s1", "1001", 100)
+    
+    queue.ack("s1")
+    queue.ack("s1")
+    queue.ack("missing")
+    assert "s1" not in queue
+    assert len(queue) == 0
+
+
+def test_acked_jobs_stay_on_disk_until_data_is_written(tmp_path):
+    path = str(tmp_path / "status_jobs.json")
+    queue = StatusJobQueue(path)
+    queue.enqueue("s1", "1001", 100)
+    queue.enqueue("s2", "1002", 200)
+    queue.prepare_before_data()()
+    queue.prepare_after_data()
+    
+    queue.ack("s1")
+    queue.enqueue("s3", "1003", 300)
+    
+    # 用户数据之前写入：新任务已加入，已确认的任务仍然保留
+    queue.prepare_before_data()()
+    assert set(StatusJobQueue(path).jobs) == {"s1", "s2", "s3"}
+    
+    # 用户数据之后写入：已确认的任务被移除
+    queue.prepare_after_data()()
+    assert set(StatusJobQueue(path).jobs) == {"s2", "s3"}
+    assert not queue.dirty
+
+
+def test_due_jobs_are_sorted_by_due_time(tmp_path):
+    queue = StatusJobQueue(str(tmp_path / "status_jobs.json"))
+    queue.enqueue("late", "1001", 300)
+    queue.enqueue("early", "1002", 100)
+    queue.enqueue("future", "1003", 10 ** 12)
+    
+    assert queue.due(1000) == ["early", "late"]
+
+
+def start_expired_status(data, user_id):
+    """让用户进入一个已经到期的探索状态，返回其结算ID"""
+    user = data.get_user(user_id)
+    user.update(has_started=True, username=user_id)
+    data.set_status(user_id, "探索中", 1)
+    status_id = user["status_id"]
+    user["status_end_time"] = int(time.time()) - 1
+    data.status_jobs.enqueue(status_id, user_id, user["status_end_time"])
+    data._mark_dirty(user_id)
+    return status_id
+
+
+def test_status_job_is_settled_exactly_once(open_data):
+    data = open_data()
+    status_id = start_expired_status(data, "1001")
+    
+    settled = data.settle_status_job(status_id)
+    assert settled is not None and settled[1]["success"]
+    rewarded = data.users["1001"].to_dict()
+    
+    assert data.settle_status_job(status_id) is None
+    assert data.settle_status_jobs([status_id]) == []
+    assert data.users["1001"].to_dict() == rewarded
+    assert data.users["1001"]["status"] is None
+
+
+def test_replaced_status_is_acknowledged_without_reward(open_data):
+    data = open_data()
+    old_status_id = start_expired_status(data, "1001")
+    new_status_id = start_expired_status(data, "1001")
+    before = data.users["1001"]["spirit_stones"], data.users["1001"]["exp"]
+    
+    result = data.complete_status("1001", old_status_id)
+    assert not result["success"]
+    assert (data.users["1001"]["spirit_stones"], data.users["1001"]["exp"]) == before
+    assert old_status_id not in data.status_jobs
+    assert new_status_id in data.status_jobs
+
+
+def test_pending_jobs_survive_restart(open_data):
+    data = open_data()
+    status_id = start_expired_status(data, "1001")
+    
+    data = open_data(close=data)
+    assert status_id in data.status_jobs
+    assert data.settle_status_job(status_id)[1]["success"]
+    
+    data = open_data(close=data)
+    assert status_id not in data.status_jobs
+    assert data.users["1001"]["status_id"] is None
+
+
+def test_queue_file_covers_data_file_while_snapshot_is_pending(open_data, monkeypatch):
+    data = open_data()
+    for user_id in ("1001", "1002"):
+        data.get_user(user_id).update(has_started=True, username=user_id)
+        data._mark_dirty(user_id)
+    data.flush()
+    data.writer.wait_idle()
+    
+    # 每次写入用户数据时，磁盘上的结算队列都应包含其中所有进行中的状态
+    missing = []
+    original_write = storage.atomic_write
+    
+    def checked_write(file_path, payload):
+        if os.path.basename(file_path) == "user_data.json":
+            with open(data.status_jobs.file_path, "r", encoding="utf-8") as f:
+                queued = json.load(f)["jobs"]
+            missing.extend(
+                user_id for user_id, user in json.loads(payload).items()
+                if user["status_id"] is not None and user["status_id"] not in queued
+            )
+        original_write(file_path, payload)
+    
+    monkeypatch.setattr(storage, "atomic_write", checked_write)
+    
+    # 阻塞写入线程，在上一次保存的快照任务仍在排队时再次保存
+    gate = threading.Event()
+    data.writer.submit(gate.wait, ())
+    data.set_status("1001", "探索中", 1)
+    data.flush()
+    data.set_status("1002", "探索中", 1)
+    data.flush()
+    gate.set()
+    data.writer.wait_idle()
+    
+    assert missing == []
+    data = open_data(close=data)
+    assert sorted(user_id for user_id, _ in data.status_jobs.jobs.values()) == ["1001", "1002"]
+
+
+def test_acked_job_stays_queued_while_data_write_fails(open_data, monkeypatch):
+    data = open_data()
+    status_id = start_expired_status(data, "1001")
+    data.flush()
+    data.writer.wait_idle()
+    
+    original_write = storage.atomic_write
+    
+    def failing_write(file_path, payload):
+        if os.path.basename(file_path) == "user_data.json":
+            raise OSError("磁盘已满")
+        original_write(file_path, payload)
+    
+    monkeypatch.setattr(storage, "atomic_write", failing_write)
+    assert data.settle_status_job(status_id)[1]["success"]
+    data.flush()
+    data.writer.wait_idle()
+    
+    # 磁盘上的用户仍处于该状态，结算任务不能移出队列文件
+    assert status_id in StatusJobQueue(data.status_jobs.file_path).jobs
+    
+    monkeypatch.setattr(storage, "atomic_write", original_write)
+    data = open_data(close=data)
+    assert data.users["1001"]["status_id"] is None
@@ -0,0 +1,73 @@
+import asyncio
+import gc
+
+from astrbot_plugin_xiuxian.locks import UserLockManager
+
+
+def test_same_user_is_serialized_and_other_users_are_not():
+    locks = UserLockManager()
+    events = []
+    
+    async def operation(user_id, tag, delay):
+        async with locks.hold(user_id):
+            events.append((tag, "enter"))
+            await asyncio.sleep(delay)
+            events.append((tag, "exit"))
+    
+    async def main():
+        await asyncio.gather(operation("a", 1, 0.02), operation("a", 2, 0), operation("b", 3, 0))
+    
+    asyncio.run(main())
+    # 同一用户的第二个操作等到第一个结束后才开始，其他用户不受影响
+    assert events.index((2, "enter")) > events.index((1, "exit"))
+    assert events.index((3, "exit")) < events.index((1, "exit"))
+
+
+def test_locks_are_acquired_in_user_id_order():
+    locks = UserLockManager()
+    acquired = []
+    
+    async def main():
+        for user_id in ("a", "b", "c", "d"):
+            lock = locks.get(user_id)
+            original = lock.acquire
+            
+            async def acquire(user_id=user_id, original=original):
+                acquired.append(user_id)
+                return await original()
+            
+            lock.acquire = acquire
+        async with locks.hold("d", "b", "c", "a", "b"):
+            assert all(locks.locked(user_id) for user_id in "abcd")
+        assert not any(locks.locked(user_id) for user_id in "abcd")
+    
+    asyncio.run(main())
+    assert acquired == ["a", "b", "c", "d"]
+
+
+def test_crossed_multi_user_operations_do_not_deadlock():
+    locks = UserLockManager()
+    
+    async def operation(first, second):
+        async with locks.hold(first, second):
+            await asyncio.sleep(0.001)
+    
+    async def main():
+        await asyncio.wait_for(asyncio.gather(*(
+            operation(*pair) for _ in range(50) for pair in (("a", "b"), ("b", "a"))
+        )), timeout=5)
+    
+    asyncio.run(main())
+
+
+def test_lock_pool_is_bounded():
+    locks = UserLockManager(max_cached=10)
+    
+    async def main():
+        for i in range(1000):
+            async with locks.hold(str(i), str(i + 1)):
+                pass
+    
+    asyncio.run(main())
+    gc.collect()
+    assert len(locks) <= 10
@@ -0,0 +1,21 @@
+from astrbot_plugin_xiuxian.outbox import NotificationOutbox
+
+
+async def send(origin, message):
+    pass
+
+
+def test_full_buckets_are_pruned():
+    outbox = NotificationOutbox(send, rate=1000, burst=3)
+    busy = outbox._bucket("group:busy")
+    for _ in range(3):
+        busy.try_acquire()
+    busy.rate = 0.001
+    
+    for index in range(2000):
+        outbox._bucket(f"group:{index}")
+    
+    # 没有消耗过令牌的令牌桶与新建的等价，超过清理阈值时被移除，仍在限流中的令牌桶保留
+    assert len(outbox._buckets) <= outbox._prune_size
+    assert outbox._buckets.get("group:busy") is busy
+
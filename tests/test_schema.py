@@ -0,0 +1,74 @@
+import json
+import os
+
+from astrbot_plugin_xiuxian.schema import CURRENT_SCHEMA_VERSION, DEFAULT_USER_FIELDS, MIGRATIONS, UserSchema
+
+REALMS = [{"name": "江湖好手", "level": 1}, {"name": "凡人", "level": 2}, {"name": "练气一层", "level": 3}]
+
+
+def make_schema():
+    return UserSchema({"spirit_stones": 200}, REALMS)
+
+
+def test_every_old_version_has_a_migration():
+    assert sorted(MIGRATIONS) == list(range(CURRENT_SCHEMA_VERSION))
+
+
+def test_new_user_has_current_version_and_template_values():
+    user = make_schema().new_user()
+    assert user["schema_version"] == CURRENT_SCHEMA_VERSION
+    assert user["spirit_stones"] == 200
+    assert set(DEFAULT_USER_FIELDS) <= set(user)
+
+
+def test_unversioned_user_is_filled_and_upgraded():
+    user = {"level": 3, "realm": "练气一层", "stats": {"attack": 30}}
+    assert make_schema().migrate(user)
+    
+    assert user["schema_version"] == CURRENT_SCHEMA_VERSION
+    # 已有的字段保持不变，缺失的字段（包括嵌套字段）补齐
+    assert user["level"] == 3
+    assert user["stats"] == {"attack": 30, "defense": 10, "hp": 100, "max_hp": 100}
+    assert user["spirit_stones"] == 200
+    assert user["status_notify"] is False
+    assert user["status_id"] is None
+    # v1 → v2 按当前境界的序号估算突破次数
+    assert user["breakthrough_count"] == 2
+
+
+def test_migration_runs_only_once():
+    schema = make_schema()
+    user = {"level": 1}
+    assert schema.migrate(user)
+    snapshot = dict(user)
+    assert not schema.migrate(user)
+    assert user == snapshot
+
+
+def test_partial_upgrade_keeps_existing_fields():
+    schema = make_schema()
+    user = schema.new_user()
+    user["schema_version"] = 2
+    user["breakthrough_count"] = 7
+    del user["status_notify"]
+    del user["status_id"]
+    
+    assert schema.migrate(user)
+    assert user["breakthrough_count"] == 7
+    assert user["status_notify"] is False
+    assert user["status_id"] is None
+
+
+def test_old_users_are_migrated_and_written_back_at_load(data_dir, open_data):
+    with open(os.path.join(data_dir, "user_data.json"), "w", encoding="utf-8") as f:
+        json.dump({"1001": {"level": 1, "username": "甲", "has_started": True}}, f)
+    
+    data = open_data()
+    assert data.users["1001"]["schema_version"] == CURRENT_SCHEMA_VERSION
+    assert data.users["1001"]["username"] == "甲"
+    data.writer.wait_idle()
+    
+    # 迁移结果已写回磁盘，再次加载时无需迁移
+    data = open_data(close=data)
+    assert not data._dirty_users
+    assert data.users["1001"]["schema_version"] == CURRENT_SCHEMA_VERSION
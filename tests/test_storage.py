@@ -0,0 +1,46 @@
+import pytest
+
+from astrbot_plugin_xiuxian.storage import JournalStorage, ShardedJsonStorage
+
+
+def test_failed_journal_append_is_written_in_full_on_retry(tmp_path, monkeypatch):
+    snapshot_path = str(tmp_path / "user_data.json")
+    journal_path = str(tmp_path / "user_data.journal")
+    storage = JournalStorage(snapshot_path, journal_path)
+    users = {"1001": {"exp": 0, "level": 1}}
+    storage.prepare_save(users, ["1001"])()
+    
+    users["1001"]["exp"] = 50
+    job = storage.prepare_save(users, ["1001"])
+    
+    def fail(data):
+        raise OSError("disk full")
+    
+    monkeypatch.setattr(storage, "_append_journal", fail)
+    with pytest.raises(OSError):
+        job()
+    monkeypatch.undo()
+    
+    # 写入线程把失败的用户重新标记为待写入，重试时不能因为增量为空而跳过
+    storage.prepare_save(users, ["1001"])()
+    storage.close()
+    
+    reloaded = JournalStorage(snapshot_path, journal_path)
+    assert reloaded.load_all()["1001"] == {"exp": 50, "level": 1}
+    reloaded.close()
+
+
+def test_shard_rewrite_skips_members_removed_from_users(tmp_path):
+    storage = ShardedJsonStorage(str(tmp_path / "users"), shard_hex_digits=1)
+    first = "1001"
+    second = next(str(user_id) for user_id in range(1002, 2000)
+                  if storage.shard_path(str(user_id)) == storage.shard_path(first))
+    users = {first: {"level": 1}, second: {"level": 2}}
+    storage.prepare_save(users, users.keys())()
+    
+    # 同一分片中的另一名用户已被删除，但在本批中没有被标记为待写入
+    del users[second]
+    users[first]["level"] = 3
+    storage.prepare_save(users, [first])()
+    
+    assert ShardedJsonStorage(str(tmp_path / "users"), shard_hex_digits=1).load_all() == {first: {"level": 3}}
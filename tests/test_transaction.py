@@ -0,0 +1,105 @@
+import pytest
+
+
+def start_user(data, user_id, **fields):
+    """注册一名已开始修仙的用户"""
+    user = data.get_user(user_id)
+    user.update(has_started=True, username=user_id, **fields)
+    data._mark_dirty(user_id)
+    return user
+
+
+def test_rollback_restores_user_and_indexes(open_data):
+    data = open_data()
+    user = start_user(data, "1001", spirit_stones=100)
+    
+    with pytest.raises(RuntimeError):
+        with data.transaction("1001"):
+            user["spirit_stones"] += 500
+            user["stats"]["attack"] = 999
+            data._mark_dirty("1001")
+            raise RuntimeError("boom")
+    
+    # 原地恢复，外部持有的记录引用仍然有效
+    assert data.users["1001"] is user
+    assert user["spirit_stones"] == 100
+    assert user["stats"]["attack"] == 10
+    assert data.columns.total("spirit_stones") == 100
+    assert data.get_metric_rank("spirit_stones")["rows"][0][2] == 100
+
+
+def test_rollback_removes_users_created_in_transaction(open_data):
+    data = open_data()
+    
+    with pytest.raises(RuntimeError):
+        with data.transaction():
+            start_user(data, "1002")
+            raise RuntimeError("boom")
+    
+    assert data.find_user("1002") is None
+    assert len(data.columns) == 0
+
+
+def test_nested_transaction_rolls_back_at_outermost(open_data):
+    data = open_data()
+    user = start_user(data, "1001", exp=0)
+    
+    with pytest.raises(RuntimeError):
+        with data.transaction("1001"):
+            with data.transaction("1001"):
+                data.add_exp("1001", 50)
+            # 内层事务正常退出时不提交，外层异常时一并回滚
+            assert user["exp"] == 50
+            raise RuntimeError("boom")
+    
+    assert user["exp"] == 0
+
+
+def test_transaction_commits_with_a_single_flush(open_data, monkeypatch):
+    data = open_data()
+    data.write_behind = False
+    start_user(data, "1001")
+    start_user(data, "1002")
+    flushes = []
+    original_flush = data.flush
+    monkeypatch.setattr(data, "flush", lambda: flushes.append(1) or original_flush())
+    
+    with data.transaction("1001", "1002"):
+        data.add_spirit_stones("1001", -10)
+        data.add_spirit_stones("1002", 10)
+        assert flushes == []
+    
+    assert flushes == [1]
+
+
+def test_transactional_method_rolls_back_on_error(open_data, monkeypatch):
+    data = open_data()
+    user = start_user(data, "1001", level=50, spirit_stones=100000)
+    
+    def fail(*args, **kwargs):
+        raise RuntimeError("boom")
+    
+    # 购买丹药扣除灵石后出错，扣除的灵石应当退回
+    pill_name = next(iter(data.config.shop_items["pills"]))
+    monkeypatch.setattr(data, "update_user", fail)
+    with pytest.raises(RuntimeError):
+        data.buy_pill("1001", pill_name)
+    
+    assert user["spirit_stones"] == 100000
+    assert user["inventory"]["pills"] == {}
+
+
+def test_rollback_requeues_acknowledged_status_job(open_data):
+    data = open_data()
+    start_user(data, "1001")
+    data.set_status("1001", "探索中", 1)
+    status_id = data.users["1001"]["status_id"]
+    
+    with pytest.raises(RuntimeError):
+        with data.transaction("1001"):
+            data._retire_status_job(data.users["1001"])
+            assert status_id not in data.status_jobs
+            raise RuntimeError("boom")
+    
+    assert data.users["1001"]["status_id"] == status_id
+    assert status_id in data.status_jobs
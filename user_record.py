@@ -0,0 +1,288 @@
+import copy
+from typing import Dict, Any, Iterator, List, Optional, Set, Tuple
+from .schema import DEFAULT_USER_FIELDS, CURRENT_SCHEMA_VERSION
+
+
+class SlottedRecord:
+    """基于 __slots__ 的定长记录基类
+    
+    字段固定存放在槽位中，比同等字段数量的字典占用更少内存、属性访问更快；
+    热路径直接通过属性读写字段；同时保留与字典兼容的接口（下标访问、get、update、items 等），
+    供按字段名动态访问以及仍按字典方式处理数据的代码使用。
+    结构之外的未知字段保存在 _extras 中，序列化时原样写回。
+    通过属性或下标写入的顶层字段名会被记录下来（嵌套记录的写入记为所在的顶层字段），
+    供排行榜等索引只更新依赖了这些字段的部分。
+    """
+    
+    __slots__ = ("_extras", "_changed", "_parent")
+    
+    # 子类定义：字段名 -> 默认值
+    _defaults: Dict[str, Any] = {}
+    # 子类定义：嵌套记录字段名 -> 记录类型
+    _nested: Dict[str, type] = {}
+    # 作为嵌套记录时在上级记录中的字段名
+    _field: Optional[str] = None
+    
+    def __init_subclass__(cls, **kwargs: Any):
+        super().__init_subclass__(**kwargs)
+        # 预先取出各字段槽位的写入方法，填充记录时绕过 __setattr__ 的变更记录
+        cls._slot_setters = tuple(
+            (name, getattr(cls, name).__set__, default, isinstance(default, (dict, list)))
+            for name, default in cls._defaults.items()
+        )
+    
+    def __init__(self, **fields: Any):
+        self._fill(fields)
+    
+    def _fill(self, fields: Dict[str, Any]) -> None:
+        """按字段定义填充槽位，缺失的字段使用默认值，其余字段放入 _extras
+        
+        初始化不算作写入，不记录变更
+        """
+        _set_changed(self, None)
+        _set_parent(self, None)
+        matched = 0
+        for name, set_slot, default, mutable in self._slot_setters:
+            if name in fields:
+                set_slot(self, fields[name])
+                matched += 1
+            else:
+                set_slot(self, copy.deepcopy(default) if mutable else default)
+        extras = None
+        if matched < len(fields):
+            extras = {key: value for key, value in fields.items() if key not in self._defaults}
+        _set_extras(self, extras)
+        if self._nested:
+            self._adopt_nested()
+    
+    def __setattr__(self, name: str, value: Any) -> None:
+        object.__setattr__(self, name, value)
+        if name[0] != "_":
+            self._touch(name)
+    
+    def _adopt_nested(self) -> None:
+        """将嵌套记录的变更归属到当前记录"""
+        for name in self._nested:
+            value = getattr(self, name)
+            if isinstance(value, SlottedRecord):
+                value._parent = self
+    
+    def _touch(self, key: str) -> None:
+        """记录被写入的字段"""
+        if self._parent is not None:
+            self._parent._touch(self._field)
+        elif self._changed is None:
+            self._changed = {key}
+        else:
+            self._changed.add(key)
+    
+    def pop_changed(self) -> Set[str]:
+        """取出自上次调用以来被写入过的顶层字段名并清空记录"""
+        changed, self._changed = self._changed, None
+        return changed or set()
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SlottedRecord":
+        """从JSON结构的字典创建记录，嵌套字段同样转换为对应的记录类型"""
+        fields = data
+        for name, record_type in cls._nested.items():
+            value = fields.get(name)
+            if isinstance(value, dict):
+                if fields is data:
+                    fields = dict(data)
+                fields[name] = record_type.from_dict(value)
+        record = cls.__new__(cls)
+        record._fill(fields)
+        return record
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为原有的JSON字典结构"""
+        result = {}
+        for name in self._defaults:
+            value = getattr(self, name)
+            if isinstance(value, SlottedRecord):
+                value = value.to_dict()
+            result[name] = value
+        if self._extras:
+            result.update(self._extras)
+        return result
+    
+    def assign(self, data: Dict[str, Any]) -> None:
+        """用字典中的数据原地替换全部字段"""
+        other = self.from_dict(data)
+        for name in self._defaults:
+            object.__setattr__(self, name, getattr(other, name))
+        self._extras = other._extras
+        self._adopt_nested()
+    
+    # ---- 字典兼容接口 ----
+    
+    def __getitem__(self, key: str) -> Any:
+        if key in self._defaults:
+            return getattr(self, key)
+        if self._extras is not None and key in self._extras:
+            return self._extras[key]
+        raise KeyError(key)
+    
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in self._defaults:
+            setattr(self, key, value)
+            return
+        if self._extras is None:
+            self._extras = {}
+        self._extras[key] = value
+        self._touch(key)
+    
+    def __delitem__(self, key: str) -> None:
+        if key in self._defaults:
+            raise KeyError(f"不能删除固定字段 {key}")
+        if self._extras is None or key not in self._extras:
+            raise KeyError(key)
+        del self._extras[key]
+        self._touch(key)
+    
+    def __contains__(self, key: object) -> bool:
+        return key in self._defaults or (self._extras is not None and key in self._extras)
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+    
+    def __len__(self) -> int:
+        return len(self._defaults) + (len(self._extras) if self._extras else 0)
+    
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, SlottedRecord):
+            return self.to_dict() == other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+    
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+    
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in self._defaults:
+            return getattr(self, key)
+        if self._extras is not None:
+            return self._extras.get(key, default)
+        return default
+    
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        if key not in self:
+            self[key] = default
+        return self[key]
+    
+    def update(self, data: Any = (), **fields: Any) -> None:
+        if data is self:
+            data = ()
+        elif isinstance(data, SlottedRecord):
+            data = data.to_dict().items()
+        elif isinstance(data, dict):
+            data = data.items()
+        for key, value in data:
+            self[key] = value
+        for key, value in fields.items():
+            self[key] = value
+    
+    def keys(self) -> List[str]:
+        keys = list(self._defaults)
+        if self._extras:
+            keys.extend(self._extras)
+        return keys
+    
+    def values(self) -> List[Any]:
+        return [self[key] for key in self.keys()]
+    
+    def items(self) -> List[Tuple[str, Any]]:
+        return [(key, self[key]) for key in self.keys()]
+
+
+
+_set_extras = SlottedRecord._extras.__set__
+_set_changed = SlottedRecord._changed.__set__
+_set_parent = SlottedRecord._parent.__set__
+
+class UserStats(SlottedRecord):
+    """用户基础属性"""
+    
+    __slots__ = ("attack", "defense", "hp", "max_hp")
+    
+    _field = "stats"
+    
+    attack: int
+    defense: int
+    hp: int
+    max_hp: int
+    
+    _defaults = dict(DEFAULT_USER_FIELDS["stats"])
+
+
+class UserEquipment(SlottedRecord):
+    """用户装备栏，值为装备ID或None"""
+    
+    __slots__ = ("weapon", "armor", "accessory")
+    
+    _field = "equipment"
+    
+    weapon: Optional[str]
+    armor: Optional[str]
+    accessory: Optional[str]
+    
+    _defaults = dict(DEFAULT_USER_FIELDS["equipment"])
+
+
+_USER_DEFAULTS = dict(DEFAULT_USER_FIELDS, schema_version=CURRENT_SCHEMA_VERSION)
+
+
+class UserRecord(SlottedRecord):
+    """单个用户的数据记录
+    
+    字段与 schema.DEFAULT_USER_FIELDS 定义的JSON结构一一对应，
+    stats 与 equipment 使用定长的嵌套记录，inventory 等可变结构仍为普通字典/列表。
+    注意 items 是用户的物品字段，会覆盖字典接口的 items()，需要遍历全部字段时请使用 to_dict()。
+    """
+    
+    __slots__ = tuple(_USER_DEFAULTS)
+    
+    level: int
+    exp: int
+    max_exp: int
+    realm: str
+    spirit_stones: int
+    items: list
+    techniques: List[str]
+    username: str
+    equipment: UserEquipment
+    stats: UserStats
+    inventory: Dict[str, Any]
+    last_practice_time: int
+    last_adventure_time: int
+    last_mine_time: int
+    last_daily_time: int
+    status: Optional[str]
+    status_end_time: int
+    status_start_time: int
+    status_duration: float
+    status_reward_multiplier: float
+    last_steal_time: int
+    last_duel_time: int
+    last_breakthrough_time: int
+    breakthrough_bonus: float
+    has_started: bool
+    daily_streak: int
+    breakthrough_count: int
+    group_id: Optional[str]
+    unified_msg_origin: Optional[str]
+    status_notify: bool
+    status_id: Optional[str]
+    schema_version: int
+    
+    _defaults = _USER_DEFAULTS
+    _nested = {"stats": UserStats, "equipment": UserEquipment}
+    
+    def __init__(self, **fields: Any):
+        for name, record_type in self._nested.items():
+            value = fields.get(name, self._defaults[name])
+            if isinstance(value, dict):
+                fields[name] = record_type.from_dict(value)
+        super().__init__(**fields)
@@ -1,4 +1,3 @@
-import time
 import random
 from typing import Dict, Any, Tuple, Optional
 from astrbot.api import logger
@@ -129,19 +128,3 @@ class XiuXianUtils:
             "value": total,
             "is_critical": is_critical
         }
-    
-    @staticmethod
-    def generate_task_id(user_id: str, action_type: str = "") -> str:
-        """
-        生成唯一的任务ID
-        
-        Args:
-            user_id: 用户ID
-            action_type: 动作类型
-            
-        Returns:
-            唯一的任务ID
-        """
-        timestamp = int(time.time())
-        random_suffix = random.randint(1000, 9999)
-        return f"{user_id}_{action_type}_{timestamp}_{random_suffix}"
\ No newline at end of file
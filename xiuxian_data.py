@@ -1,19 +1,37 @@
 import os
+import copy
+import asyncio
 import json
 import random
 import time
-from typing import Dict, Any, List, Optional
+import uuid
+import functools
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Set, Iterator, Callable, Tuple
 from datetime import datetime, timedelta
 from astrbot.api import logger
 from .config_loader import ConfigLoader
 from .utils import XiuXianUtils
+from .schema import UserSchema
+from .user_record import UserRecord
+from .columns import UserColumns
+from .ranking import RankingEngine, RankingMetric, RankCache
+from .storage import create_storage, encode_user, export_users, StorageWriter
+from .jobs import StatusJobQueue
+from .locks import UserLockManager
+
+def transactional(method):
+    """将以 user_id 为第一个参数的数据操作包装在事务中执行"""
+    @functools.wraps(method)
+    def wrapper(self, user_id: str, *args, **kwargs):
+        with self.transaction(user_id):
+            return method(self, user_id, *args, **kwargs)
+    return wrapper
 
 # 修仙游戏数据管理类
 class XiuXianData:
     def __init__(self, data_dir: str):
         self.data_dir = data_dir
-        self.user_data_file = os.path.join(data_dir, "user_data.json")
-        self.users = self._load_data()
         
         # 初始化配置加载器
         config_dir = os.path.join(data_dir, "configs")
@@ -23,78 +41,400 @@ class XiuXianData:
         # 从配置加载器获取配置
         self.realms_config = self.config.realms
         self.breakthrough_rates = self.config.breakthrough_rates
+        
+        # 写回缓存配置：变更只标记脏用户，由后台任务或阈值触发批量写入
+        persistence_config = self.config.system.get("persistence", {})
+        self.write_behind = persistence_config.get("write_behind", True)
+        self.flush_interval = persistence_config.get("flush_interval_seconds", 5)
+        self.flush_dirty_threshold = persistence_config.get("flush_dirty_threshold", 200)
+        self._dirty_users = set()
+        
+        # 事务状态：嵌套深度与事务开始前的用户数据快照（None 表示用户在事务中新建）
+        self._transaction_depth = 0
+        self._transaction_backups = {}
+        # 批量操作嵌套深度：大于0时暂停按阈值写入，退出最外层时统一写入一次
+        self._deferred_flush_depth = 0
+        # 按用户划分的异步锁，供指令处理与状态结算串行化同一用户的操作
+        self.locks = UserLockManager()
+        # 用户数据版本号，每次变更或回滚时递增，用于判断只读指令缓存的回复是否仍然有效
+        self._user_versions: Dict[str, int] = {}
+        
+        # 根据配置创建存储后端（JSON文件或SQLite），磁盘写入统一交给后台写入线程
+        self.storage = create_storage(data_dir, persistence_config)
+        self.schema = UserSchema(self.config.user_template, self.realms_config)
+        self.users = self._load_data()
+        self.writer = StorageWriter()
+        
+        # 热点数值字段的列式副本，用于世界统计等批量查询
+        self.columns = UserColumns(self.realms_config)
+        # 各排行指标增量维护的排行榜索引
+        self.ranking = RankingEngine(lambda user: user.group_id)
+        self._register_rankings()
+        # 前10名榜单的渲染结果缓存
+        self.rank_cache = RankCache(self.ranking, top_n=10)
+        # 尚未建立索引的用户ID，None 表示索引已建立完成
+        # 索引不在启动时同步建立，由 build_indexes 在后台分批建立，或在首次查询时补齐
+        self._unindexed: Optional[List[str]] = list(self.users) if self.users else None
+        
+        # 定时状态的持久化结算队列，队列文件不存在时从用户数据中重建一次
+        self.status_jobs = StatusJobQueue(os.path.join(data_dir, "status_jobs.json"))
+        if not self.status_jobs.exists:
+            self._rebuild_status_jobs()
+        
+        # 加载时迁移过的用户立即写回，之后每次启动无需再迁移
+        if self._dirty_users or self.status_jobs.dirty:
+            self.flush()
     
-    def _load_data(self) -> Dict[str, Any]:
+    def _load_data(self) -> Dict[str, UserRecord]:
         """加载用户数据"""
-        if os.path.exists(self.user_data_file):
-            try:
-                with open(self.user_data_file, "r", encoding="utf-8") as f:
-                    return json.load(f)
-            except Exception as e:
-                print(f"加载用户数据失败: {e}")
-                return {}
-        return {}
+        start_time = time.perf_counter()
+        users = self.storage.load_all()
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        logger.info(f"用户数据加载完成，共 {len(users)} 名用户，耗时 {elapsed_ms:.1f} ms")
+        # 将旧版本的用户数据一次性升级到当前结构
+        self._dirty_users.update(self.schema.migrate_all(users))
+        # 转换为定长的用户记录，减少常驻内存
+        return {user_id: UserRecord.from_dict(user) for user_id, user in users.items()}
     
-    def _save_data(self) -> None:
-        """保存用户数据"""
+    def _save_data(self, dirty_ids: Set[str]) -> bool:
+        """保存用户数据
+        
+        在当前线程中只编码变更的用户，实际的磁盘写入由后台写入线程按提交顺序执行，
+        内存中的数据始终是最新状态
+        """
         try:
-            os.makedirs(os.path.dirname(self.user_data_file), exist_ok=True)
-            with open(self.user_data_file, "w", encoding="utf-8") as f:
-                json.dump(self.users, f, ensure_ascii=False, indent=4)
+            job = self.storage.prepare_save(self.users, dirty_ids)
         except Exception as e:
-            print(f"保存用户数据失败: {e}")
+            logger.error(f"保存用户数据失败: {e}")
+            return False
+        self.writer.submit(job, dirty_ids, self.storage.coalesce_key)
+        return True
+    
+    def _mark_dirty(self, *user_ids: str) -> None:
+        """标记用户数据已变更
+        
+        写回模式下只记录脏用户，待脏用户数达到阈值或后台定时任务触发时再统一写入；
+        关闭写回模式时立即写入磁盘。
+        """
+        self._dirty_users.update(user_ids)
+        for user_id in user_ids:
+            self._update_indexes(user_id)
+        if self._transaction_depth > 0:
+            # 事务内只收集变更，提交时统一决定是否写入
+            return
+        self._maybe_flush()
+    
+    def _maybe_flush(self) -> None:
+        """关闭写回模式或脏用户数达到阈值时写入磁盘，批量操作期间推迟到批次结束"""
+        if self._deferred_flush_depth > 0:
+            return
+        if not self.write_behind or len(self._dirty_users) >= self.flush_dirty_threshold:
+            self.flush()
+    
+    @contextmanager
+    def deferred_flush(self) -> Iterator["XiuXianData"]:
+        """批量操作上下文
+        
+        与事务不同，批量操作不做整体回滚（每个数据操作仍各自是一个事务），
+        只是把期间产生的写入合并为退出最外层时的一次写入。
+        """
+        self._deferred_flush_depth += 1
+        try:
+            yield self
+        finally:
+            self._deferred_flush_depth -= 1
+            if self._deferred_flush_depth == 0 and self._transaction_depth == 0:
+                self.flush()
+    
+    def _rebuild_status_jobs(self) -> None:
+        """遍历用户数据，为所有进行中的定时状态分配结算ID并入队"""
+        for user_id, user in self.users.items():
+            if user.status is None or user.status == "修炼中":
+                continue
+            if user.status_id is None:
+                user.status_id = uuid.uuid4().hex
+                self._dirty_users.add(user_id)
+            self.status_jobs.enqueue(user.status_id, user_id, user.status_end_time or 0)
+        logger.info(f"已从用户数据重建状态结算队列，共 {len(self.status_jobs)} 个待结算的状态")
+    
+    def _retire_status_job(self, user: UserRecord) -> None:
+        """确认用户当前状态的结算任务出队（状态已结算或被替换）"""
+        if user.status_id is not None:
+            self.status_jobs.ack(user.status_id)
+            user.status_id = None
+    
+    def settle_status_job(self, status_id: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """按结算ID结算一个状态（幂等）
+        
+        Returns:
+            (用户ID, complete_status 的结果)，任务不存在、正在被结算或用户已删除时返回None
+        """
+        job = self.status_jobs.claim(status_id)
+        if job is None:
+            return None
+        user_id = job[0]
+        try:
+            if user_id not in self.users:
+                self.status_jobs.ack(status_id)
+                return None
+            return user_id, self.complete_status(user_id, status_id)
+        finally:
+            self.status_jobs.release(status_id)
+    
+    def settle_status_jobs(self, status_ids: List[str]) -> List[Tuple[str, Dict[str, Any]]]:
+        """批量结算到期的状态，整批只写入一次
+        
+        Returns:
+            (用户ID, complete_status 的结果) 列表，跳过的任务和结算出错的用户不包含在内
+        """
+        results = []
+        with self.deferred_flush():
+            for status_id in status_ids:
+                try:
+                    settled = self.settle_status_job(status_id)
+                except Exception as e:
+                    logger.error(f"结算状态任务 {status_id} 时出错: {e}")
+                    continue
+                if settled is not None:
+                    results.append(settled)
+        return results
+    
+    def _register_rankings(self) -> None:
+        """注册排行指标及其依赖的用户字段"""
+        self.ranking.register(RankingMetric(
+            "realm", "修仙世界排行榜", "等级", lambda user: user.level, {"level", "exp"},
+            key_fn=lambda user: (-user.level, -user.exp), grouped=True,
+        ))
+        self.ranking.register(RankingMetric(
+            "spirit_stones", "灵石排行榜", "灵石", lambda user: user.spirit_stones, {"spirit_stones"},
+        ))
+        self.ranking.register(RankingMetric(
+            "battle_power", "战力排行榜", "战力", self.calculate_battle_power, {"level", "stats"},
+        ))
+        self.ranking.register(RankingMetric(
+            "daily_streak", "签到排行榜", "连续签到", lambda user: user.daily_streak, {"daily_streak"},
+        ))
+        self.ranking.register(RankingMetric(
+            "breakthrough_count", "突破排行榜", "突破次数", lambda user: user.breakthrough_count, {"breakthrough_count"},
+        ))
+    
+    def _update_indexes(self, user_id: str, full: bool = False) -> None:
+        """将用户的最新数据同步到列式存储与排行榜索引
+        
+        Args:
+            user_id: 用户ID
+            full: 是否忽略字段变更记录，重新计算所有排行指标
+        """
+        self._user_versions[user_id] = self._user_versions.get(user_id, 0) + 1
+        user = self.users.get(user_id)
+        self.columns.update(user_id, user)
+        changed_fields = None if user is None else user.pop_changed()
+        if full or self._unindexed is not None:
+            # 索引建立期间用户可能尚未上榜，按全部字段重新计算
+            changed_fields = None
+        updated_metrics = self.ranking.update(user_id, user, changed_fields)
+        self.rank_cache.on_user_changed(user_id, user, changed_fields, updated_metrics)
+    
+    def _index_users(self, count: int) -> bool:
+        """为最多 count 名尚未建立索引的用户建立列式存储与排行榜索引
+        
+        索引的更新是幂等的，期间发生变更的用户已由 _update_indexes 同步过，再次写入结果不变
+        
+        Returns:
+            全部用户的索引是否已建立完成
+        """
+        pending = self._unindexed
+        if pending is None:
+            return True
+        for _ in range(min(count, len(pending))):
+            user_id = pending.pop()
+            user = self.users.get(user_id)
+            if user is not None:
+                self.columns.update(user_id, user)
+                self.ranking.update(user_id, user)
+        if pending:
+            return False
+        self._unindexed = None
+        logger.info(f"排行与统计索引建立完成，共 {len(self.columns)} 名已开始修仙的用户")
+        return True
+    
+    def _ensure_indexes(self) -> None:
+        """查询排行与统计前补齐尚未建立的索引"""
+        if self._unindexed is not None:
+            self._index_users(len(self._unindexed))
+    
+    async def build_indexes(self, batch_size: int = 500) -> None:
+        """在后台分批建立排行与统计索引，每批之间让出一次事件循环"""
+        while not self._index_users(batch_size):
+            await asyncio.sleep(0)
     
-    def get_user(self, user_id: str) -> Dict[str, Any]:
-        """获取用户数据，如果不存在则创建"""
+    def user_version(self, user_id: str) -> int:
+        """用户数据的版本号，数据每次变更后递增"""
+        return self._user_versions.get(user_id, 0)
+    
+    def flush(self) -> int:
+        """立即将所有待写入的变更保存到磁盘
+        
+        Returns:
+            本次提交写入的脏用户数量，没有待写入的变更或编码失败时返回0
+        """
+        # 事务进行中不写入，避免把未提交的中间状态落盘
+        if self._transaction_depth > 0:
+            return 0
+        
+        # 后台线程写入失败的用户重新加入待写入集合
+        self._dirty_users |= self.writer.pop_failed()
+        if not self._dirty_users and not self.status_jobs.dirty:
+            return 0
+        
+        # 新入队的结算任务先于用户数据写入，已确认的任务在用户数据之后移除
+        before_job = self.status_jobs.prepare_before_data()
+        if before_job is not None:
+            self.writer.submit(before_job, ())
+        
+        dirty_ids = self._dirty_users
+        if dirty_ids and not self._save_data(dirty_ids):
+            # 编码失败时保留脏标记，等待下次重试
+            return 0
+        self._dirty_users = set()
+        
+        # 已确认任务的移除在写入线程中执行，此前有用户数据写入失败时推迟到重新写入成功之后
+        after_job = self.status_jobs.prepare_after_data(self.writer.all_saved)
+        if after_job is not None:
+            self.writer.submit(after_job, ())
+        return len(dirty_ids)
+    
+    async def export_data(self, batch_size: int = 1000) -> str:
+        """将全部用户数据导出为带缩进的JSON文件
+        
+        用户数据在事件循环中按批编码为紧凑JSON，每批之间让出一次事件循环；
+        格式化与写入文件在线程中进行，导出期间不阻塞其他指令
+        
+        Returns:
+            导出文件的路径
+        """
+        export_dir = os.path.join(self.data_dir, "exports")
+        file_name = f"user_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        file_path = os.path.join(export_dir, file_name)
+        
+        fragments = {}
+        user_ids = list(self.users)
+        for start in range(0, len(user_ids), batch_size):
+            for user_id in user_ids[start:start + batch_size]:
+                user = self.users.get(user_id)
+                if user is not None:
+                    fragments[user_id] = encode_user(user)
+            await asyncio.sleep(0)
+        await asyncio.to_thread(export_users, fragments, file_path)
+        return file_path
+    
+    def close(self) -> None:
+        """保存所有待写入的变更，等待写入线程完成后关闭存储后端"""
+        self.flush()
+        self.writer.close()
+        self.storage.close()
+    
+    async def aclose(self) -> None:
+        """在事件循环中使用的 close
+        
+        待写入的变更在事件循环中编码并提交，只把等待写入线程结束放到线程中，
+        用户数据与脏标记不会被其他线程访问
+        """
+        self.flush()
+        await asyncio.to_thread(self.writer.close)
+        self.storage.close()
+    
+    def _backup_user(self, user_id: str) -> None:
+        """在事务中首次访问用户时记录其数据快照，用于异常时回滚"""
+        if user_id not in self._transaction_backups:
+            user = self.users.get(user_id)
+            self._transaction_backups[user_id] = copy.deepcopy(user.to_dict()) if user is not None else None
+    
+    @contextmanager
+    def transaction(self, *user_ids: str) -> Iterator["XiuXianData"]:
+        """多步数据操作的事务上下文
+        
+        事务内的所有变更只标记脏用户，退出最外层事务时统一提交，每条指令最多触发一次写入；
+        事务内抛出异常时将涉及的用户恢复到事务开始前的状态并重新抛出异常。
+        除显式传入的用户外，事务内通过 get_user 访问到的用户也会自动记录快照。
+        
+        Args:
+            user_ids: 本次操作涉及的用户ID
+        """
+        for user_id in user_ids:
+            self._backup_user(user_id)
+        self._transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                self._rollback()
+            raise
+        else:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                self._transaction_backups = {}
+                self._maybe_flush()
+    
+    def _rollback(self) -> None:
+        """将事务中涉及的用户原地恢复到事务开始前的状态"""
+        backups, self._transaction_backups = self._transaction_backups, {}
+        for user_id, backup in backups.items():
+            if backup is None:
+                # 事务中新建的用户直接移除
+                self.users.pop(user_id, None)
+            elif user_id in self.users:
+                # 原地恢复，保证外部持有的用户记录引用仍然有效
+                self.users[user_id].assign(backup)
+            else:
+                self.users[user_id] = UserRecord.from_dict(backup)
+            self._update_indexes(user_id, full=True)
+            # 恢复的状态若在事务中被确认出队，重新加入结算队列
+            user = self.users.get(user_id)
+            if user is not None and user.status_id is not None and user.status_id not in self.status_jobs:
+                self.status_jobs.enqueue(user.status_id, user_id, user.status_end_time)
+        logger.warning(f"数据操作异常，已回滚 {len(backups)} 名用户的数据")
+    
+    def find_user(self, user_id: str) -> Optional[UserRecord]:
+        """查找用户数据，用户不存在时返回None
+        
+        只读查询接口，不会创建用户也不会触发保存，
+        用于在用户通过 /我要修仙 注册之前进行判断
+        """
+        user = self.users.get(user_id)
+        if user is not None and self._transaction_depth > 0:
+            self._backup_user(user_id)
+        return user
+    
+    def get_user(self, user_id: str) -> UserRecord:
+        """获取用户数据，如果不存在则创建
+        
+        仅应在用户注册（/我要修仙）或已确认用户存在时调用，只读查询请使用 find_user
+        """
+        if self._transaction_depth > 0:
+            self._backup_user(user_id)
         if user_id not in self.users:
-            # 从配置加载器获取用户模板并创建新用户数据
-            self.users[user_id] = self.config.user_template.copy()
-            # 确保必要的嵌套字典和列表存在
-            if "equipment" not in self.users[user_id]:
-                self.users[user_id]["equipment"] = {"weapon": None, "armor": None, "accessory": None}
-            if "stats" not in self.users[user_id]:
-                self.users[user_id]["stats"] = {"attack": 10, "defense": 10, "hp": 100, "max_hp": 100}
-            if "inventory" not in self.users[user_id]:
-                self.users[user_id]["inventory"] = {"pills": {}}
-            if "items" not in self.users[user_id]:
-                self.users[user_id]["items"] = []
-            if "techniques" not in self.users[user_id]:
-                self.users[user_id]["techniques"] = []
-            # 确保其他必要字段存在
-            self.users[user_id].setdefault("username", "")
-            self.users[user_id].setdefault("last_practice_time", 0)
-            self.users[user_id].setdefault("last_adventure_time", 0)
-            self.users[user_id].setdefault("last_mine_time", 0)
-            self.users[user_id].setdefault("last_daily_time", 0)
-            self.users[user_id].setdefault("status", None)
-            self.users[user_id].setdefault("status_end_time", 0)
-            self.users[user_id].setdefault("status_start_time", 0)
-            self.users[user_id].setdefault("status_duration", 0)
-            self.users[user_id].setdefault("status_reward_multiplier", 0)
-            self.users[user_id].setdefault("last_steal_time", 0)
-            self.users[user_id].setdefault("last_duel_time", 0)
-            self.users[user_id].setdefault("last_breakthrough_time", 0)
-            self.users[user_id].setdefault("breakthrough_bonus", 0)
-            self.users[user_id].setdefault("has_started", False)
-            self.users[user_id].setdefault("daily_streak", 0)
-            self._save_data()
+            # 按当前数据结构版本从用户模板创建新用户数据
+            self.users[user_id] = UserRecord.from_dict(self.schema.new_user())
+            self._mark_dirty(user_id)
         return self.users[user_id]
     
     def update_user(self, user_id: str, data: Dict[str, Any]) -> None:
         """更新用户数据"""
         if user_id in self.users:
             self.users[user_id].update(data)
-            self._save_data()
+            self._mark_dirty(user_id)
     
     def add_exp(self, user_id: str, exp: int) -> Dict[str, Any]:
         """增加用户修为，但不自动升级，只有通过突破才能升级境界"""
         user = self.get_user(user_id)
-        user["exp"] += exp
+        user.exp += exp
         
         # 不再自动升级，只返回修为增加信息
-        level_up_info = {"leveled_up": False, "old_level": user["level"], "old_realm": user["realm"]}
+        level_up_info = {"leveled_up": False, "old_level": user.level, "old_realm": user.realm}
         
-        self._save_data()
+        self._mark_dirty(user_id)
         return level_up_info
     
     def _load_realms_config(self) -> List[Dict[str, Any]]:
@@ -142,14 +482,14 @@ class XiuXianData:
     def add_spirit_stones(self, user_id: str, amount: int) -> int:
         """增加或减少灵石"""
         user = self.get_user(user_id)
-        user["spirit_stones"] += amount
-        self._save_data()
-        return user["spirit_stones"]
+        user.spirit_stones += amount
+        self._mark_dirty(user_id)
+        return user.spirit_stones
     
     def get_next_realm(self, user_id: str) -> Dict[str, Any]:
         """获取用户下一境界信息"""
         user = self.get_user(user_id)
-        current_realm = user["realm"]
+        current_realm = user.realm
         
         # 查找当前境界在配置中的位置
         current_index = -1
@@ -171,7 +511,7 @@ class XiuXianData:
         
         # 计算所需修为（使用当前境界的修为要求）
         exp_required = current_realm_info["exp_required"]
-        current_exp = user["exp"]
+        current_exp = user.exp
         
         # 检查修为是否足够
         can_breakthrough = current_exp >= exp_required
@@ -180,8 +520,8 @@ class XiuXianData:
         current_time = int(time.time())
         cd_remaining = 0
         breakthrough_cooldown = self.config.game_values.get("breakthrough", {}).get("cooldown_seconds", 3600)  # 默认1小时CD
-        if current_time - user.get("last_breakthrough_time", 0) < breakthrough_cooldown:
-            cd_remaining = breakthrough_cooldown - (current_time - user.get("last_breakthrough_time", 0))
+        if current_time - user.last_breakthrough_time < breakthrough_cooldown:
+            cd_remaining = breakthrough_cooldown - (current_time - user.last_breakthrough_time)
         
         return {
             "has_next": True,
@@ -193,6 +533,7 @@ class XiuXianData:
             "breakthrough_rate": self.breakthrough_rates.get(current_realm, 0.5)  # 默认0.5
         }
     
+    @transactional
     def breakthrough(self, user_id: str, use_pill: bool = False) -> Dict[str, Any]:
         """尝试突破到下一境界"""
         user = self.get_user(user_id)
@@ -230,48 +571,50 @@ class XiuXianData:
         # 计算突破概率
         base_rate = next_realm_info["breakthrough_rate"]
         # 加上突破加成（如果有）
-        bonus_rate = user.get("breakthrough_bonus", 0)
+        bonus_rate = user.breakthrough_bonus
         final_rate = min(max_success_rate, base_rate + bonus_rate)  # 最高成功率由配置决定
         
         # 决定是否突破成功
         is_success = random.random() < final_rate
         
         # 更新最后突破时间
-        user["last_breakthrough_time"] = int(time.time())
+        user.last_breakthrough_time = int(time.time())
         
         result = {
             "success": True,
             "is_breakthrough_success": is_success,
-            "old_realm": user["realm"],
-            "new_realm": next_realm_info["next_realm"] if is_success else user["realm"],
+            "old_realm": user.realm,
+            "new_realm": next_realm_info["next_realm"] if is_success else user.realm,
             "exp_loss": 0,
             "message": ""
         }
         
         if is_success:
             # 突破成功，更新境界
-            old_realm = user["realm"]
-            user["realm"] = next_realm_info["next_realm"]
+            old_realm = user.realm
+            user.realm = next_realm_info["next_realm"]
             # 消耗修为（消耗当前境界所需的修为）
-            user["exp"] -= next_realm_info["exp_required"]
+            user.exp -= next_realm_info["exp_required"]
             # 重置突破加成
-            user["breakthrough_bonus"] = 0
+            user.breakthrough_bonus = 0
+            # 记录突破成功次数
+            user.breakthrough_count += 1
             
             # 更新最大生命值
             self.update_max_hp(user_id)
             
-            result["message"] = f"恭喜突破成功！你的境界提升为【{user['realm']}】"
+            result["message"] = f"恭喜突破成功！你的境界提升为【{user.realm}】"
         else:
             # 突破失败
             if not use_pill:  # 如果没有使用渡厄丹
                 # 随机扣减修为，范围由配置决定
                 exp_loss_percent = random.uniform(exp_loss_percent_range[0], exp_loss_percent_range[1])
-                exp_loss = int(user["exp"] * exp_loss_percent)
-                user["exp"] = max(0, user["exp"] - exp_loss)
+                exp_loss = int(user.exp * exp_loss_percent)
+                user.exp = max(0, user.exp - exp_loss)
                 
                 # 增加下次突破成功率，增加比例由配置决定
                 bonus_increase = base_rate * bonus_increase_percent
-                user["breakthrough_bonus"] += bonus_increase
+                user.breakthrough_bonus += bonus_increase
                 
                 result["exp_loss"] = exp_loss
                 result["message"] = f"突破失败！损失了 {exp_loss} 点修为，但下次突破成功率提高了 {bonus_increase*100:.1f}%"
@@ -279,7 +622,7 @@ class XiuXianData:
                 # 使用了渡厄丹，不损失修为
                 # 增加下次突破成功率，增加比例由配置决定
                 bonus_increase = base_rate * bonus_increase_percent
-                user["breakthrough_bonus"] += bonus_increase
+                user.breakthrough_bonus += bonus_increase
                 
                 result["message"] = f"虽然突破失败，但由于使用了渡厄丹，没有损失修为。下次突破成功率提高了 {bonus_increase*100:.1f}%"
         
@@ -292,29 +635,154 @@ class XiuXianData:
         """获取所有用户数据"""
         return self.users
     
+    def get_top_users(self, n: int = 10, group_id: Optional[str] = None, metric: str = "realm") -> List[tuple]:
+        """获取指定排行指标的前 n 名已开始修仙的用户
+        
+        Args:
+            n: 返回的用户数量
+            group_id: 指定群ID时只统计在该群开始修仙的用户（仅支持按群划分的指标）
+            metric: 排行指标名称，默认为按等级和修为排序
+        
+        Returns:
+            [(用户ID, 用户数据), ...]
+        """
+        self._ensure_indexes()
+        top_ids = self.ranking.top(metric, n, group_id)
+        return [(user_id, self.users[user_id]) for user_id in top_ids]
+    
+    def get_rank_page(self, page: int, page_size: int = 10, metric: str = "realm") -> Dict[str, Any]:
+        """分页获取排行榜
+        
+        Args:
+            page: 页码（从1开始），超出范围时取最后一页
+            page_size: 每页人数
+        
+        Returns:
+            包含页码、总页数、本页首个名次以及 [(用户ID, 用户数据), ...] 的字典
+        """
+        self._ensure_indexes()
+        board = self.ranking.board(metric)
+        total_pages = max(1, (len(board) + page_size - 1) // page_size)
+        page = min(max(page, 1), total_pages)
+        start = (page - 1) * page_size
+        return {
+            "page": page,
+            "total_pages": total_pages,
+            "start_rank": start + 1,
+            "rows": [(user_id, self.users[user_id]) for user_id in board.range(start, start + page_size)],
+        }
+    
+    def get_user_rank(self, user_id: str, radius: int = 2, metric: str = "realm") -> Optional[Dict[str, Any]]:
+        """获取用户的名次及前后相邻的用户
+        
+        Args:
+            user_id: 用户ID
+            radius: 前后各展示的相邻人数
+        
+        Returns:
+            包含名次、上榜总人数、首个展示名次以及 [(用户ID, 用户数据), ...] 的字典，用户未上榜时返回None
+        """
+        self._ensure_indexes()
+        board = self.ranking.board(metric)
+        rank = board.rank(user_id)
+        if rank is None:
+            return None
+        start = max(rank - 1 - radius, 0)
+        return {
+            "rank": rank,
+            "total": len(board),
+            "start_rank": start + 1,
+            "rows": [(uid, self.users[uid]) for uid in board.range(start, rank + radius)],
+        }
+    
+    def get_metric_rank(self, metric: str, n: int = 10, group_id: Optional[str] = None) -> Dict[str, Any]:
+        """获取指标排行榜的展示数据
+        
+        Returns:
+            包含榜单标题、数值列名以及 [(用户ID, 用户数据, 数值), ...] 的字典
+        """
+        ranking_metric = self.ranking.metrics[metric]
+        return {
+            "title": ranking_metric.title,
+            "value_label": ranking_metric.value_label,
+            "rows": [
+                (user_id, user, ranking_metric.value_fn(user))
+                for user_id, user in self.get_top_users(n, group_id=group_id, metric=metric)
+            ],
+        }
+    
+    def get_rank_text(self, metric: str, render: Callable[[Dict[str, Any]], str], group_id: Optional[str] = None) -> str:
+        """获取前10名榜单的渲染文本，榜单及榜上用户的展示字段没有变化时直接返回缓存
+        
+        Args:
+            metric: 排行指标名称
+            render: 将 get_metric_rank 的结果渲染为文本的函数
+            group_id: 指定群ID时渲染该群的榜单
+        """
+        self._ensure_indexes()
+        scope = (metric, group_id)
+        text = self.rank_cache.get(scope)
+        if text is None:
+            rank_data = self.get_metric_rank(metric, self.rank_cache.top_n, group_id)
+            text = render(rank_data)
+            self.rank_cache.put(scope, text, [row[0] for row in rank_data["rows"]])
+        return text
+    
+    def calculate_battle_power(self, user: UserRecord) -> float:
+        """根据战斗公式配置计算用户战力（切磋、信息展示与战力排行共用）"""
+        power_calc = self.config.combat_formulas.get("duel", {}).get("power_calculation", {})
+        level_multiplier = power_calc.get("level_multiplier", 10)
+        attack_weight = power_calc.get("attack_weight", 1)
+        defense_weight = power_calc.get("defense_weight", 1)
+        return user.level * level_multiplier + user.stats.attack * attack_weight + user.stats.defense * defense_weight
+    
+    def get_world_stats(self) -> Dict[str, Any]:
+        """统计修仙世界的整体数据（基于列式存储批量计算）"""
+        self._ensure_indexes()
+        columns = self.columns
+        day_ago = int(time.time()) - 86400
+        realm_counts = []
+        # 统计各大境界（每个大境界的第一个小境界）及以上的人数
+        for realm in self.realms_config:
+            if realm["name"].endswith("初期"):
+                count = columns.count_at_least_realm(realm["name"])
+                if count == 0:
+                    break
+                realm_counts.append((realm["name"][:-2], count))
+        return {
+            "total_users": len(columns),
+            "active_users": columns.count_active_since(day_ago),
+            "total_spirit_stones": columns.total("spirit_stones"),
+            "median_spirit_stones": columns.percentile("spirit_stones", 50),
+            "p90_spirit_stones": columns.percentile("spirit_stones", 90),
+            "median_exp": columns.percentile("exp", 50),
+            "realm_counts": realm_counts,
+        }
+    
     def update_max_hp(self, user_id: str) -> None:
         """根据用户境界更新最大生命值"""
         user = self.get_user(user_id)
-        realm = user["realm"]
+        realm = user.realm
         
         # 从配置中获取该境界对应的最大生命值
         max_hp = self.config.health_limits.get(realm, 100)  # 默认100
         
         # 更新用户最大生命值
-        old_max_hp = user["stats"]["max_hp"]
-        user["stats"]["max_hp"] = max_hp
+        old_max_hp = user.stats.max_hp
+        user.stats.max_hp = max_hp
         
         # 如果最大生命值增加，当前生命值也相应增加
         if max_hp > old_max_hp:
             hp_increase = max_hp - old_max_hp
-            user["stats"]["hp"] += hp_increase
+            user.stats.hp += hp_increase
         
         # 确保当前生命值不超过最大生命值
-        user["stats"]["hp"] = min(user["stats"]["hp"], user["stats"]["max_hp"])
+        user.stats.hp = min(user.stats.hp, user.stats.max_hp)
         
         # 更新用户数据
         self.update_user(user_id, user)
     
+    @transactional
     def duel(self, user_id: str, target_id: str) -> Dict[str, Any]:
         """切磋功能"""
         user = self.get_user(user_id)
@@ -322,17 +790,11 @@ class XiuXianData:
         
         # 从配置中获取战斗公式参数
         duel_config = self.config.combat_formulas.get("duel", {})
-        power_calc = duel_config.get("power_calculation", {})
         win_chance_config = duel_config.get("win_chance", {})
         
-        # 获取战力计算参数
-        level_multiplier = power_calc.get("level_multiplier", 10)
-        attack_weight = power_calc.get("attack_weight", 1)
-        defense_weight = power_calc.get("defense_weight", 1)
-        
         # 计算战力（基于等级、装备和功法）
-        user_power = user["level"] * level_multiplier + user["stats"]["attack"] * attack_weight + user["stats"]["defense"] * defense_weight
-        target_power = target["level"] * level_multiplier + target["stats"]["attack"] * attack_weight + target["stats"]["defense"] * defense_weight
+        user_power = self.calculate_battle_power(user)
+        target_power = self.calculate_battle_power(target)
         
         # 获取胜率计算参数
         base_chance = win_chance_config.get("base_chance", 0.5)
@@ -354,7 +816,7 @@ class XiuXianData:
         loser_exp_divisor = duel_exp_config.get("loser_exp_divisor", 2)
         
         # 计算奖惩
-        exp_change = random.randint(exp_range[0], exp_range[1]) * max(user["level"], target["level"])
+        exp_change = random.randint(exp_range[0], exp_range[1]) * max(user.level, target.level)
         
         result = {
             "success": True,
@@ -366,17 +828,18 @@ class XiuXianData:
         if is_winner:
             # 胜者获得修为，败者损失修为
             self.add_exp(user_id, exp_change)
-            target["exp"] = max(0, target["exp"] - exp_change // 2)
+            target.exp = max(0, target.exp - exp_change // 2)
             result["message"] = f"切磋胜利！获得修为 {exp_change} 点！"
         else:
             # 败者损失修为，胜者获得修为
-            user["exp"] = max(0, user["exp"] - exp_change // 2)
+            user.exp = max(0, user.exp - exp_change // 2)
             self.add_exp(target_id, exp_change)
             result["message"] = f"切磋失败！损失修为 {exp_change // 2} 点！"
         
-        self._save_data()
+        self._mark_dirty(user_id, target_id)
         return result
     
+    @transactional
     def steal_spirit_stones(self, user_id: str, target_id: str) -> Dict[str, Any]:
         """偷取灵石功能"""
         user = self.get_user(user_id)
@@ -384,15 +847,15 @@ class XiuXianData:
         current_time = int(time.time())
         
         # 检查CD（600秒）
-        if current_time - user.get("last_steal_time", 0) < 600:
-            remaining = 600 - (current_time - user.get("last_steal_time", 0))
+        if current_time - user.last_steal_time < 600:
+            remaining = 600 - (current_time - user.last_steal_time)
             return {
                 "success": False,
                 "message": f"你的偷窃技能还在冷却中，需要等待 {remaining} 秒"
             }
         
         # 计算成功率（与修为等级相关）
-        success_rate = 0.3 + user["level"] / 100 * 0.4  # 30%-70%之间
+        success_rate = 0.3 + user.level / 100 * 0.4  # 30%-70%之间
         success_rate = min(0.7, success_rate)  # 限制最高70%
         
         # 决定是否成功
@@ -406,28 +869,29 @@ class XiuXianData:
         if is_success:
             # 计算可偷取的灵石数量（1%-20%，且不超过目标拥有量）
             steal_percent = random.uniform(0.01, 0.2)
-            steal_amount = int(target["spirit_stones"] * steal_percent)
-            steal_amount = min(steal_amount, target["spirit_stones"])
+            steal_amount = int(target.spirit_stones * steal_percent)
+            steal_amount = min(steal_amount, target.spirit_stones)
             
             # 转移灵石
-            user["spirit_stones"] += steal_amount
-            target["spirit_stones"] -= steal_amount
+            user.spirit_stones += steal_amount
+            target.spirit_stones -= steal_amount
             
             result["message"] = f"偷取成功！获得灵石 {steal_amount} 枚！"
         else:
             # 失败惩罚（损失100万灵石或全部灵石）
-            penalty = min(1000000, user["spirit_stones"])
-            user["spirit_stones"] -= penalty
+            penalty = min(1000000, user.spirit_stones)
+            user.spirit_stones -= penalty
             
             result["message"] = f"偷取失败！被发现并受到惩罚，损失灵石 {penalty} 枚！"
         
         # 更新最后偷窃时间
-        user["last_steal_time"] = current_time
+        user.last_steal_time = current_time
         
-        self._save_data()
+        self._mark_dirty(user_id, target_id)
         return result
     
     # ===== 秘境探索相关 =====
+    @transactional
     def adventure(self, user_id: str) -> Dict[str, Any]:
         """进行秘境探索，获取奖励"""
         user = self.get_user(user_id)
@@ -441,8 +905,8 @@ class XiuXianData:
         cooldown = 60 * 60 * random.randint(cooldown_hours[0], cooldown_hours[1])
         
         # 检查冷却时间
-        if current_time - user["last_adventure_time"] < cooldown:
-            remaining = cooldown - (current_time - user['last_adventure_time'])
+        if current_time - user.last_adventure_time < cooldown:
+            remaining = cooldown - (current_time - user.last_adventure_time)
             hours = remaining // 3600
             minutes = (remaining % 3600) // 60
             return {
@@ -451,7 +915,7 @@ class XiuXianData:
             }
         
         # 根据用户等级确定探索难度和奖励
-        level = user["level"]
+        level = user.level
         
         # 从配置中获取事件配置
         adventure_events = self.config.adventure_events
@@ -491,19 +955,19 @@ class XiuXianData:
             punishment = random.choice(punishment_events)
             
             # 损失灵石
-            lost_stones = min(user["spirit_stones"], random.randint(level * min_stones_multiplier, level * max_stones_multiplier))
-            user["spirit_stones"] -= lost_stones
+            lost_stones = min(user.spirit_stones, random.randint(level * min_stones_multiplier, level * max_stones_multiplier))
+            user.spirit_stones -= lost_stones
             
             # 可能损失一些修为
             exp_loss = random.randint(level * min_exp_multiplier, level * max_exp_multiplier)
-            user["exp"] = max(0, user["exp"] - exp_loss)
+            user.exp = max(0, user.exp - exp_loss)
             
             result["message"] = f"你在秘境中{punishment}，损失了 {lost_stones} 灵石和 {exp_loss} 点修为！"
             result["success"] = True
             result["is_punishment"] = True
             
             # 更新最后探险时间
-            user["last_adventure_time"] = current_time
+            user.last_adventure_time = current_time
             self.update_user(user_id, user)
             
             return result
@@ -520,7 +984,7 @@ class XiuXianData:
             # 发现宝物
             spirit_stones = random.randint(level * min_multiplier, level * max_multiplier)
             result["spirit_stones_gain"] = spirit_stones
-            user["spirit_stones"] += spirit_stones
+            user.spirit_stones += spirit_stones
             result["message"] = random.choice(treasure_messages).format(spirit_stones=spirit_stones)
             
         elif event_type == "herb":
@@ -531,7 +995,7 @@ class XiuXianData:
             
             # 发现灵草
             herb = random.choice(herbs)
-            user["items"].append(herb)
+            user.items.append(herb)
             result["rewards"].append(herb)
             result["message"] = random.choice(herb_messages).format(herb=herb)
             
@@ -557,7 +1021,7 @@ class XiuXianData:
                 
                 self.add_exp(user_id, exp_gain)
                 user = self.get_user(user_id)  # 重新获取用户数据，因为可能升级
-                user["spirit_stones"] += spirit_stones
+                user.spirit_stones += spirit_stones
                 
                 result["message"] = random.choice(win_messages).format(monster=monster, exp_gain=exp_gain, spirit_stones=spirit_stones)
             else:
@@ -594,11 +1058,11 @@ class XiuXianData:
             # 有小概率获得功法
             if random.random() < technique_chance:
                 techniques = ["吐纳术", "御风术", "小周天功", "金刚不坏", "五行遁法", "太极剑法"]
-                available_techniques = [t for t in techniques if t not in user["techniques"]]
+                available_techniques = [t for t in techniques if t not in user.techniques]
                 
                 if available_techniques:
                     new_technique = random.choice(available_techniques)
-                    user["techniques"].append(new_technique)
+                    user.techniques.append(new_technique)
                     result["rewards"].append(new_technique)
                     result["message"] = random.choice(technique_messages).format(opportunity=opportunity, exp_gain=exp_gain, technique=new_technique)
                 else:
@@ -607,18 +1071,19 @@ class XiuXianData:
                 result["message"] = random.choice(messages).format(opportunity=opportunity, exp_gain=exp_gain)
         
         # 更新最后探险时间
-        user["last_adventure_time"] = current_time
+        user.last_adventure_time = current_time
         self.update_user(user_id, user)
         
         return result
     
     # ===== 功法相关 =====
+    @transactional
     def learn_technique(self, user_id: str, technique_name: str) -> Dict[str, Any]:
         """学习功法"""
         user = self.get_user(user_id)
         
         # 检查是否已学习该功法
-        if technique_name in user["techniques"]:
+        if technique_name in user.techniques:
             return {
                 "success": False,
                 "message": f"你已经学会了 {technique_name}，不需要重复学习。"
@@ -637,22 +1102,22 @@ class XiuXianData:
         technique = techniques[technique_name]
         
         # 检查等级要求
-        if user["level"] < technique["level"]:
+        if user.level < technique["level"]:
             return {
                 "success": False,
                 "message": f"你的修为不足，需要达到 {technique['level']} 级才能学习 {technique_name}。"
             }
         
         # 检查灵石是否足够
-        if user["spirit_stones"] < technique["cost"]:
+        if user.spirit_stones < technique["cost"]:
             return {
                 "success": False,
                 "message": f"灵石不足，学习 {technique_name} 需要 {technique['cost']} 灵石。"
             }
         
         # 扣除灵石并学习功法
-        user["spirit_stones"] -= technique["cost"]
-        user["techniques"].append(technique_name)
+        user.spirit_stones -= technique["cost"]
+        user.techniques.append(technique_name)
         self.update_user(user_id, user)
         
         return {
@@ -670,11 +1135,11 @@ class XiuXianData:
         result = []
         for name, info in all_techniques.items():
             # 检查是否已学习
-            learned = name in user["techniques"]
+            learned = name in user.techniques
             # 检查等级是否满足
-            level_met = user["level"] >= info["level"]
+            level_met = user.level >= info["level"]
             # 检查灵石是否足够
-            stones_enough = user["spirit_stones"] >= info["cost"]
+            stones_enough = user.spirit_stones >= info["cost"]
             
             technique_info = {
                 "name": name,
@@ -700,11 +1165,11 @@ class XiuXianData:
         result = []
         for name, info in all_pills.items():
             # 检查等级是否满足
-            level_met = user["level"] >= info["level"]
+            level_met = user.level >= info["level"]
             # 检查灵石是否足够
-            stones_enough = user["spirit_stones"] >= info["cost"]
+            stones_enough = user.spirit_stones >= info["cost"]
             # 检查已拥有数量
-            owned = user["inventory"]["pills"].get(name, 0)
+            owned = user.inventory["pills"].get(name, 0)
             
             pill_info = {
                 "name": name,
@@ -719,6 +1184,7 @@ class XiuXianData:
         
         return result
     
+    @transactional
     def buy_pill(self, user_id: str, pill_name: str) -> Dict[str, Any]:
         """购买丹药"""
         user = self.get_user(user_id)
@@ -736,30 +1202,23 @@ class XiuXianData:
         pill = all_pills[pill_name]
         
         # 检查等级要求
-        if user["level"] < pill["level"]:
+        if user.level < pill["level"]:
             return {
                 "success": False,
                 "message": f"你的修为不足，需要达到 {pill['level']} 级才能购买 {pill_name}。"
             }
         
         # 检查灵石是否足够
-        if user["spirit_stones"] < pill["cost"]:
+        if user.spirit_stones < pill["cost"]:
             return {
                 "success": False,
                 "message": f"灵石不足，购买 {pill_name} 需要 {pill['cost']} 灵石。"
             }
         
         # 扣除灵石并添加丹药到物品栏
-        user["spirit_stones"] -= pill["cost"]
-        
-        # 确保物品栏中有丹药分类
-        if "pills" not in user["inventory"]:
-            user["inventory"]["pills"] = {}
-        
-        # 添加丹药到物品栏
-        if pill_name not in user["inventory"]["pills"]:
-            user["inventory"]["pills"][pill_name] = 0
-        user["inventory"]["pills"][pill_name] += 1
+        user.spirit_stones -= pill["cost"]
+        pills = user.inventory["pills"]
+        pills[pill_name] = pills.get(pill_name, 0) + 1
         
         self.update_user(user_id, user)
         
@@ -768,6 +1227,7 @@ class XiuXianData:
             "message": f"成功购买了 {pill_name}！"
         }
     
+    @transactional
     def use_pill(self, user_id: str, pill_name: str) -> Dict[str, Any]:
         """使用丹药"""
         user = self.get_user(user_id)
@@ -783,7 +1243,7 @@ class XiuXianData:
             }
         
         # 检查用户是否拥有该丹药
-        if "pills" not in user["inventory"] or pill_name not in user["inventory"]["pills"] or user["inventory"]["pills"][pill_name] <= 0:
+        if user.inventory["pills"].get(pill_name, 0) <= 0:
             return {
                 "success": False,
                 "message": f"你没有 {pill_name}，请先购买。"
@@ -793,7 +1253,7 @@ class XiuXianData:
         pill = all_pills[pill_name]
         
         # 从库存中移除丹药
-        user["inventory"]["pills"][pill_name] -= 1
+        user.inventory["pills"][pill_name] -= 1
         
         # 应用丹药效果
         exp_gain = pill["effect"]["exp"]
@@ -801,7 +1261,7 @@ class XiuXianData:
         
         # 如果丹药有突破加成，应用到用户身上
         if "breakthrough_bonus" in pill:
-            user["breakthrough_bonus"] = pill["breakthrough_bonus"]
+            user.breakthrough_bonus = pill["breakthrough_bonus"]
             message += f"\n丹药效果：下次突破成功率提升 {int(pill['breakthrough_bonus'] * 100)}%。"
         
         # 增加修为并检查是否升级
@@ -812,7 +1272,7 @@ class XiuXianData:
         
         # 如果升级了，添加升级信息
         if level_up_info["leveled_up"]:
-            message += f"\n恭喜！你的修为提升到了 {user['level']} 级，境界晋升为 {user['realm']}！"
+            message += f"\n恭喜！你的修为提升到了 {user.level} 级，境界晋升为 {user.realm}！"
         
         return {
             "success": True,
@@ -820,6 +1280,7 @@ class XiuXianData:
         }
     
     # ===== 挖矿相关 =====
+    @transactional
     def mine_spirit_stones(self, user_id: str) -> Dict[str, Any]:
         """挖矿获取灵石"""
         user = self.get_user(user_id)
@@ -860,8 +1321,8 @@ class XiuXianData:
         cooldown = 60 * 60 * random.randint(cooldown_hours[0], cooldown_hours[1])
         
         # 检查冷却时间
-        if current_time - user["last_mine_time"] < cooldown:
-            remaining = cooldown - (current_time - user['last_mine_time'])
+        if current_time - user.last_mine_time < cooldown:
+            remaining = cooldown - (current_time - user.last_mine_time)
             hours = remaining // 3600
             minutes = (remaining % 3600) // 60
             return {
@@ -876,11 +1337,11 @@ class XiuXianData:
             punishment = random.choice(punishment_events)
             
             # 损失灵石
-            lost_stones = min(user["spirit_stones"], random.randint(user["level"] * min_loss_multiplier, user["level"] * max_loss_multiplier))
-            user["spirit_stones"] -= lost_stones
+            lost_stones = min(user.spirit_stones, random.randint(user.level * min_loss_multiplier, user.level * max_loss_multiplier))
+            user.spirit_stones -= lost_stones
             
             # 更新用户数据
-            user["last_mine_time"] = current_time
+            user.last_mine_time = current_time
             self.update_user(user_id, user)
             
             return {
@@ -891,7 +1352,7 @@ class XiuXianData:
             }
         
         # 根据等级确定基础挖矿收益
-        level_bonus = user["level"] * level_multiplier
+        level_bonus = user.level * level_multiplier
         
         # 随机波动
         stones = base_stones + level_bonus + random.randint(random_range[0], random_range[1])
@@ -906,8 +1367,8 @@ class XiuXianData:
             message = random.choice(success_messages).format(stones=stones)
         
         # 更新用户数据
-        user["spirit_stones"] += stones
-        user["last_mine_time"] = current_time
+        user.spirit_stones += stones
+        user.last_mine_time = current_time
         self.update_user(user_id, user)
         
         return {
@@ -917,6 +1378,7 @@ class XiuXianData:
         }
     
     # ===== 每日签到 =====
+    @transactional
     def daily_sign(self, user_id: str) -> Dict[str, Any]:
         """每日签到获取奖励"""
         user = self.get_user(user_id)
@@ -927,7 +1389,7 @@ class XiuXianData:
         today_timestamp = int(today.timestamp())
         
         # 检查是否已经签到
-        if user["last_daily_time"] >= today_timestamp:
+        if user.last_daily_time >= today_timestamp:
             return {
                 "success": False,
                 "message": "你今天已经签到过了，请明天再来！"
@@ -937,15 +1399,12 @@ class XiuXianData:
         yesterday = today - timedelta(days=1)
         yesterday_timestamp = int(yesterday.timestamp())
         
-        if user["last_daily_time"] >= yesterday_timestamp:
+        if user.last_daily_time >= yesterday_timestamp:
             # 连续签到
-            if "daily_streak" not in user:
-                user["daily_streak"] = 1
-            else:
-                user["daily_streak"] += 1
+            user.daily_streak += 1
         else:
             # 断签，重置连续签到
-            user["daily_streak"] = 1
+            user.daily_streak = 1
         
         # 从配置中获取每日签到奖励参数
         daily_sign_config = self.config.game_values.get("daily_sign", {})
@@ -955,15 +1414,15 @@ class XiuXianData:
         exp_multiplier = daily_sign_config.get("exp_multiplier", 5)
         
         # 根据连续签到天数给予奖励
-        streak = user["daily_streak"]
+        streak = user.daily_streak
         streak_bonus = min(streak * streak_bonus_per_day, max_streak_bonus)  # 最多额外奖励由配置决定
         
         stones = base_stones + streak_bonus
-        exp = user["level"] * exp_multiplier  # 修为奖励与等级相关，倍率由配置决定
+        exp = user.level * exp_multiplier  # 修为奖励与等级相关，倍率由配置决定
         
         # 更新用户数据
-        user["spirit_stones"] += stones
-        user["last_daily_time"] = current_time
+        user.spirit_stones += stones
+        user.last_daily_time = current_time
         self.update_user(user_id, user)
         self.add_exp(user_id, exp)
         
@@ -984,8 +1443,9 @@ class XiuXianData:
     def get_user_equipment(self, user_id: str) -> Dict[str, Any]:
         """获取用户当前装备信息"""
         user = self.get_user(user_id)
-        return user["equipment"]
+        return user.equipment
     
+    @transactional
     def buy_equipment(self, user_id: str, equipment_type: str, equipment_id: str) -> Dict[str, Any]:
         """购买装备"""
         user = self.get_user(user_id)
@@ -1012,25 +1472,25 @@ class XiuXianData:
             }
         
         # 检查等级要求
-        if user["level"] < equipment["level"]:
+        if user.level < equipment["level"]:
             return {
                 "success": False,
                 "message": f"你的修为不足，需要达到 {equipment['level']} 级才能使用 {equipment['name']}"
             }
         
         # 检查灵石是否足够
-        if user["spirit_stones"] < equipment["cost"]:
+        if user.spirit_stones < equipment["cost"]:
             return {
                 "success": False,
                 "message": f"灵石不足，购买 {equipment['name']} 需要 {equipment['cost']} 灵石"
             }
         
         # 扣除灵石并装备
-        user["spirit_stones"] -= equipment["cost"]
+        user.spirit_stones -= equipment["cost"]
         
         # 更新装备和属性
-        old_equipment = user["equipment"][equipment_type]
-        user["equipment"][equipment_type] = equipment["id"]
+        old_equipment = user.equipment[equipment_type]
+        user.equipment[equipment_type] = equipment["id"]
         
         # 更新用户属性
         if equipment_type == "weapon":
@@ -1038,32 +1498,32 @@ class XiuXianData:
             if old_equipment:
                 for old_item in all_equipment["weapon"]:
                     if old_item["id"] == old_equipment:
-                        user["stats"]["attack"] -= old_item["attack"]
+                        user.stats.attack -= old_item["attack"]
                         break
             # 添加新武器属性
-            user["stats"]["attack"] += equipment["attack"]
+            user.stats.attack += equipment["attack"]
         
         elif equipment_type == "armor":
             # 移除旧护甲属性
             if old_equipment:
                 for old_item in all_equipment["armor"]:
                     if old_item["id"] == old_equipment:
-                        user["stats"]["defense"] -= old_item["defense"]
+                        user.stats.defense -= old_item["defense"]
                         break
             # 添加新护甲属性
-            user["stats"]["defense"] += equipment["defense"]
+            user.stats.defense += equipment["defense"]
         
         elif equipment_type == "accessory":
             # 移除旧饰品属性
             if old_equipment:
                 for old_item in all_equipment["accessory"]:
                     if old_item["id"] == old_equipment:
-                        user["stats"]["max_hp"] -= old_item["hp"]
-                        user["stats"]["hp"] = min(user["stats"]["hp"], user["stats"]["max_hp"])
+                        user.stats.max_hp -= old_item["hp"]
+                        user.stats.hp = min(user.stats.hp, user.stats.max_hp)
                         break
             # 添加新饰品属性
-            user["stats"]["max_hp"] += equipment["hp"]
-            user["stats"]["hp"] += equipment["hp"]  # 装备新饰品时恢复对应的生命值
+            user.stats.max_hp += equipment["hp"]
+            user.stats.hp += equipment["hp"]  # 装备新饰品时恢复对应的生命值
         
         self.update_user(user_id, user)
         
@@ -1082,11 +1542,11 @@ class XiuXianData:
             result[equip_type] = []
             for item in items:
                 # 检查等级是否满足
-                level_met = user["level"] >= item["level"]
+                level_met = user.level >= item["level"]
                 # 检查灵石是否足够
-                stones_enough = user["spirit_stones"] >= item["cost"]
+                stones_enough = user.spirit_stones >= item["cost"]
                 # 检查是否已装备
-                equipped = user["equipment"][equip_type] == item["id"]
+                equipped = user.equipment[equip_type] == item["id"]
                 
                 item_info = item.copy()
                 item_info["level_met"] = level_met
@@ -1099,6 +1559,7 @@ class XiuXianData:
         return result
     
     # ===== 状态系统相关 =====
+    @transactional
     def set_status(self, user_id: str, status_type: str, duration_hours: float = 0) -> Dict[str, Any]:
         """设置用户状态
         
@@ -1115,13 +1576,13 @@ class XiuXianData:
         current_time = int(time.time())
         
         # 检查是否已有状态
-        if user["status"] is not None and current_time < user["status_end_time"]:
-            remaining = user["status_end_time"] - current_time
+        if user.status is not None and current_time < user.status_end_time:
+            remaining = user.status_end_time - current_time
             # 使用工具类格式化剩余时间
             time_str = XiuXianUtils.format_time_remaining(remaining)
             return {
                 "success": False,
-                "message": f"你当前正处于{user['status']}状态，还需 {time_str} 结束"
+                "message": f"你当前正处于{user.status}状态，还需 {time_str} 结束"
             }
         
         # 根据状态类型获取对应的活动类型配置
@@ -1152,21 +1613,27 @@ class XiuXianData:
         reward_multiplier = 0 if status_type == "修炼中" else duration_hours
         
         # 设置状态
-        user["status"] = status_type
-        user["status_start_time"] = current_time
-        user["status_end_time"] = current_time + duration_seconds
-        user["status_duration"] = duration_hours
-        user["status_reward_multiplier"] = reward_multiplier
+        user.status = status_type
+        user.status_start_time = current_time
+        user.status_end_time = current_time + duration_seconds
+        user.status_duration = duration_hours
+        user.status_reward_multiplier = reward_multiplier
+        
+        # 被替换的旧状态不再结算；定时状态分配新的结算ID并加入结算队列
+        self._retire_status_job(user)
+        if status_type != "修炼中":
+            user.status_id = uuid.uuid4().hex
+            self.status_jobs.enqueue(user.status_id, user_id, user.status_end_time)
         
         self.update_user(user_id, user)
         
-        logger.info(f"用户 ({user_id}) 进入了 {status_type} 状态，开始时间：{current_time}，结束时间：{user['status_end_time']}")
+        logger.info(f"用户 ({user_id}) 进入了 {status_type} 状态，开始时间：{current_time}，结束时间：{user.status_end_time}")
         
         return {
             "success": True,
             "status": status_type,
             "duration": duration_hours,
-            "end_time": user["status_end_time"],
+            "end_time": user.status_end_time,
             "message": f"你已进入{status_type}状态，{end_time_message}"
         }
     
@@ -1176,82 +1643,96 @@ class XiuXianData:
         current_time = int(time.time())
         
         # 如果没有状态
-        if user["status"] is None:
+        if user.status is None:
             return {
                 "has_status": False,
                 "message": "你当前没有进行中的状态"
             }
             
         # 如果状态已结束，自动完成状态并返回无状态
-        if current_time >= user["status_end_time"]:
+        if current_time >= user.status_end_time:
             # 记录日志但不处理奖励，让complete_status处理
-            logger.info(f"用户 ({user_id}) 的{user['status']}状态已结束，等待领取奖励")
+            logger.info(f"用户 ({user_id}) 的{user.status}状态已结束，等待领取奖励")
             return {
                 "has_status": False,
                 "status_completed": True,
-                "message": f"你的{user['status']}已经结束，可以领取奖励了"
+                "message": f"你的{user.status}已经结束，可以领取奖励了"
             }
         
         # 计算剩余时间
-        remaining = user["status_end_time"] - current_time
+        remaining = user.status_end_time - current_time
         
         # 使用工具类格式化剩余时间
         time_str = XiuXianUtils.format_time_remaining(remaining)
         
         return {
             "has_status": True,
-            "status": user["status"],
+            "status": user.status,
             "remaining": remaining,
-            "message": f"你当前正处于{user['status']}状态，还需 {time_str} 结束" if user["status"]!="修炼中" else f"你当前正处于{user['status']}状态"
+            "message": f"你当前正处于{user.status}状态，还需 {time_str} 结束" if user.status!="修炼中" else f"你当前正处于{user.status}状态"
         }
     
-    def complete_status(self, user_id: str) -> Dict[str, Any]:
-        """完成状态并获取奖励"""
+    @transactional
+    def complete_status(self, user_id: str, status_id: Optional[str] = None) -> Dict[str, Any]:
+        """完成状态并获取奖励
+        
+        Args:
+            user_id: 用户ID
+            status_id: 结算队列中的结算ID，指定时只结算该状态，状态已结算或被替换时直接确认出队
+        """
         user = self.get_user(user_id)
         current_time = int(time.time())
         
+        if status_id is not None and (user.status is None or user.status_id != status_id):
+            self.status_jobs.ack(status_id)
+            return {
+                "success": False,
+                "message": "该状态已经结算"
+            }
+        
         # 如果没有状态
-        if user["status"] is None:
+        if user.status is None:
             return {
                 "success": False,
                 "message": "你当前没有进行中的状态"
             }
         
         # 如果是修炼状态，允许随时结束并获得奖励
-        if user["status"] == "修炼中":
+        if user.status == "修炼中":
             # 计算实际修炼时长（小时）
-            actual_duration = (current_time - user["status_start_time"]) / 3600
+            actual_duration = (current_time - user.status_start_time) / 3600
             # 确保至少有一定的修炼时间（至少5分钟）
             if actual_duration < 5/60:
                 # 更新修炼状态
-                user["status"] = None
-                user["status_start_time"] = None
-                user["status_end_time"] = None
-                user["status_duration"] = None
-                user["status_reward_multiplier"] = None
+                user.status = None
+                user.status_start_time = None
+                user.status_end_time = None
+                user.status_duration = None
+                user.status_reward_multiplier = None
+                self._retire_status_job(user)
                 self.update_user(user_id, user)
                 return {
                     "success": False,
                     "message": "修炼时间太短，无法获得有效修为，请至少修炼5分钟"
                 }
             # 更新奖励倍数
-            user["status_reward_multiplier"] = actual_duration
+            user.status_reward_multiplier = actual_duration
             # 更新实际修炼时长
-            user["status_duration"] = actual_duration
+            user.status_duration = actual_duration
             self.update_user(user_id, user)
         # 对于其他状态，如果未结束则不能完成
-        elif current_time < user["status_end_time"]:
-            logger.info(f"current_time: {current_time}, user['status_end_time']: {user['status_end_time']}")
-            remaining = user["status_end_time"] - current_time
+        elif current_time < user.status_end_time:
+            logger.info(f"current_time: {current_time}, user.status_end_time: {user.status_end_time}")
+            remaining = user.status_end_time - current_time
             # 使用工具类格式化剩余时间
             time_str = XiuXianUtils.format_time_remaining(remaining)
             return {
                 "success": False,
-                "message": f"你的{user['status']}尚未完成，还需 {time_str}"
+                "message": f"你的{user.status}尚未完成，还需 {time_str}"
             }
         
-        status_type = user["status"]
-        multiplier = user["status_reward_multiplier"]
+        status_type = user.status
+        multiplier = user.status_reward_multiplier
         result = {
             "success": True,
             "status_type": status_type,
@@ -1264,7 +1745,7 @@ class XiuXianData:
             practice_config = self.config.game_values.get("practice", {})
             base_exp_per_hour = practice_config.get("base_exp_per_hour", 10)
             # 根据修炼时长计算实际经验
-            actual_exp = int(base_exp_per_hour * user["status_duration"])
+            actual_exp = int(base_exp_per_hour * user.status_duration)
             level_multiplier = practice_config.get("level_multiplier", 2)
             random_bonus_range = practice_config.get("random_bonus_range", [-5, 10])
             critical_chance = practice_config.get("critical_chance", 0.1)
@@ -1273,7 +1754,7 @@ class XiuXianData:
             # 使用工具类计算奖励
             reward_result = XiuXianUtils.calculate_reward(
                 base_value=actual_exp,
-                level=user["level"],
+                level=user.level,
                 multiplier=multiplier,
                 level_factor=level_multiplier,
                 random_range=random_bonus_range,
@@ -1294,7 +1775,7 @@ class XiuXianData:
             result["leveled_up"] = level_up_info["leveled_up"]
             
             if level_up_info["leveled_up"]:
-                result["message"] = f"闭关修炼结束，获得 {exp_gain} 点修为！\n境界提升：{level_up_info['old_realm']} → {user['realm']}\n等级提升：{level_up_info['old_level']} → {user['level']}"
+                result["message"] = f"闭关修炼结束，获得 {exp_gain} 点修为！\n境界提升：{level_up_info['old_realm']} → {user.realm}\n等级提升：{level_up_info['old_level']} → {user.level}"
             else:
                 if is_critical:
                     result["message"] = f"闭关修炼结束，顿悟成功！获得 {exp_gain} 点修为！"
@@ -1330,12 +1811,12 @@ class XiuXianData:
                 punishment = random.choice(punishment_events)
                 
                 # 损失灵石
-                lost_stones = min(user["spirit_stones"], random.randint(user["level"] * min_stones_multiplier, user["level"] * max_stones_multiplier))
-                user["spirit_stones"] -= lost_stones
+                lost_stones = min(user.spirit_stones, random.randint(user.level * min_stones_multiplier, user.level * max_stones_multiplier))
+                user.spirit_stones -= lost_stones
                 
                 # 可能损失一些修为
-                exp_loss = random.randint(user["level"] * min_exp_multiplier, user["level"] * max_exp_multiplier)
-                user["exp"] = max(0, user["exp"] - exp_loss)
+                exp_loss = random.randint(user.level * min_exp_multiplier, user.level * max_exp_multiplier)
+                user.exp = max(0, user.exp - exp_loss)
                 
                 result["is_punishment"] = True
                 result["spirit_stones_loss"] = lost_stones
@@ -1354,8 +1835,8 @@ class XiuXianData:
                     treasure_messages = treasure_config.get("messages", ["你在秘境中发现了一处宝藏，获得了 {spirit_stones} 灵石！"])
                     
                     # 发现宝物
-                    spirit_stones = int(random.randint(user["level"] * min_multiplier, user["level"] * max_multiplier) * multiplier)
-                    user["spirit_stones"] += spirit_stones
+                    spirit_stones = int(random.randint(user.level * min_multiplier, user.level * max_multiplier) * multiplier)
+                    user.spirit_stones += spirit_stones
                     result["spirit_stones_gain"] = spirit_stones
                     result["message"] = random.choice(treasure_messages).format(spirit_stones=spirit_stones)
                 
@@ -1370,7 +1851,7 @@ class XiuXianData:
                     found_herbs = random.sample(herbs, min(herb_count, len(herbs)))
                     
                     for herb in found_herbs:
-                        user["items"].append(herb)
+                        user.items.append(herb)
                     
                     result["rewards"] = found_herbs
                     result["message"] = f"长时间的秘境探索中发现了珍贵的草药：{', '.join(found_herbs)}！"
@@ -1406,8 +1887,8 @@ class XiuXianData:
                     monster = random.choice(monster_names)
                     
                     # 简单战斗逻辑
-                    monster_level = random.randint(max(1, user["level"] + min_level_diff), user["level"] + max_level_diff)
-                    win_chance = base_chance + (user["level"] - monster_level) * level_diff_multiplier
+                    monster_level = random.randint(max(1, user.level + min_level_diff), user.level + max_level_diff)
+                    win_chance = base_chance + (user.level - monster_level) * level_diff_multiplier
                     win_chance = max(min_chance, min(max_chance, win_chance))  # 胜率限制
                     
                     if random.random() < win_chance:
@@ -1417,7 +1898,7 @@ class XiuXianData:
                         
                         self.add_exp(user_id, exp_gain)
                         user = self.get_user(user_id)  # 重新获取用户数据，因为可能升级
-                        user["spirit_stones"] += spirit_stones
+                        user.spirit_stones += spirit_stones
                         
                         result["exp_gain"] = exp_gain
                         result["spirit_stones_gain"] = spirit_stones
@@ -1444,7 +1925,7 @@ class XiuXianData:
                     opportunity = random.choice(opportunities)
                     
                     # 获取修为值
-                    exp_gain = int(user["level"] * random.randint(10, 20) * multiplier)
+                    exp_gain = int(user.level * random.randint(10, 20) * multiplier)
                     self.add_exp(user_id, exp_gain)
                     
                     # 有小概率获得功法
@@ -1453,11 +1934,11 @@ class XiuXianData:
                         # 从商店配置中获取可用功法
                         available_techniques = list(self.config.shop_items.get("techniques", {}).keys())
                         # 过滤掉已学习的功法
-                        available_techniques = [t for t in available_techniques if t not in user["techniques"]]
+                        available_techniques = [t for t in available_techniques if t not in user.techniques]
                         
                         if available_techniques:
                             new_technique = random.choice(available_techniques)
-                            user["techniques"].append(new_technique)
+                            user.techniques.append(new_technique)
                             result["rewards"].append(new_technique)
                             result["message"] = f"长时间的秘境探索中{opportunity}，顿时感悟颇深！\n获得了 {exp_gain} 点修为，并习得了 {new_technique}！"
                         else:
@@ -1470,7 +1951,7 @@ class XiuXianData:
             mining_config = self.config.game_values.get("mining", {})
             base_stones = int(mining_config.get("base_stones", 10) * multiplier)
             level_multiplier = mining_config.get("level_multiplier", 2)
-            level_bonus = int(user["level"] * level_multiplier * multiplier)
+            level_bonus = int(user.level * level_multiplier * multiplier)
             random_range = mining_config.get("random_range", [-5, 10])
             min_stones = int(mining_config.get("min_stones", 5) * multiplier)
             critical_chance = mining_config.get("critical_chance", 0.1) * multiplier
@@ -1493,15 +1974,16 @@ class XiuXianData:
             else:
                 result["message"] = random.choice(success_messages).format(stones=stones)
             
-            user["spirit_stones"] += stones
+            user.spirit_stones += stones
             result["spirit_stones_gain"] = stones
         
         # 清除状态
-        user["status"] = None
-        user["status_end_time"] = 0
-        user["status_start_time"] = 0
-        user["status_duration"] = 0
-        user["status_reward_multiplier"] = 0
+        user.status = None
+        user.status_end_time = 0
+        user.status_start_time = 0
+        user.status_duration = 0
+        user.status_reward_multiplier = 0
+        self._retire_status_job(user)
         
         # 更新用户数据
         self.update_user(user_id, user)